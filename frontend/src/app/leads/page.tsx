@@ -1,6 +1,6 @@
 "use client";
 
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { Plus, Search, Phone, MoreHorizontal } from "lucide-react";
 
 interface Lead {
@@ -9,23 +9,95 @@ interface Lead {
     phone: string;
     status: string;
     notes: string;
+    // Latest note saved by the AI during a call (live feed only)
+    last_note?: string;
 }
 
+interface LiveCall {
+    call_sid: string;
+    lead_id: number | null;
+    started_at: number;
+    state?: "started" | "ended";
+}
+
+interface LeadPage {
+    items: Lead[];
+    next_cursor: string | null;
+}
+
+const PAGE_SIZE = 50;
+const LEAD_FIELDS = "id,name,phone,status,notes";
+const API_URL = "http://localhost:6060";
+
 export default function LeadsPage() {
     const [leads, setLeads] = useState<Lead[]>([]);
     const [loading, setLoading] = useState(true);
+    const [query, setQuery] = useState("");
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
+    // call_sid -> call in progress
+    const [calls, setCalls] = useState<Record<string, LiveCall>>({});
+    const [live, setLive] = useState(false);
+    const queryRef = useRef(query);
 
     useEffect(() => {
-        fetchLeads();
+        queryRef.current = query;
+        // Debounce typing so search runs server-side once per pause
+        const timer = setTimeout(() => fetchLeads(query), 250);
+        return () => clearTimeout(timer);
+    }, [query]);
+
+    useEffect(() => {
+        // Server-sent change events: patch the loaded rows instead of refetching the list
+        const source = new EventSource(`${API_URL}/live`);
+        source.onopen = () => setLive(true);
+        source.onerror = () => setLive(false);
+        source.addEventListener("lead", (e) => {
+            const patch: Partial<Lead> & { id: number } = JSON.parse((e as MessageEvent).data);
+            setLeads((prev) => {
+                const index = prev.findIndex((lead) => lead.id === patch.id);
+                if (index >= 0) {
+                    const next = prev.slice();
+                    next[index] = { ...prev[index], ...patch };
+                    return next;
+                }
+                // A new lead goes on top of the unfiltered (newest first) list
+                if (!queryRef.current.trim() && patch.name && patch.phone) {
+                    return [patch as Lead, ...prev];
+                }
+                return prev;
+            });
+        });
+        source.addEventListener("call", (e) => {
+            const call: LiveCall = JSON.parse((e as MessageEvent).data);
+            setCalls((prev) => {
+                const next = { ...prev };
+                if (call.state === "ended") delete next[call.call_sid];
+                else next[call.call_sid] = call;
+                return next;
+            });
+        });
+        source.addEventListener("snapshot", (e) => {
+            const snapshot: { calls: LiveCall[] } = JSON.parse((e as MessageEvent).data);
+            setCalls(Object.fromEntries(snapshot.calls.map((call) => [call.call_sid, call])));
+        });
+        // Bulk import, or we fell too far behind: reload the list
+        source.addEventListener("resync", () => fetchLeads(queryRef.current));
+        return () => source.close();
     }, []);
 
-    const fetchLeads = async () => {
+    const leadsOnCall = new Set(Object.values(calls).map((call) => call.lead_id));
+
+    const fetchLeads = async (search: string, cursor?: string) => {
         try {
+            const params = new URLSearchParams({ limit: String(PAGE_SIZE), fields: LEAD_FIELDS });
+            if (search.trim()) params.set("q", search.trim());
+            if (cursor) params.set("cursor", cursor);
             // Use the correct port 6060
-            const res = await fetch("http://localhost:6060/leads");
+            const res = await fetch(`${API_URL}/leads?${params}`);
             if (res.ok) {
-                const data = await res.json();
-                setLeads(data);
+                const data: LeadPage = await res.json();
+                setLeads((prev) => (cursor ? [...prev, ...data.items] : data.items));
+                setNextCursor(data.next_cursor);
             }
         } catch (err) {
             console.error("Failed to fetch leads", err);
@@ -37,7 +109,7 @@ export default function LeadsPage() {
     const handleCall = async (phone: string, id: number) => {
         // Trigger outbound call via API
         try {
-            await fetch(`http://localhost:6060/make-call?to=${phone}&lead_id=${id}`, { method: 'POST' });
+            await fetch(`${API_URL}/make-call?to=${phone}&lead_id=${id}`, { method: 'POST' });
             alert(`Calling ${phone}...`);
         } catch (e) {
             alert("Failed to initiate call");
@@ -51,6 +123,10 @@ export default function LeadsPage() {
                     <h1 className="text-2xl font-bold tracking-tight text-slate-900">Lead Management</h1>
                     <p className="mt-1 text-slate-500">View and manage your potential customers.</p>
                 </div>
+                <div className="flex items-center space-x-2 text-sm text-slate-500">
+                    <span className={`h-2 w-2 rounded-full ${live ? "bg-green-500" : "bg-slate-300"}`} />
+                    <span>{Object.keys(calls).length} live {Object.keys(calls).length === 1 ? "call" : "calls"}</span>
+                </div>
                 <button className="flex items-center space-x-2 rounded-lg bg-blue-600 px-4 py-2 font-medium text-white hover:bg-blue-700 transition-colors shadow-sm">
                     <Plus className="h-5 w-5" />
                     <span>Add Lead</span>
@@ -62,6 +138,8 @@ export default function LeadsPage() {
                 <input
                     type="text"
                     placeholder="Search leads..."
+                    value={query}
+                    onChange={(e) => setQuery(e.target.value)}
                     className="w-full bg-transparent text-slate-900 placeholder-slate-400 outline-none"
                 />
             </div>
@@ -87,12 +165,20 @@ export default function LeadsPage() {
                                 <tr key={lead.id} className="hover:bg-slate-50 transition-colors">
                                     <td className="p-4 font-medium text-slate-900">{lead.name}</td>
                                     <td className="p-4 font-mono text-sm text-slate-500">{lead.phone}</td>
-                                    <td className="p-4">
+                                    <td className="p-4 space-x-2">
                                         <span className="inline-flex rounded-full bg-blue-50 px-2.5 py-1 text-xs font-medium text-blue-700">
                                             {lead.status}
                                         </span>
+                                        {leadsOnCall.has(lead.id) && (
+                                            <span className="inline-flex rounded-full bg-green-50 px-2.5 py-1 text-xs font-medium text-green-700">
+                                                On call
+                                            </span>
+                                        )}
+                                    </td>
+                                    <td className="p-4 text-slate-500 truncate max-w-xs">
+                                        {lead.notes}
+                                        {lead.last_note && <p className="truncate text-xs italic text-slate-400">AI: {lead.last_note}</p>}
                                     </td>
-                                    <td className="p-4 text-slate-500 truncate max-w-xs">{lead.notes}</td>
                                     <td className="p-4 text-right">
                                         <div className="flex items-center justify-end space-x-2">
                                             <button
@@ -112,6 +198,16 @@ export default function LeadsPage() {
                         )}
                     </tbody>
                 </table>
+                {nextCursor && (
+                    <div className="border-t border-slate-100 p-4 text-center">
+                        <button
+                            onClick={() => fetchLeads(query, nextCursor)}
+                            className="rounded-lg px-4 py-2 text-sm font-medium text-blue-600 hover:bg-blue-50 transition-colors"
+                        >
+                            Load more
+                        </button>
+                    </div>
+                )}
             </div>
         </div>
     );
@@ -0,0 +1,139 @@
+import os
+import time
+import contextlib
+
+from call_registry import WORKER_MAX_CALLS
+
+# Admission control for new calls.
+# Every call on a worker shares one event loop, so past some load they all
+# degrade together (late frames, choppy audio, slow tools). The controller
+# watches three signals: live media sessions (plus calls just admitted whose
+# stream hasn't connected yet), event-loop lag (smoothed) and the average
+# outbound playback queue per session. When any of them crosses its limit
+# the worker sheds load: /make-call answers 503 with Retry-After,
+# /incoming-call plays the fallback TwiML instead of opening a stream, the
+# dialer pauses, and the call registry advertises no capacity for this
+# worker. It resumes once every signal is back under ADMISSION_RESUME_RATIO
+# of its limit, so it doesn't flap at the threshold.
+
+ADMISSION_MAX_SESSIONS = int(os.getenv("ADMISSION_MAX_SESSIONS", WORKER_MAX_CALLS))
+ADMISSION_MAX_LOOP_LAG_MS = float(os.getenv("ADMISSION_MAX_LOOP_LAG_MS", 50))
+# Average frames (20ms each) waiting in a session's outbound pacer
+ADMISSION_MAX_SEND_QUEUE_FRAMES = float(os.getenv("ADMISSION_MAX_SEND_QUEUE_FRAMES", 750))
+ADMISSION_RESUME_RATIO = float(os.getenv("ADMISSION_RESUME_RATIO", 0.8))
+# Retry-After given to rejected /make-call requests
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", 30))
+# An admitted call holds a session slot this long while its stream connects
+ADMISSION_RESERVE_SECONDS = float(os.getenv("ADMISSION_RESERVE_SECONDS", 10))
+# Weight of each new loop lag sample in the moving average
+ADMISSION_LAG_SMOOTHING = float(os.getenv("ADMISSION_LAG_SMOOTHING", 0.2))
+# What a shed inbound call hears: "message" (apology + hangup) or "voicemail" (records a message)
+ADMISSION_FALLBACK = os.getenv("ADMISSION_FALLBACK", "message")
+# File a voicemail from a caller not in the CRM as a new lead (otherwise it is logged without one)
+ADMISSION_VOICEMAIL_LEADS = os.getenv("ADMISSION_VOICEMAIL_LEADS", "true").lower() in ("1", "true", "yes")
+
+
+class AdmissionController:
+    def __init__(self, max_sessions: int = ADMISSION_MAX_SESSIONS, max_loop_lag_ms: float = ADMISSION_MAX_LOOP_LAG_MS,
+                 max_send_queue: float = ADMISSION_MAX_SEND_QUEUE_FRAMES, resume_ratio: float = ADMISSION_RESUME_RATIO):
+        self.max_sessions = max_sessions
+        self.max_loop_lag = max_loop_lag_ms / 1000
+        self.max_send_queue = max_send_queue
+        self.resume_ratio = resume_ratio
+        # call_sid -> OutboundPacer of each live media stream
+        self.sessions = {}
+        # call_sid -> deadline for admitted calls whose stream hasn't started
+        self.reserved = {}
+        self.loop_lag = 0.0
+        self.shedding = False
+        self.reasons = []
+        self.shed_since = None
+        self.stats = {"admitted": 0, "rejected_make_call": 0, "rejected_incoming_call": 0}
+
+    # Signals
+
+    def observe_lag(self, lag: float):
+        """Loop lag sample from metrics.monitor_loop_lag; also re-evaluates the state."""
+        self.loop_lag += ADMISSION_LAG_SMOOTHING * (lag - self.loop_lag)
+        self.evaluate()
+
+    def active_sessions(self) -> int:
+        now = time.monotonic()
+        for sid in [sid for sid, deadline in self.reserved.items() if deadline < now]:
+            del self.reserved[sid]
+        return len(self.sessions) + len(self.reserved)
+
+    def send_queue(self) -> float:
+        """Average outbound frames queued per live session."""
+        if not self.sessions:
+            return 0.0
+        return sum(pacer.depth for pacer in self.sessions.values()) / len(self.sessions)
+
+    def evaluate(self) -> bool:
+        """Updates and returns whether new calls are accepted."""
+        # Shedding: stay shed until every signal is clearly below its limit
+        scale = self.resume_ratio if self.shedding else 1.0
+        signals = (
+            ("sessions", self.active_sessions(), self.max_sessions),
+            ("loop_lag", self.loop_lag, self.max_loop_lag),
+            ("send_queue", self.send_queue(), self.max_send_queue),
+        )
+        # Sessions are a hard cap: the worker is full at max_sessions, shed or not
+        self.reasons = [
+            name for name, value, limit in signals
+            if value >= (limit if name == "sessions" else limit * scale)
+        ]
+        shedding = bool(self.reasons)
+        if shedding != self.shedding:
+            self.shed_since = time.monotonic() if shedding else None
+            print(f"Admission: {'shedding load (' + ', '.join(self.reasons) + ')' if shedding else 'accepting calls again'}")
+        self.shedding = shedding
+        return not shedding
+
+    def accepting(self) -> bool:
+        return self.evaluate()
+
+    # Decisions
+
+    def admit_call(self, call_sid: str = None) -> bool:
+        """/incoming-call: admits the call (holding a slot until its stream starts) or not."""
+        if not self.evaluate():
+            self.stats["rejected_incoming_call"] += 1
+            return False
+        if call_sid:
+            self.reserved[call_sid] = time.monotonic() + ADMISSION_RESERVE_SECONDS
+        self.stats["admitted"] += 1
+        return True
+
+    def admit_dial(self) -> bool:
+        """/make-call: whether to place a new outbound call now."""
+        if self.evaluate():
+            return True
+        self.stats["rejected_make_call"] += 1
+        return False
+
+    @contextlib.asynccontextmanager
+    async def session(self, call_sid: str, pacer):
+        """Counts a live media stream and watches its outbound queue."""
+        key = call_sid or id(pacer)
+        self.reserved.pop(call_sid, None)
+        self.sessions[key] = pacer
+        try:
+            yield
+        finally:
+            self.sessions.pop(key, None)
+
+    def status(self) -> dict:
+        return {
+            "accepting": not self.shedding,
+            "reasons": list(self.reasons),
+            "shed_for_s": round(time.monotonic() - self.shed_since, 1) if self.shed_since else 0.0,
+            "retry_after_s": ADMISSION_RETRY_AFTER_SECONDS,
+            "sessions": {"active": len(self.sessions), "reserved": len(self.reserved), "limit": self.max_sessions},
+            "loop_lag_ms": {"value": round(self.loop_lag * 1000, 1), "limit": self.max_loop_lag * 1000},
+            "send_queue_frames": {"value": round(self.send_queue(), 1), "limit": self.max_send_queue},
+            **self.stats,
+        }
+
+
+admission = AdmissionController()
@@ -0,0 +1,120 @@
+"""
+Micro-benchmark: transcoding cost of audio_codec vs. the old audioop path.
+
+Usage:
+    python benchmarks/bench_audio_codec.py [--seconds 5] [--frame-ms 100]
+
+Reports 20ms frames per second on a single core for both directions:
+  inbound  = Twilio 8kHz mu-law -> 16kHz PCM (+ RMS), as handle_media_stream
+             runs it: is_speech() per frame, InboundCoalescer, process() per
+             batch. Measured on speech and on silence (gated, never resampled).
+             The audioop baseline decodes, measures and resamples every frame
+             and gets no coalescer cost.
+  outbound = Gemini 24kHz PCM -> 8kHz mu-law, one call per chunk
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_codec import InboundTranscoder, OutboundTranscoder, ulaw_encode  # noqa: E402
+from inbound_stage import INBOUND_SILENCE_RMS, InboundCoalescer  # noqa: E402
+
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import audioop
+except ImportError:  # Python 3.13+
+    audioop = None
+
+
+def make_frames(frame_ms: int = 20, seconds: float = 1.0):
+    """Synthetic speech-like test signal split into `frame_ms` Twilio/Gemini chunks, plus line-noise silence."""
+    rng = np.random.default_rng(0)
+    t8 = np.arange(int(8000 * seconds)) / 8000
+    t24 = np.arange(int(24000 * seconds)) / 24000
+    sig8 = (6000 * np.sin(2 * np.pi * 220 * t8) + rng.normal(0, 800, t8.size)).astype(np.int16)
+    quiet8 = rng.normal(0, 30, t8.size).astype(np.int16)
+    sig24 = (6000 * np.sin(2 * np.pi * 220 * t24) + rng.normal(0, 800, t24.size)).astype(np.int16)
+    n8 = 8 * frame_ms
+    n24 = 24 * frame_ms
+    inbound = [ulaw_encode(sig8[i:i + n8]) for i in range(0, sig8.size - n8 + 1, n8)]
+    silence = [ulaw_encode(quiet8[i:i + n8]) for i in range(0, quiet8.size - n8 + 1, n8)]
+    outbound = [sig24[i:i + n24].tobytes() for i in range(0, sig24.size - n24 + 1, n24)]
+    return inbound, silence, outbound
+
+
+def live_inbound():
+    """The receive_from_twilio path: speech/silence per frame, coalesce, transcode per batch."""
+    coalescer = InboundCoalescer()
+    transcoder = InboundTranscoder(INBOUND_SILENCE_RMS)
+
+    def process(chunk):
+        outgoing = coalescer.push(chunk, transcoder.is_speech(chunk))
+        return transcoder.process(outgoing) if outgoing else None
+
+    return process
+
+
+def run(label: str, fn, frames, seconds: float, frame_ms: int):
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for frame in frames:
+            fn(frame)
+        count += len(frames)
+    elapsed = time.perf_counter() - start
+    # Normalise to 20ms-of-audio units; a live call needs 50 of them per second per direction
+    fps = count * (frame_ms / 20) / elapsed
+    print(f"{label:<28} {fps:>12,.0f} frames/s  {1e6 / fps:>8.2f} us/frame  ~{fps / 50:>8,.0f} calls/core")
+    return fps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=3.0, help="Time budget per measurement")
+    parser.add_argument("--frame-ms", type=int, default=20, help="Chunk size fed to each call (20 = raw Twilio frames)")
+    args = parser.parse_args()
+
+    inbound, silence, outbound = make_frames(args.frame_ms)
+    print(f"chunk size: {args.frame_ms}ms (rates below are in 20ms frames)")
+
+    print("== inbound (mu-law 8k -> PCM 16k + RMS) ==")
+    new_in = run("audio_codec, speech", live_inbound(), inbound, args.seconds, args.frame_ms)
+    new_quiet = run("audio_codec, silence", live_inbound(), silence, args.seconds, args.frame_ms)
+    if audioop:
+        state = [None]
+
+        def audioop_in(chunk):
+            pcm_8k = audioop.ulaw2lin(chunk, 2)
+            audioop.rms(pcm_8k, 2)
+            pcm_16k, state[0] = audioop.ratecv(pcm_8k, 2, 1, 8000, 16000, state[0])
+            return pcm_16k
+
+        old_in = run("audioop", audioop_in, inbound, args.seconds, args.frame_ms)
+        print(f"speedup: {new_in / old_in:.2f}x speech, {new_quiet / old_in:.2f}x silence")
+
+    print("== outbound (PCM 24k -> mu-law 8k) ==")
+    codec_out = OutboundTranscoder()
+    new_out = run("audio_codec", codec_out.process, outbound, args.seconds, args.frame_ms)
+    if audioop:
+        state = [None]
+
+        def audioop_out(chunk):
+            pcm_8k, state[0] = audioop.ratecv(chunk, 2, 1, 24000, 8000, state[0])
+            return audioop.lin2ulaw(pcm_8k, 2)
+
+        old_out = run("audioop", audioop_out, outbound, args.seconds, args.frame_ms)
+        print(f"speedup: {new_out / old_out:.2f}x")
+    else:
+        print("audioop not available on this interpreter; skipping baseline")
+
+
+if __name__ == "__main__":
+    main()
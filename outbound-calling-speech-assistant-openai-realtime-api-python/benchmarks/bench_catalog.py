@@ -0,0 +1,106 @@
+"""
+Benchmark: ranked catalog index vs. the old linear substring scan in check_inventory.
+
+Usage:
+    python benchmarks/bench_catalog.py [--skus 50000]
+
+Builds a synthetic Samsung catalog, then times both lookups on typed and
+spoken-style queries and reports how many queries each one resolves.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import CatalogIndex  # noqa: E402
+
+FAMILIES = [
+    ("Galaxy S{n}", "Mobility", [21, 22, 23, 24, 25]),
+    ("Galaxy A{n}", "Mobility", [14, 15, 25, 35, 55]),
+    ("Galaxy Tab S{n}", "Mobility", [8, 9, 10]),
+    ("{n} inch Crystal UHD TV", "Displays", [32, 43, 50, 55, 65, 75, 85]),
+    ("{n} inch Neo QLED TV", "Displays", [43, 55, 65, 75, 85, 98]),
+    ("Odyssey G{n} Monitor", "Displays", [5, 7, 9]),
+    ("WindFree Split AC {n} Ton", "HVAC", [1, 2]),
+    ("DVM S{n} VRF System", "HVAC", [2, 4]),
+    ("Galaxy Book{n} Pro", "Computing", [3, 4, 5]),
+]
+VARIANTS = ["", "Ultra", "Plus", "FE", "Lite", "Pro", "Edge", "Max"]
+COLOURS = ["Black", "Silver", "Blue", "Green", "Graphite", "Cream", "Titanium", "Violet"]
+STORAGE = ["64GB", "128GB", "256GB", "512GB", "1TB"]
+
+QUERIES = [
+    ("Galaxy S24 Ultra", "galaxy s24 ultra"),
+    ("s twenty four ultra", "galaxy s24 ultra"),
+    ("fifty five inch tv", "55 inch"),
+    ("neo qled seventy five", "75 inch neo qled"),
+    ("vrf system", "vrf system"),
+    ("galaxy tab s nine", "galaxy tab s9"),
+    ("odyssey g seven monitor", "odyssey g7"),
+]
+
+
+def build_catalog(size: int) -> list[dict]:
+    rng = random.Random(0)
+    products = []
+    while len(products) < size:
+        template, category, numbers = rng.choice(FAMILIES)
+        name = " ".join(filter(None, [
+            "Samsung", template.format(n=rng.choice(numbers)), rng.choice(VARIANTS),
+            rng.choice(STORAGE) if category in ("Mobility", "Computing") else "", rng.choice(COLOURS),
+        ]))
+        products.append({
+            "id": len(products) + 1, "sku": f"SM-{len(products):06d}", "name": name, "category": category,
+            "stock": rng.randint(0, 50), "price": rng.randint(10, 500) * 1000, "note": None,
+        })
+    return products
+
+
+def linear_scan(inventory: dict, product_name: str):
+    """The original check_inventory matching logic."""
+    product_key = product_name.lower()
+    for key, data in inventory.items():
+        if key in product_key or product_key in key:
+            return key
+    return None
+
+
+def timed(fn, queries, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [fn(q) for q, _ in queries]
+    per_query = (time.perf_counter() - start) / (repeat * len(queries))
+    return per_query, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--skus", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    products = build_catalog(args.skus)
+    inventory = {p["name"].lower(): p for p in products}
+
+    start = time.perf_counter()
+    index = CatalogIndex(products)
+    print(f"{len(products):,} SKUs indexed in {time.perf_counter() - start:.2f}s")
+
+    scan_time, scan_results = timed(lambda q: linear_scan(inventory, q), QUERIES, max(1, args.repeat // 10))
+    index_time, index_results = timed(lambda q: index.search(q, limit=1), QUERIES, args.repeat)
+
+    scan_hits = sum(1 for (q, want), got in zip(QUERIES, scan_results) if got and want in got)
+    index_hits = sum(1 for (q, want), got in zip(QUERIES, index_results) if got and want in got[0][0]["name"].lower())
+
+    print(f"{'linear scan':<14} {scan_time * 1000:>9.3f} ms/query  resolved {scan_hits}/{len(QUERIES)}")
+    print(f"{'catalog index':<14} {index_time * 1000:>9.3f} ms/query  resolved {index_hits}/{len(QUERIES)}")
+    for (query, _), got in zip(QUERIES, index_results):
+        top = f"{got[0][0]['name']} ({got[0][1]:.2f})" if got else "-"
+        print(f"  {query!r:<28} -> {top}")
+
+
+if __name__ == "__main__":
+    main()
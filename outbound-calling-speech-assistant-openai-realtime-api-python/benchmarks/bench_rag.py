@@ -0,0 +1,289 @@
+"""
+Benchmark: in-process hybrid index (rag_index.py) vs. the Chroma query path in
+query_knowledge_base.
+
+Usage:
+    python benchmarks/bench_rag.py [--chunks 5000] [--embed-latency-ms 150] [--gemini]
+
+Builds a synthetic Yexis knowledge base (one chunk per product and topic, plus
+filler chunks), loads it into an ephemeral Chroma collection and syncs the
+index from it, then runs labelled queries through both paths:
+
+  - keyword queries ("Galaxy S24 warranty"), the common case on calls
+  - paraphrased queries ("how long is the guarantee on the Galaxy S24"),
+    which share few words with the chunk and need the embedding
+
+and reports latency, recall@2 (a correct chunk in the top two), precision of
+what is returned and how many embedding calls the index skipped. Finally it
+times incremental updates (re-ingesting part of the corpus) and compaction.
+
+Embeddings come from a local hashing embedder that maps synonyms to the same
+concept, so the run is offline and repeatable; every query embedding also
+sleeps --embed-latency-ms to stand in for the Gemini round trip. --gemini uses
+text-embedding-004 instead (needs GEMINI_API_KEY; keep --chunks small).
+"""
+import argparse
+import hashlib
+import os
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag_index import HybridIndex, content_hash, tokenize  # noqa: E402
+
+PRODUCTS = [
+    f"{family} {model}"
+    for family, models in [
+        ("Galaxy", ["S23", "S24", "S25", "A15", "A35", "A55", "Z Fold6", "Z Flip6", "M34", "F15"]),
+        ("Galaxy Tab", ["S8", "S9", "S10", "A9"]),
+        ("Galaxy Book", ["Pro 3", "Pro 4", "Flex 5", "Go 2"]),
+        ("Neo QLED", ["QN85C", "QN90D", "QN95D", "QN800D"]),
+        ("Crystal UHD", ["CU7700", "CU8000", "DU8000", "DU9000"]),
+        ("Odyssey", ["G5", "G7", "G9", "OLED G6"]),
+        ("WindFree", ["AR12", "AR18", "AR24", "AR36"]),
+        ("DVM", ["S2 VRF", "S4 VRF", "Eco VRF"]),
+        ("Bespoke", ["RF65", "WF90", "DV90", "Jet AI"]),
+        ("EcoBubble", ["WW70", "WW80", "WW90"]),
+    ]
+    for model in models
+]
+
+# topic -> (chunk sentences, keyword query, paraphrased query); {p} is the product
+TOPICS = {
+    "warranty": (
+        "The {p} carries a {n}-year manufacturer warranty covering parts and labour. Warranty claims need the invoice.",
+        "{p} warranty",
+        "how long is the guarantee on the {p}",
+    ),
+    "returns": (
+        "Defective {p} units can be returned within {n} days of delivery for a replacement. Original packaging is required for returns.",
+        "{p} return policy",
+        "can I send back a faulty {p} for a refund",
+    ),
+    "installation": (
+        "Installation of the {p} is done by a certified technician within {n} working days. Installation is free in metro cities.",
+        "{p} installation",
+        "when will a technician come to set up my {p}",
+    ),
+    "emi": (
+        "The {p} is available on no-cost EMI for {n} months with major credit cards. EMI approval is instant at checkout.",
+        "{p} EMI options",
+        "can I pay for the {p} in monthly instalments",
+    ),
+    "delivery": (
+        "Standard delivery for the {p} takes {n} days. Express delivery is offered in selected pin codes.",
+        "{p} delivery time",
+        "how soon will the {p} be shipped to me",
+    ),
+    "amc": (
+        "An annual maintenance contract (AMC) for the {p} costs Rs {n}99 per year and includes {n} preventive service visits.",
+        "{p} AMC",
+        "is there a yearly servicing plan for the {p}",
+    ),
+    "exchange": (
+        "Trade in your old device when buying the {p} and get up to Rs {n}000 off under the exchange offer.",
+        "{p} exchange offer",
+        "will I get a discount for trading in my old phone against the {p}",
+    ),
+    "energy": (
+        "The {p} has a {n}-star BEE energy rating and an inverter compressor for lower power consumption.",
+        "{p} energy rating",
+        "how much electricity does the {p} use",
+    ),
+}
+FILLER = [
+    "Visit the Yexis store at {city} to see the {p} on display. Our staff can arrange a demo on request.",
+    "The {p} was reviewed by {city} Tech Weekly, which praised its design and build quality.",
+    "Yexis Electronics ships across India from its warehouse in {city}. Stock of the {p} is updated daily.",
+]
+CITIES = ["Chennai", "Bengaluru", "Mumbai", "Delhi", "Pune", "Hyderabad", "Kolkata", "Kochi", "Jaipur", "Lucknow"]
+
+# Concepts the local embedder treats as the same direction
+SYNONYMS = {
+    "guarantee": "warranty", "long": "warranty", "claim": "warranty",
+    "send": "return", "back": "return", "faulty": "defective", "refund": "return", "replacement": "return",
+    "technician": "installation", "set": "installation", "up": "installation", "install": "installation",
+    "pay": "emi", "monthly": "emi", "instalment": "emi", "month": "emi", "credit": "emi",
+    "shipped": "delivery", "soon": "delivery", "ship": "delivery", "express": "delivery",
+    "yearly": "amc", "servicing": "amc", "service": "amc", "maintenance": "amc", "annual": "amc", "contract": "amc",
+    "trading": "exchange", "trade": "exchange", "old": "exchange", "discount": "exchange", "off": "exchange",
+    "electricity": "energy", "power": "energy", "consumption": "energy", "star": "energy", "bee": "energy",
+}
+
+
+class HashingEmbedder:
+    """Offline stand-in for text-embedding-004: a bag of concept vectors."""
+
+    def __init__(self, dim: int = 768, latency_s: float = 0.0):
+        self.dim = dim
+        self.latency_s = latency_s
+        self.calls = 0
+        self._vectors = {}
+
+    def _concept(self, word: str) -> np.ndarray:
+        vector = self._vectors.get(word)
+        if vector is None:
+            seed = int.from_bytes(hashlib.sha1(word.encode()).digest()[:4], "little")
+            vector = self._vectors[word] = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return vector
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        out = []
+        for text in texts:
+            vector = np.zeros(self.dim, dtype=np.float32)
+            for word in tokenize(text):
+                vector += self._concept(SYNONYMS.get(word, word))
+            out.append((vector / (np.linalg.norm(vector) or 1.0)).tolist())
+        return out
+
+    def __call__(self, query: str) -> list[float]:
+        self.calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return self.embed_documents([query])[0]
+
+
+class GeminiEmbedder:
+    def __init__(self):
+        from rag_service import get_embedding
+        self._embed = get_embedding
+        self.calls = 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def __call__(self, query: str) -> list[float]:
+        self.calls += 1
+        return self._embed(query)
+
+
+def build_corpus(size: int):
+    """(ids, documents, metadatas) and the labelled queries: (query, style, relevant ids)."""
+    rng = random.Random(0)
+    ids, docs, metas, queries = [], [], [], []
+    for product in PRODUCTS:
+        for topic, (template, keyword, paraphrase) in TOPICS.items():
+            doc_id = f"{topic}-{product.lower().replace(' ', '-')}"
+            ids.append(doc_id)
+            docs.append(template.format(p=product, n=rng.randint(1, 9)))
+            metas.append({"source": f"{topic}.txt", "chunk": len(ids)})
+            queries.append((keyword.format(p=product), "keyword", {doc_id}))
+            queries.append((paraphrase.format(p=product), "paraphrase", {doc_id}))
+    while len(ids) < size:
+        ids.append(f"filler-{len(ids)}")
+        docs.append(rng.choice(FILLER).format(p=rng.choice(PRODUCTS), city=rng.choice(CITIES)))
+        metas.append({"source": "filler.txt", "chunk": len(ids)})
+    for meta, text in zip(metas, docs):
+        meta["hash"] = content_hash(text)
+    rng.shuffle(queries)
+    return ids, docs, metas, queries
+
+
+def load_chroma(ids, docs, metas, embeddings):
+    import chromadb
+    collection = chromadb.EphemeralClient().get_or_create_collection(name=f"bench_{time.time_ns()}")
+    for start in range(0, len(ids), 1000):
+        end = start + 1000
+        collection.upsert(ids=ids[start:end], documents=docs[start:end], embeddings=embeddings[start:end], metadatas=metas[start:end])
+    return collection
+
+
+def id_lookup(ids, docs):
+    return {text: doc_id for doc_id, text in zip(ids, docs)}
+
+
+def run(name, queries, search, by_text, embedder):
+    embedder.calls = 0
+    latencies, hits, returned, relevant_returned = [], {}, 0, 0
+    for query, style, relevant in queries:
+        start = time.perf_counter()
+        results = search(query)
+        latencies.append(time.perf_counter() - start)
+        got = {by_text.get(text) for text in results}
+        returned += len(results)
+        relevant_returned += len(got & relevant)
+        style_hits = hits.setdefault(style, [0, 0])
+        style_hits[0] += bool(got & relevant)
+        style_hits[1] += 1
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    recall = "  ".join(f"{style} {h / n:.0%}" for style, (h, n) in sorted(hits.items()))
+    print(
+        f"{name:<16} mean {statistics.fmean(latencies) * 1000:>7.2f} ms  p50 {statistics.median(latencies) * 1000:>7.2f} ms  p95 {p95 * 1000:>7.2f} ms  "
+        f"recall@2 {recall}  precision {relevant_returned / max(1, returned):.0%}  "
+        f"embed calls {embedder.calls}/{len(queries)}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200, help="labelled queries to run (of 2 per product/topic)")
+    parser.add_argument("--embed-latency-ms", type=float, default=150.0, help="simulated Gemini round trip per query")
+    parser.add_argument("--gemini", action="store_true", help="embed with text-embedding-004 instead of the local embedder")
+    args = parser.parse_args()
+
+    embedder = GeminiEmbedder() if args.gemini else HashingEmbedder(latency_s=args.embed_latency_ms / 1000)
+    ids, docs, metas, queries = build_corpus(args.chunks)
+    queries = queries[:args.queries]
+    by_text = id_lookup(ids, docs)
+    print(f"{len(ids):,} chunks, {len(queries)} queries, "
+          f"{'Gemini embeddings' if args.gemini else f'local embeddings + {args.embed_latency_ms:.0f} ms simulated latency'}")
+
+    start = time.perf_counter()
+    embeddings = embedder.embed_documents(docs)
+    collection = load_chroma(ids, docs, metas, embeddings)
+    print(f"chroma loaded in {time.perf_counter() - start:.2f}s")
+
+    def chroma_search(query):
+        results = collection.query(query_embeddings=[embedder(query)], n_results=2)
+        return results["documents"][0] if results["documents"] else []
+
+    indexes = {}
+    for dtype in ("float32", "int8"):
+        index = HybridIndex(dtype=dtype)
+        start = time.perf_counter()
+        index.sync(collection)
+        indexes[dtype] = index
+        summary = index.summary()
+        print(f"index ({dtype}) synced from chroma in {time.perf_counter() - start:.2f}s: "
+              f"{summary['chunks']:,} chunks, {summary['terms']:,} terms, matrix {summary['matrix_mb']} MB")
+
+    print()
+    run("chroma", queries, chroma_search, by_text, embedder)
+    for dtype, index in indexes.items():
+        run(f"hybrid ({dtype})", queries, lambda q, index=index: [t for t, _ in index.search(q, 2, embedder)], by_text, embedder)
+        stats = index.summary()
+        print(f"{'':<16} lexical short-circuit {stats['lexical']}, hybrid {stats['hybrid']}, empty {stats['empty']}")
+
+    # Incremental updates: re-ingest 10% of the chunks with edited text, then drop a source's tail
+    index = indexes["float32"]
+    rng = random.Random(1)
+    changed = rng.sample(range(len(ids)), len(ids) // 10)
+    edited = [docs[i] + " Updated October 2026." for i in changed]
+    start = time.perf_counter()
+    index.upsert([ids[i] for i in changed], edited, embedder.embed_documents(edited),
+                 [{**metas[i], "hash": content_hash(text)} for i, text in zip(changed, edited)])
+    upsert_s = time.perf_counter() - start
+    start = time.perf_counter()
+    index.delete_source_tail("filler.txt", 0)
+    delete_s = time.perf_counter() - start
+    stats = index.summary()
+    print(f"\nupsert {len(changed):,} edited chunks {upsert_s * 1000:.0f} ms, drop filler source {delete_s * 1000:.0f} ms: "
+          f"{stats['chunks']:,} live of {stats['rows']:,} rows, {stats['compactions']} compactions")
+    for i in changed[:200]:
+        doc_id = ids[i]
+        if doc_id.startswith("filler-"):
+            continue
+        text = index.docs[index.rows[doc_id]]
+        assert text.endswith("Updated October 2026."), doc_id
+    print("edited chunks served from the index after the update")
+
+
+if __name__ == "__main__":
+    main()
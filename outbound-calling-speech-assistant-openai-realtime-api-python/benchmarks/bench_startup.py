@@ -0,0 +1,111 @@
+"""
+Benchmark: server startup, time from process start to the first accepted request and to ready.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--ref HEAD~1] [--port 6070]
+
+Starts main.py --runs times, each in a fresh working directory (empty SQLite
+database and knowledge base), and polls it. "accepted" is the first HTTP
+response of any kind; "ready" is /readyz answering 200. Trees without /readyz
+initialised everything before binding the port, so for them ready = accepted.
+With --ref the app as of that git revision (exported with git archive) is
+measured too, e.g. the commit before the lazy startup for a before/after.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def export_ref(ref: str, dest: str) -> str:
+    """Extracts the app directory as of `ref` into dest; returns the path of its main.py."""
+    top = subprocess.check_output(["git", "rev-parse", "--show-toplevel"], cwd=APP_DIR, text=True).strip()
+    prefix = subprocess.check_output(["git", "rev-parse", "--show-prefix"], cwd=APP_DIR, text=True).strip()
+    archive = subprocess.Popen(["git", "archive", ref, prefix or "."], cwd=top, stdout=subprocess.PIPE)
+    subprocess.check_call(["tar", "-x", "-C", dest], stdin=archive.stdout)
+    if archive.wait():
+        raise RuntimeError(f"git archive {ref} failed")
+    return os.path.join(dest, prefix, "main.py")
+
+
+def measure(main_path: str, port: int, timeout: float) -> tuple[float, float]:
+    """One cold start; returns (seconds to first response, seconds to ready)."""
+    workdir = tempfile.mkdtemp(prefix="bench-startup-")
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'crm.db')}",
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "bench"),
+        "PORT": str(port),
+        "WORKERS": "1",
+    }
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, main_path], cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    accepted = ready = None
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1.0) as client:
+            while ready is None:
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError(f"not ready after {timeout:.0f}s")
+                if server.poll() is not None:
+                    raise RuntimeError(f"server exited with code {server.returncode}")
+                try:
+                    response = client.get("/readyz")
+                except httpx.TransportError:
+                    time.sleep(0.01)
+                    continue
+                now = time.perf_counter() - started
+                accepted = accepted if accepted is not None else now
+                if response.status_code in (200, 404):
+                    ready = now
+                else:
+                    time.sleep(0.01)
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return accepted, ready
+
+
+def report(label: str, samples: list[tuple[float, float]]):
+    for i, name in enumerate(("accepted", "ready")):
+        values = sorted(s[i] for s in samples)
+        median = values[len(values) // 2]
+        print(f"{label:>10} {name:>8}: median {median * 1000:7.0f}ms  min {values[0] * 1000:7.0f}ms  max {values[-1] * 1000:7.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ref", help="also measure the app at this git revision")
+    parser.add_argument("--port", type=int, default=6070)
+    parser.add_argument("--timeout", type=float, default=120, help="give up on a start after this many seconds")
+    args = parser.parse_args()
+
+    targets = [("current", os.path.join(APP_DIR, "main.py"))]
+    export_dir = None
+    if args.ref:
+        export_dir = tempfile.mkdtemp(prefix="bench-startup-ref-")
+        targets.insert(0, (args.ref, export_ref(args.ref, export_dir)))
+    try:
+        for label, main_path in targets:
+            samples = [measure(main_path, args.port, args.timeout) for _ in range(args.runs)]
+            report(label, samples)
+    finally:
+        if export_dir:
+            shutil.rmtree(export_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
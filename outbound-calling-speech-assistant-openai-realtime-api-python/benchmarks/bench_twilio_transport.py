@@ -0,0 +1,110 @@
+"""
+Benchmark: event-loop jitter while placing calls, sync twilio SDK vs. the pooled async transport.
+
+Usage:
+    python benchmarks/bench_twilio_transport.py [--calls 50] [--latency-ms 200]
+
+Starts benchmarks/fake_twilio.py in a subprocess, runs a 20ms ticker on the event
+loop (what an OutboundPacer does for a live call) and places --calls calls
+the way main.py used to (twilio.rest.Client inside the loop) and the way it
+does now (TwilioTransport). Reports how late the 20ms ticks fired.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import subprocess
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import httpx  # noqa: E402
+from twilio.rest import Client  # noqa: E402
+
+from twilio_transport import TwilioTransport  # noqa: E402
+
+FRAME_SECONDS = 0.02
+ACCOUNT_SID = "ACbench"
+
+
+def start_fake(port: int, latency_ms: float) -> subprocess.Popen:
+    # Separate process so the fake server doesn't compete for this loop's GIL
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_twilio.py"),
+        "--port", str(port), "--latency-ms", str(latency_ms), "--outcomes", "completed=1",
+    ])
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/stats")
+            return fake
+        except httpx.TransportError:
+            time.sleep(0.1)
+    fake.kill()
+    raise RuntimeError("fake Twilio server did not start")
+
+
+async def ticker(lateness: list, stop: asyncio.Event):
+    expected = time.perf_counter() + FRAME_SECONDS
+    while not stop.is_set():
+        await asyncio.sleep(max(0.0, expected - time.perf_counter()))
+        now = time.perf_counter()
+        lateness.append(now - expected)
+        expected = max(expected + FRAME_SECONDS, now)
+
+
+async def run(mode: str, base_url: str, calls: int) -> dict:
+    lateness = []
+    stop = asyncio.Event()
+    tick_task = asyncio.create_task(ticker(lateness, stop))
+    await asyncio.sleep(0.2)
+
+    start = time.perf_counter()
+    if mode == "sync":
+        client = Client(ACCOUNT_SID, "token")
+        client.api.base_url = base_url
+
+        async def place(i):
+            # What `async def make_call` did: a blocking SDK call on the loop
+            client.calls.create(to=f"+1555000{i:04d}", from_="+15550000", url="https://example.com/incoming-call")
+
+        await asyncio.gather(*(place(i) for i in range(calls)))
+    else:
+        transport = TwilioTransport(ACCOUNT_SID, "token", base_url=base_url)
+        await asyncio.gather(*(
+            transport.create_call(to=f"+1555000{i:04d}", url="https://example.com/incoming-call", from_="+15550000")
+            for i in range(calls)
+        ))
+        await transport.aclose()
+    elapsed = time.perf_counter() - start
+
+    await asyncio.sleep(0.2)
+    stop.set()
+    await tick_task
+    late_ms = np.array(lateness) * 1000
+    return {
+        "seconds": elapsed,
+        "p50": float(np.percentile(late_ms, 50)),
+        "p99": float(np.percentile(late_ms, 99)),
+        "max": float(late_ms.max()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--port", type=int, default=7079)
+    args = parser.parse_args()
+
+    fake = start_fake(args.port, args.latency_ms)
+    base_url = f"http://127.0.0.1:{args.port}"
+    print(f"{args.calls} calls, fake Twilio latency {args.latency_ms:.0f}ms; 20ms tick lateness:")
+    for mode, label in (("sync", "twilio SDK"), ("async", "async transport")):
+        r = asyncio.run(run(mode, base_url, args.calls))
+        print(f"{label:<16} {r['seconds']:>6.2f}s total  p50 {r['p50']:>7.2f}ms  p99 {r['p99']:>8.2f}ms  max {r['max']:>8.2f}ms")
+    fake.terminate()
+
+
+if __name__ == "__main__":
+    main()
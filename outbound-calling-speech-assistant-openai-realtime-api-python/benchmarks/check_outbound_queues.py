@@ -0,0 +1,241 @@
+"""
+Check: SMS broadcast and calling campaign queues against a scripted fake Twilio.
+
+Usage:
+    python benchmarks/check_outbound_queues.py [--leads 300] [--rate 500] [--timeout 60] [--failed-writes 3]
+
+Runs BroadcastSender + SmsInbox and CampaignDialer in-process on a fresh SQLite
+database (unless DATABASE_URL is set) with short retry and poll intervals. Each
+lead gets a scripted fate by its index, so every path of the claim, retry and
+status-callback state machines is taken:
+
+    SMS    0-4 delivered          5 network error, then delivered
+           6 status callback before the send returns (early status), delivered
+           7 undelivered 30001, then delivered    8 undelivered 30003 (final)
+           9 Twilio 400 (final)
+    calls  0-4 completed          5 blocked number, ValueError (final, never redialed)
+           6 busy, then completed 7 no-answer on every attempt
+           8 canceled (final, never redialed)     9 Twilio 503, then completed
+
+The first --failed-writes writes of send results (the ones carrying message
+SIDs) fail, for longer than the sending timeout, so a result that gets dropped
+or a row the orphan sweep requeues shows up as a second text. Inbound messages
+from leads, unknown numbers and STOP are fed through the inbox too. Prints the queue stats and exits non-zero when any row ends in the wrong
+state or with the wrong number of attempts.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MAX_ATTEMPTS = 3
+# Scripted fates: index % 10 -> expected (final status, attempts)
+SMS_EXPECTED = {**{k: ("delivered", 1) for k in range(5)},
+                5: ("delivered", 2), 6: ("delivered", 1), 7: ("delivered", 2), 8: ("failed", 1), 9: ("failed", 1)}
+CALL_EXPECTED = {**{k: ("completed", 1) for k in range(5)},
+                 5: ("failed", 1), 6: ("completed", 2), 7: ("failed", MAX_ATTEMPTS), 8: ("failed", 1), 9: ("completed", 2)}
+
+
+def configure(workdir: str):
+    # Module settings are read at import time
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'queues.db')}")
+    for name, value in [
+        ("SMS_RETRY_BASE_SECONDS", "0.2"), ("SMS_POLL_SECONDS", "0.1"), ("SMS_RESULT_FLUSH_MS", "50"),
+        ("SMS_INBOX_FLUSH_MS", "50"), ("DIALER_RETRY_BASE_SECONDS", "0.2"), ("DIALER_POLL_SECONDS", "0.1"),
+        ("INTERACTION_FLUSH_MS", "50"), ("SMS_SENDING_TIMEOUT_SECONDS", "0.5"),
+    ]:
+        os.environ.setdefault(name, value)
+
+
+async def run_check(leads: int, rate: float, timeout: float, failed_writes: int) -> list[str]:
+    import httpx
+    from sqlmodel import select
+
+    import sms as sms_module
+    from campaigns import CampaignDialer, campaign_stats, create_campaign
+    from database import Campaign, CampaignCall, Lead, SmsBroadcast, SmsDelivery, async_session_maker, init_db
+    from interaction_log import interaction_log
+    from sms import BroadcastSender, SmsInbox, broadcast_stats, create_broadcast
+    from twilio_transport import TwilioError
+
+    init_db()
+    phones = [f"+1555{i:07d}" for i in range(leads)]
+    index = {phone: i for i, phone in enumerate(phones)}
+    async with async_session_maker() as session:
+        session.add_all([Lead(name=f"Queue Check {i}", phone=phone) for i, phone in enumerate(phones)])
+        await session.commit()
+
+    write = sms_module.apply_updates
+    failing = [failed_writes]
+
+    async def flaky_apply_updates(rows: list[dict]):
+        # Only the sender's result writes carry SIDs
+        if failing[0] and any(r.get("message_sid") for r in rows):
+            failing[0] -= 1
+            raise OSError("database is locked (injected)")
+        await write(rows)
+
+    sms_module.apply_updates = flaky_apply_updates
+    interaction_log.start()
+    sender = BroadcastSender(mps=rate, burst=max(1, int(rate / 10)), max_in_flight=64)
+    inbox = SmsInbox(sender, auto_reply="Thanks {first_name}, we will call you back.")
+    dialer = CampaignDialer(cps=rate, burst=max(1, int(rate / 10)), max_active=64)
+    sends, dials, replies = {}, {}, []
+    callbacks = set()
+
+    def later(coro):
+        task = asyncio.create_task(coro)
+        callbacks.add(task)
+        task.add_done_callback(callbacks.discard)
+
+    async def report(sid: str, status: str, error_code: str = None):
+        await asyncio.sleep(0.02)
+        await inbox.status(sid, status, error_code)
+
+    async def send(to: str, body: str) -> str:
+        attempt = sends[to] = sends.get(to, 0) + 1
+        fate = index[to] % 10
+        sid = f"SM{index[to]:08d}{attempt}"
+        if fate == 5 and attempt == 1:
+            raise httpx.ConnectError("connection reset")
+        if fate == 9:
+            raise TwilioError(400, "The 'To' number is not a valid phone number.", 21211)
+        if fate == 6:
+            # Twilio can call back before the send's result is written
+            await inbox.status(sid, "sent")
+            await inbox.status(sid, "delivered")
+        elif fate == 7 and attempt == 1:
+            later(report(sid, "undelivered", "30001"))
+        elif fate == 8:
+            later(report(sid, "undelivered", "30003"))
+        else:
+            later(report(sid, "delivered"))
+        return sid
+
+    async def reply(to: str, body: str) -> str:
+        replies.append(to)
+        return f"SMreply{len(replies)}"
+
+    async def hang_up(sid: str, status: str):
+        # The call SID is recorded just after the dial returns; a real callback comes much later
+        for _ in range(200):
+            await asyncio.sleep(0.02)
+            if await dialer.on_status(sid, status):
+                return
+        print(f"Status {status} for {sid} was never applied")
+
+    async def place_call(to: str, lead_id: int, call_id: int) -> str:
+        attempt = dials[to] = dials.get(to, 0) + 1
+        fate = index[to] % 10
+        if fate == 5:
+            raise ValueError("Emergency numbers are blocked for safety.")
+        if fate == 9 and attempt == 1:
+            raise TwilioError(503, "Service Unavailable")
+        status = {6: "busy" if attempt == 1 else "completed", 7: "no-answer", 8: "canceled"}.get(fate, "completed")
+        sid = f"CA{index[to]:08d}{attempt}"
+        later(hang_up(sid, status))
+        return sid
+
+    async with async_session_maker() as session:
+        broadcast = await create_broadcast(session, "Queue check", "Hi {first_name}, offers are live.",
+                                           max_attempts=MAX_ATTEMPTS)
+        campaign = await create_campaign(session, "Queue check", max_attempts=MAX_ATTEMPTS)
+        for model, row_id in [(SmsBroadcast, broadcast["id"]), (Campaign, campaign["id"])]:
+            row = await session.get(model, row_id)
+            row.status = "running"
+            session.add(row)
+        await session.commit()
+
+    started = time.perf_counter()
+    sender.start(send)
+    inbox.start(reply)
+    dialer.start(place_call)
+    inbound = [(phone, "Do you have 55 inch TVs?") for phone in phones[:max(1, leads // 10)]]
+    inbound += [(f"+1666{i:07d}", "Who is this?") for i in range(max(1, leads // 20))]
+    inbound += [(phone, "STOP") for phone in phones[-min(5, leads):]]
+    for i, (phone, body) in enumerate(inbound):
+        await inbox.message(phone, body, f"SMin{i:08d}")
+
+    async def progress() -> tuple[dict, dict]:
+        async with async_session_maker() as session:
+            return (await broadcast_stats(session, await session.get(SmsBroadcast, broadcast["id"])),
+                    await campaign_stats(session, await session.get(Campaign, campaign["id"])))
+
+    while time.perf_counter() - started < timeout:
+        await asyncio.sleep(0.25)
+        sms, calls = await progress()
+        if sms["status"] == "completed" and calls["status"] == "completed" and not callbacks:
+            break
+    elapsed = time.perf_counter() - started
+    await inbox.stop()
+    await sender.stop()
+    await dialer.stop()
+    await interaction_log.stop()
+    sms, calls = await progress()
+    async with async_session_maker() as session:
+        deliveries = (await session.exec(
+            select(SmsDelivery.phone, SmsDelivery.status, SmsDelivery.attempts).where(SmsDelivery.broadcast_id == broadcast["id"])
+        )).all()
+        campaign_calls = (await session.exec(
+            select(CampaignCall.phone, CampaignCall.status, CampaignCall.attempts).where(CampaignCall.campaign_id == campaign["id"])
+        )).all()
+
+    print(f"finished in {elapsed:.1f}s")
+    print(f"sms:    {sms['messages']} attempts={sms['attempts']} outcomes={sms['outcomes']}")
+    print(f"        sender={sender.summary()}")
+    print(f"        inbox={inbox.summary()}")
+    print(f"calls:  {calls['calls']} attempts={calls['attempts']} outcomes={calls['outcomes']}")
+    print(f"        dialer={dialer.summary()}")
+
+    problems = []
+    for kind, rows, expected, made in [("sms", deliveries, SMS_EXPECTED, sends), ("call", campaign_calls, CALL_EXPECTED, dials)]:
+        if len(rows) != leads:
+            problems.append(f"{kind}: {len(rows)} rows queued for {leads} leads")
+        for phone, status, attempts in rows:
+            want = expected[index[phone] % 10]
+            if (status, attempts) != want or made.get(phone, 0) != want[1]:
+                problems.append(f"{kind} {phone}: {status} after {attempts} attempts ({made.get(phone, 0)} made), expected {want[0]} after {want[1]}")
+    if failing[0]:
+        problems.append(f"only {failed_writes - failing[0]} of {failed_writes} result writes were failed")
+    for kind, stats in [("broadcast", sms), ("campaign", calls)]:
+        if stats["status"] != "completed":
+            problems.append(f"{kind} still {stats['status']}")
+
+    known, stops = max(1, leads // 10), min(5, leads)
+    unknown = max(1, leads // 20)
+    want_inbox = {"received": known + unknown + stops, "matched": known + stops, "unmatched": unknown,
+                  "replies": known + unknown, "early_statuses": 0}
+    got_inbox = {key: inbox.summary()[key] for key in want_inbox}
+    if got_inbox != want_inbox:
+        problems.append(f"inbox {got_inbox}, expected {want_inbox}")
+    if set(replies) & (set(phones[-stops:]) - set(phones[:known])):
+        problems.append("a lead that only sent STOP got an auto-reply")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=300, help="leads to queue (default: 300)")
+    parser.add_argument("--rate", type=float, default=500, help="messages and calls per second (default: 500)")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for both queues to drain (default: 60)")
+    parser.add_argument("--failed-writes", type=int, default=3, help="send-result writes to fail first (default: 3)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="check-queues-") as workdir:
+        configure(workdir)
+        problems = asyncio.run(run_check(args.leads, args.rate, args.timeout, args.failed_writes))
+    for problem in problems[:20]:
+        print(f"FAIL {problem}")
+    if len(problems) > 20:
+        print(f"... and {len(problems) - 20} more")
+    if problems:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Local stand-in for the Gemini Live websocket API, for offline load tests.
+
+Usage:
+    python benchmarks/fake_gemini_live.py [--port 7443] [--cert-dir /tmp/fake-gemini]
+        [--eos-ms 300] [--think-ms 0] [--speed 2] [--tool-every 3]
+        [--tool 'check_inventory={"product_name": "Samsung TV"}']
+
+Serves wss:// with a self-signed certificate for 127.0.0.1 (the genai SDK only
+speaks TLS when an API key is set). Run the server with
+GEMINI_BASE_URL=https://127.0.0.1:7443 and SSL_CERT_FILE=<cert-dir>/cert.pem.
+
+Each session answers the setup message, then listens to the caller's audio.
+--eos-ms after the last voiced chunk it ends the caller's turn: every
+--tool-every turns it first issues the scripted tool call and waits for the
+tool response, then echoes the caller's utterance back as 24kHz model audio
+at --speed x real time, followed by turnComplete. Caller speech while it is
+answering interrupts the answer, like the real API.
+"""
+import argparse
+import asyncio
+import base64
+import datetime
+import ipaddress
+import json
+import os
+import ssl
+import time
+
+import numpy as np
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+# int16 RMS at or above which an input chunk counts as speech
+SPEECH_RMS = 500
+
+config = {"eos": 0.3, "think": 0.0, "speed": 2.0, "chunk_ms": 100, "tool_every": 3, "tool": None}
+stats = {"sessions": 0, "active": 0, "turns": 0, "tool_calls": 0, "interrupted": 0}
+
+
+def make_cert(cert_dir: str) -> tuple[str, str]:
+    """Writes a self-signed cert/key for 127.0.0.1 + localhost; returns their paths."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    os.makedirs(cert_dir, exist_ok=True)
+    cert_path, key_path = os.path.join(cert_dir, "cert.pem"), os.path.join(cert_dir, "key.pem")
+    if os.path.exists(cert_path) and os.path.exists(key_path):
+        return cert_path, key_path
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "fake-gemini-live")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=365))
+        .add_extension(x509.SubjectAlternativeName([
+            x509.DNSName("localhost"), x509.IPAddress(ipaddress.ip_address("127.0.0.1")),
+        ]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        # Python 3.13's strict verification wants these on a self-signed trust anchor
+        .add_extension(x509.KeyUsage(
+            digital_signature=True, key_cert_sign=True, content_commitment=False, key_encipherment=False,
+            data_encipherment=False, key_agreement=False, crl_sign=False, encipher_only=False, decipher_only=False,
+        ), critical=True)
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+        .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(key.public_key()), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    return cert_path, key_path
+
+
+def upsample_16k_to_24k(pcm: bytes) -> bytes:
+    samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+    if samples.size == 0:
+        return b""
+    positions = np.arange(0, samples.size, 2 / 3)
+    return np.interp(positions, np.arange(samples.size), samples).astype(np.int16).tobytes()
+
+
+def b64decode(data: str) -> bytes:
+    # The SDK sends URL-safe base64 without padding
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _get(d: dict, snake: str, camel: str):
+    # The SDK sends snake_case; accept either spelling
+    value = d.get(snake)
+    return d.get(camel) if value is None else value
+
+
+class FakeSession:
+    def __init__(self, ws):
+        self.ws = ws
+        self.utterance = bytearray()
+        self.last_voice = None
+        self.turns = 0
+        self.answer_task = None
+        self.tool_response = None
+
+    async def send(self, message: dict):
+        await self.ws.send(json.dumps(message))
+
+    def on_audio(self, pcm: bytes):
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+        voiced = samples.size and np.sqrt(np.mean(samples * samples)) >= SPEECH_RMS
+        if not voiced:
+            return
+        if self.answer_task and not self.answer_task.done():
+            # Barge-in
+            self.answer_task.cancel()
+            stats["interrupted"] += 1
+            asyncio.create_task(self.send({"serverContent": {"interrupted": True}}))
+        self.utterance += pcm
+        self.last_voice = time.monotonic()
+
+    async def watch_turns(self):
+        """Ends the caller's turn once they have been silent for --eos-ms."""
+        while True:
+            await asyncio.sleep(0.02)
+            if self.last_voice is not None and time.monotonic() - self.last_voice >= config["eos"]:
+                utterance = bytes(self.utterance)
+                self.utterance.clear()
+                self.last_voice = None
+                self.answer_task = asyncio.create_task(self.answer(utterance))
+
+    async def answer(self, utterance: bytes):
+        self.turns += 1
+        stats["turns"] += 1
+        await self.send({"serverContent": {"inputTranscription": {"text": f"caller turn {self.turns}"}}})
+        if config["tool"] and config["tool_every"] and self.turns % config["tool_every"] == 0:
+            name, args = config["tool"]
+            self.tool_response = asyncio.get_running_loop().create_future()
+            stats["tool_calls"] += 1
+            await self.send({"toolCall": {"functionCalls": [{"id": f"call-{self.turns}", "name": name, "args": args}]}})
+            try:
+                await asyncio.wait_for(self.tool_response, 15)
+            except asyncio.TimeoutError:
+                print("Tool response never arrived")
+        if config["think"]:
+            await asyncio.sleep(config["think"])
+
+        audio = upsample_16k_to_24k(utterance)
+        chunk_bytes = int(24000 * 2 * config["chunk_ms"] / 1000)
+        chunk_seconds = config["chunk_ms"] / 1000 / config["speed"]
+        await self.send({"serverContent": {"outputTranscription": {"text": f"echo of turn {self.turns}"}}})
+        for i in range(0, len(audio), chunk_bytes):
+            data = base64.b64encode(audio[i:i + chunk_bytes]).decode("ascii")
+            await self.send({"serverContent": {"modelTurn": {"parts": [
+                {"inlineData": {"mimeType": "audio/pcm;rate=24000", "data": data}}
+            ]}}})
+            await asyncio.sleep(chunk_seconds)
+        await self.send({"serverContent": {"turnComplete": True}})
+
+    def on_message(self, message: dict):
+        realtime = _get(message, "realtime_input", "realtimeInput")
+        if realtime:
+            chunks = _get(realtime, "media_chunks", "mediaChunks") or []
+            audio = realtime.get("audio")
+            if audio:
+                chunks = [*chunks, audio]
+            for chunk in chunks:
+                self.on_audio(b64decode(chunk["data"]))
+        elif _get(message, "tool_response", "toolResponse") is not None:
+            if self.tool_response and not self.tool_response.done():
+                self.tool_response.set_result(message)
+
+
+async def handle(ws):
+    setup = json.loads(await ws.recv())
+    if "setup" not in setup:
+        await ws.close(1008, "expected setup")
+        return
+    await ws.send(json.dumps({"setupComplete": {}}))
+    stats["sessions"] += 1
+    stats["active"] += 1
+    session = FakeSession(ws)
+    watcher = asyncio.create_task(session.watch_turns())
+    try:
+        async for raw in ws:
+            session.on_message(json.loads(raw))
+    except ConnectionClosed:
+        pass
+    except Exception as e:
+        print(f"Fake Gemini session failed: {type(e).__name__}: {e}", flush=True)
+    finally:
+        stats["active"] -= 1
+        watcher.cancel()
+        if session.answer_task:
+            session.answer_task.cancel()
+
+
+async def serve_forever(port: int, cert_path: str, key_path: str):
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(cert_path, key_path)
+    async with serve(handle, "127.0.0.1", port, ssl=ctx, max_size=None, ping_interval=None):
+        print(f"Fake Gemini Live on wss://127.0.0.1:{port} (cert {cert_path})", flush=True)
+        while True:
+            await asyncio.sleep(10)
+            if stats["sessions"]:
+                print(f"Fake Gemini stats: {stats}", flush=True)
+
+
+def parse_tool(spec: str):
+    name, _, args = spec.partition("=")
+    return name, json.loads(args) if args else {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=7443)
+    parser.add_argument("--cert-dir", default=os.path.join(os.environ.get("TMPDIR", "/tmp"), "fake-gemini-live"))
+    parser.add_argument("--eos-ms", type=float, default=300, help="caller silence that ends a turn")
+    parser.add_argument("--think-ms", type=float, default=0, help="extra delay before answering")
+    parser.add_argument("--speed", type=float, default=2.0, help="answer audio streamed at this x real time")
+    parser.add_argument("--tool-every", type=int, default=3, help="issue the tool call every N turns (0 = never)")
+    parser.add_argument("--tool", default='check_inventory={"product_name": "Samsung TV"}')
+    args = parser.parse_args()
+
+    config.update(eos=args.eos_ms / 1000, think=args.think_ms / 1000, speed=args.speed,
+                  tool_every=args.tool_every, tool=parse_tool(args.tool) if args.tool else None)
+    cert_path, key_path = make_cert(args.cert_dir)
+    asyncio.run(serve_forever(args.port, cert_path, key_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Local stand-in for the parts of the Twilio REST API this server uses.
+
+Usage:
+    python benchmarks/fake_twilio.py [--port 7070] [--latency-ms 150] [--ring-seconds 3]
+        [--outcomes completed=0.6,busy=0.2,no-answer=0.2] [--callback-scheme http]
+        [--sms-outcomes delivered=0.9,undelivered:30003=0.1] [--delivery-seconds 1]
+
+Then run the server with TWILIO_API_BASE=http://127.0.0.1:7070 (any account
+SID / auth token). Calls.json and Messages.json answer after --latency-ms;
+each call gets a random final CallStatus which is POSTed to its StatusCallback
+after --ring-seconds; each message likewise gets a MessageStatus (with an
+optional ErrorCode after the colon) after --delivery-seconds. GET /stats
+reports what was received, including the highest number of calls and of
+messages created within any one second.
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import deque
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+
+app = FastAPI()
+config = {"latency": 0.15, "ring": 3.0, "outcomes": {"completed": 1.0}, "callback_scheme": None,
+          "delivery": 1.0, "sms_outcomes": {"delivered": 1.0}}
+stats = {"calls": 0, "messages": 0, "callbacks": 0, "callback_errors": 0, "max_cps": 0, "max_mps": 0,
+         "outcomes": {}, "sms_outcomes": {}}
+_recent_calls = deque()
+_recent_messages = deque()
+_callback_tasks = set()
+_http = None
+
+
+def _parse_outcomes(spec: str) -> dict:
+    outcomes = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        outcomes[name.strip()] = float(weight or 1)
+    return outcomes
+
+
+def _sid(prefix: str) -> str:
+    return prefix + uuid.uuid4().hex
+
+
+def _count_rate(recent: deque, key: str):
+    now = time.monotonic()
+    recent.append(now)
+    while recent and recent[0] <= now - 1:
+        recent.popleft()
+    stats[key] = max(stats[key], len(recent))
+
+
+def _schedule_callback(url: str, delay: float, data: dict):
+    task = asyncio.create_task(_status_callback(url, delay, data))
+    _callback_tasks.add(task)
+    task.add_done_callback(_callback_tasks.discard)
+
+
+async def _status_callback(url: str, delay: float, data: dict):
+    await asyncio.sleep(delay)
+    if config["callback_scheme"]:
+        url = config["callback_scheme"] + "://" + url.split("://", 1)[-1]
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(timeout=10, limits=httpx.Limits(max_connections=64))
+    try:
+        await _http.post(url, data=data)
+        stats["callbacks"] += 1
+    except Exception as e:
+        stats["callback_errors"] += 1
+        print(f"Status callback to {url} failed: {e}")
+
+
+@app.post("/2010-04-01/Accounts/{account_sid}/Calls.json")
+async def create_call(account_sid: str, request: Request):
+    form = await request.form()
+    await asyncio.sleep(config["latency"])
+    _count_rate(_recent_calls, "max_cps")
+    stats["calls"] += 1
+
+    sid = _sid("CA")
+    status = random.choices(list(config["outcomes"]), weights=list(config["outcomes"].values()))[0]
+    stats["outcomes"][status] = stats["outcomes"].get(status, 0) + 1
+    if form.get("StatusCallback"):
+        _schedule_callback(form["StatusCallback"], config["ring"], {"CallSid": sid, "AccountSid": account_sid, "CallStatus": status})
+    return {
+        "sid": sid, "account_sid": account_sid, "to": form.get("To"), "from": form.get("From"),
+        "status": "queued", "direction": "outbound-api", "uri": f"/2010-04-01/Accounts/{account_sid}/Calls/{sid}.json",
+    }
+
+
+@app.post("/2010-04-01/Accounts/{account_sid}/Messages.json")
+async def create_message(account_sid: str, request: Request):
+    form = await request.form()
+    await asyncio.sleep(config["latency"])
+    _count_rate(_recent_messages, "max_mps")
+    stats["messages"] += 1
+    sid = _sid("SM")
+    outcome = random.choices(list(config["sms_outcomes"]), weights=list(config["sms_outcomes"].values()))[0]
+    stats["sms_outcomes"][outcome] = stats["sms_outcomes"].get(outcome, 0) + 1
+    if form.get("StatusCallback"):
+        status, _, error_code = outcome.partition(":")
+        data = {"MessageSid": sid, "AccountSid": account_sid, "MessageStatus": status}
+        if error_code:
+            data["ErrorCode"] = error_code
+        _schedule_callback(form["StatusCallback"], config["delivery"], data)
+    return {
+        "sid": sid, "account_sid": account_sid, "to": form.get("To"), "from": form.get("From"),
+        "body": form.get("Body"), "status": "queued", "direction": "outbound-api",
+        "uri": f"/2010-04-01/Accounts/{account_sid}/Messages/{sid}.json",
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=7070)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--ring-seconds", type=float, default=3)
+    parser.add_argument("--outcomes", default="completed=0.6,busy=0.2,no-answer=0.2")
+    parser.add_argument("--sms-outcomes", default="delivered=1")
+    parser.add_argument("--delivery-seconds", type=float, default=1)
+    parser.add_argument("--callback-scheme", help="Rewrite StatusCallback URLs, e.g. http for a local server")
+    args = parser.parse_args()
+
+    config.update(
+        latency=args.latency_ms / 1000, ring=args.ring_seconds,
+        outcomes=_parse_outcomes(args.outcomes), callback_scheme=args.callback_scheme,
+        delivery=args.delivery_seconds, sms_outcomes=_parse_outcomes(args.sms_outcomes),
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
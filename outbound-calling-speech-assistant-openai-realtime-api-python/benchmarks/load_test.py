@@ -0,0 +1,398 @@
+"""
+Load test: how many concurrent calls one server worker carries before audio degrades.
+
+Usage:
+    python benchmarks/load_test.py [--levels 1,2,4,8,16,32] [--duration 20] [--wav caller.wav ...]
+        [--server http://127.0.0.1:6060] [--min-calls 8]
+
+Runs fully offline. Unless --server is given it starts benchmarks/fake_gemini_live.py
+and main.py (in a scratch directory, against a scratch SQLite database) itself.
+For each concurrency level it opens that many /media-stream websockets the way
+Twilio does and streams 20ms mu-law frames at real-time pace from the WAV
+fixtures (a synthetic caller is generated when none are given). The fake
+Gemini echoes each utterance back, every few turns after a scripted tool call.
+
+Per level it reports:
+  latency   end of caller speech -> first answer frame back (includes the fake's --eos-ms)
+  jitter    deviation of answer frame spacing from 20ms
+  underruns answer frames that arrived after they were due to play
+  cpu/call  server CPU per call (% of one core), from process_cpu_seconds_total on /metrics
+  loop lag  server event-loop lag p99, from /metrics
+The knee is the highest level before one fails: a call errors, underruns
+exceed --max-underrun, or p95 latency grows more than --latency-budget-ms over
+the first level. --min-calls makes the exit status fail below a given knee,
+for use as a regression gate.
+
+The load generator and the fake Gemini run on the same machine as the
+server; numbers only describe the server while the "client" column (how late
+the generator sent its own frames) stays near zero.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import wave
+from math import gcd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+from scipy.signal import resample_poly  # noqa: E402
+from websockets.asyncio.client import connect  # noqa: E402
+
+from audio_codec import ulaw_encode  # noqa: E402
+from inbound_stage import INBOUND_SILENCE_RMS  # noqa: E402
+
+FRAME_SECONDS = 0.02
+FRAME_BYTES = 160
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def synth_caller(path: str, seconds: float = 12.0, rate: int = 8000):
+    """Writes a speech-like test caller: ~1.2s voiced bursts separated by ~3s of room noise."""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(rate * seconds)) / rate
+    signal = rng.normal(0, 30, t.size)
+    start = 0.5
+    while start + 1.2 < seconds:
+        voiced = (t >= start) & (t < start + 1.2)
+        tv = t[voiced] - start
+        # 140Hz glottal-ish harmonics, 4Hz syllable envelope
+        tone = sum(np.sin(2 * np.pi * 140 * k * tv) / k for k in range(1, 6))
+        signal[voiced] += 5000 * tone * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * tv) ** 2)
+        start += 1.2 + 3.0
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(np.clip(signal, -32768, 32767).astype(np.int16).tobytes())
+
+
+def load_fixture(path: str) -> list[tuple[bytes, bool]]:
+    """WAV (16-bit PCM, any rate / channels) -> [(20ms mu-law frame, voiced)]."""
+    with wave.open(path, "rb") as w:
+        if w.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV files are supported")
+        rate, channels = w.getframerate(), w.getnchannels()
+        samples = np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16)
+    samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != 8000:
+        g = gcd(rate, 8000)
+        samples = resample_poly(samples, 8000 // g, rate // g)
+    samples = np.clip(samples, -32768, 32767).astype(np.int16)
+    frames = []
+    for i in range(0, samples.size - FRAME_BYTES + 1, FRAME_BYTES):
+        frame = samples[i:i + FRAME_BYTES]
+        level = np.sqrt(np.mean(frame.astype(np.float32) ** 2))
+        frames.append((ulaw_encode(frame), level >= INBOUND_SILENCE_RMS))
+    return frames
+
+
+class CallResult:
+    def __init__(self):
+        self.latencies = []     # seconds, end of caller speech -> first answer frame
+        self.gaps = []          # seconds between consecutive answer frames
+        self.frames_in = 0
+        self.underruns = 0
+        self.send_lag = []      # how late this client sent its own frames
+        self.error = None
+
+
+async def run_call(ws_url: str, fixture: list, duration: float, lead_frames: int) -> CallResult:
+    result = CallResult()
+    stream_sid = "MZ" + uuid.uuid4().hex
+    call_sid = "CA" + uuid.uuid4().hex
+    speech_ended_at = None
+    try:
+        async with connect(ws_url, max_size=None, ping_interval=None) as ws:
+            await ws.send(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+            await ws.send(json.dumps({"event": "start", "sequenceNumber": "1", "streamSid": stream_sid, "start": {
+                "streamSid": stream_sid, "callSid": call_sid, "accountSid": "ACloadtest", "tracks": ["inbound"],
+                "customParameters": {},
+                "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1},
+            }}))
+
+            async def receive():
+                nonlocal speech_ended_at
+                t0 = last = None
+                index = 0
+                async for raw in ws:
+                    now = time.perf_counter()
+                    data = json.loads(raw)
+                    if data["event"] == "media":
+                        result.frames_in += 1
+                        if t0 is None:
+                            # First frame of an answer; Twilio starts playing it now
+                            t0, index = now, 0
+                            if speech_ended_at is not None:
+                                result.latencies.append(now - speech_ended_at)
+                                speech_ended_at = None
+                        else:
+                            index += 1
+                            if index > lead_frames:
+                                result.gaps.append(now - last)
+                            if now > t0 + index * FRAME_SECONDS:
+                                result.underruns += 1
+                        last = now
+                    elif data["event"] == "mark":
+                        # End of the answer; Twilio echoes marks once played
+                        t0 = None
+                        await ws.send(json.dumps({"event": "mark", "streamSid": stream_sid, "mark": data["mark"]}))
+                    elif data["event"] == "clear":
+                        t0 = None
+
+            receiver = asyncio.create_task(receive())
+            start = time.perf_counter()
+            i = 0
+            while True:
+                due = start + i * FRAME_SECONDS
+                if due - start >= duration:
+                    break
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    result.send_lag.append(-delay)
+                frame, voiced = fixture[i % len(fixture)]
+                next_voiced = fixture[(i + 1) % len(fixture)][1]
+                await ws.send(json.dumps({"event": "media", "streamSid": stream_sid, "media": {
+                    "track": "inbound", "chunk": str(i + 1), "timestamp": str(i * 20),
+                    "payload": base64.b64encode(frame).decode("ascii"),
+                }}))
+                if voiced and not next_voiced:
+                    speech_ended_at = time.perf_counter()
+                i += 1
+                if receiver.done():
+                    receiver.result()
+                    raise RuntimeError("server closed the stream")
+            await ws.send(json.dumps({"event": "stop", "streamSid": stream_sid, "stop": {"callSid": call_sid}}))
+            receiver.cancel()
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    return result
+
+
+def parse_metrics(text: str) -> dict:
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, _, value = line.rpartition(" ")
+            samples[name] = float(value)
+    return samples
+
+
+def histogram_quantile(before: dict, after: dict, name: str, q: float) -> float | None:
+    """Upper bucket bound of the q-quantile of the observations between two scrapes."""
+    buckets = []
+    for key, value in after.items():
+        m = re.fullmatch(rf'{name}_bucket\{{le="([^"]+)"\}}', key)
+        if m:
+            buckets.append((float(m.group(1)), value - before.get(key, 0)))
+    buckets.sort()
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    for bound, cumulative in buckets:
+        if cumulative >= q * buckets[-1][1]:
+            return bound
+    return None
+
+
+def pct(values: list, q: float) -> float:
+    return float(np.percentile(values, q)) * 1000 if values else float("nan")
+
+
+async def run_level(base_url: str, calls: int, duration: float, fixture: list, lead_frames: int) -> dict:
+    ws_url = base_url.replace("http", "ws", 1) + "/media-stream"
+    async with httpx.AsyncClient(base_url=base_url, timeout=10) as http:
+        before = parse_metrics((await http.get("/metrics")).text)
+        wall = time.perf_counter()
+
+        async def staggered(i):
+            # Calls don't all connect in the same millisecond
+            await asyncio.sleep(i * min(1.0, duration / 4) / calls)
+            return await run_call(ws_url, fixture, duration, lead_frames)
+
+        results = await asyncio.gather(*(staggered(i) for i in range(calls)))
+        wall = time.perf_counter() - wall
+        await asyncio.sleep(0.5)
+        after = parse_metrics((await http.get("/metrics")).text)
+
+    cpu = after.get("process_cpu_seconds_total", 0) - before.get("process_cpu_seconds_total", 0)
+    latencies = [x for r in results for x in r.latencies]
+    gaps = [abs(x - FRAME_SECONDS) for r in results for x in r.gaps]
+    frames_in = sum(r.frames_in for r in results)
+    lag = histogram_quantile(before, after, "event_loop_lag_seconds", 0.99)
+    return {
+        "calls": calls,
+        "errors": [r.error for r in results if r.error],
+        "latency_p50": pct(latencies, 50),
+        "latency_p95": pct(latencies, 95),
+        "latency_p99": pct(latencies, 99),
+        "jitter_p50": pct(gaps, 50),
+        "jitter_p99": pct(gaps, 99),
+        "underrun_rate": sum(r.underruns for r in results) / frames_in if frames_in else 1.0,
+        "answers": len(latencies),
+        "cpu_per_call": cpu / wall / calls * 100,
+        "loop_lag_p99": lag * 1000 if lag is not None else float("nan"),
+        "client_lag_max": max((x for r in results for x in r.send_lag), default=0.0) * 1000,
+    }
+
+
+def port_open(port: int) -> bool:
+    try:
+        socket.create_connection(("127.0.0.1", port), timeout=1).close()
+        return True
+    except OSError:
+        return False
+
+
+def wait_for(port: int, proc: subprocess.Popen, what: str, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{what} exited with code {proc.returncode}")
+        if port_open(port):
+            return
+        time.sleep(0.2)
+    raise RuntimeError(f"{what} did not start")
+
+
+def wait_ready(base_url: str, proc: subprocess.Popen, timeout: float = 60):
+    """
+    Waits for /readyz and for the optional subsystems too: the server accepts
+    requests before its subsystems have started, and a background import still
+    running would show up as loop lag in the first level.
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"main.py exited with code {proc.returncode}")
+        response = httpx.get(f"{base_url}/readyz")
+        states = [s["state"] for s in response.json()["subsystems"].values()]
+        if response.status_code == 200 and all(state in ("ready", "failed") for state in states):
+            return
+        time.sleep(0.2)
+    raise RuntimeError("main.py did not become ready")
+
+
+def start_stack(args, workdir: str) -> list[subprocess.Popen]:
+    """Fake Gemini + main.py in `workdir`; returns the processes."""
+    for port in (args.port, args.gemini_port):
+        if port_open(port):
+            raise RuntimeError(f"port {port} is already in use")
+    cert_dir = os.path.join(workdir, "cert")
+    log = open(os.path.join(workdir, "server.log"), "w")
+    gemini = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "fake_gemini_live.py"), "--port", str(args.gemini_port),
+        "--cert-dir", cert_dir, "--eos-ms", str(args.eos_ms), "--tool-every", str(args.tool_every),
+    ], stdout=log, stderr=subprocess.STDOUT)
+    wait_for(args.gemini_port, gemini, "fake Gemini")
+
+    env = {
+        **os.environ,
+        "GEMINI_API_KEY": "load-test",
+        "GEMINI_BASE_URL": f"https://127.0.0.1:{args.gemini_port}",
+        "SSL_CERT_FILE": os.path.join(cert_dir, "cert.pem"),
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'load_test.db')}",
+        "PORT": str(args.port),
+        "DOMAIN": f"127.0.0.1:{args.port}",
+        "PYTHONUNBUFFERED": "1",
+    }
+    app_dir = os.path.dirname(BENCH_DIR)
+    # Demo leads and products, so scripted check_inventory calls find something
+    subprocess.check_call([sys.executable, os.path.join(app_dir, "seed.py"), "--skip-kb"],
+                          cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(app_dir, "main.py")],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    try:
+        wait_for(args.port, server, "main.py")
+        wait_ready(f"http://127.0.0.1:{args.port}", server)
+    except Exception:
+        gemini.terminate()
+        server.terminate()
+        raise
+    return [gemini, server]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", default="1,2,4,8,16,32", help="comma-separated concurrent call counts")
+    parser.add_argument("--duration", type=float, default=20, help="seconds each call streams")
+    parser.add_argument("--wav", nargs="*", default=[], help="caller fixtures (16-bit PCM WAV)")
+    parser.add_argument("--server", help="test a running server instead of starting one (it must use a fake Gemini)")
+    parser.add_argument("--port", type=int, default=6065)
+    parser.add_argument("--gemini-port", type=int, default=7443)
+    parser.add_argument("--eos-ms", type=float, default=300, help="fake Gemini end-of-speech wait")
+    parser.add_argument("--tool-every", type=int, default=3)
+    parser.add_argument("--lead-ms", type=float, default=100, help="the server's OUTBOUND_LEAD_MS")
+    parser.add_argument("--max-underrun", type=float, default=0.01, help="fraction of answer frames")
+    parser.add_argument("--latency-budget-ms", type=float, default=150)
+    parser.add_argument("--min-calls", type=int, default=0, help="exit 1 if the knee is below this")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    wavs = args.wav
+    if not wavs:
+        wavs = [os.path.join(workdir, "caller.wav")]
+        synth_caller(wavs[0])
+    fixtures = [load_fixture(path) for path in wavs]
+    levels = [int(x) for x in args.levels.split(",")]
+    lead_frames = int(args.lead_ms / 1000 / FRAME_SECONDS)
+
+    procs = []
+    base_url = args.server
+    if not base_url:
+        procs = start_stack(args, workdir)
+        base_url = f"http://127.0.0.1:{args.port}"
+        print(f"Server and fake Gemini logs: {os.path.join(workdir, 'server.log')}")
+
+    print(f"{args.duration:.0f}s per call, fake end-of-speech wait {args.eos_ms:.0f}ms\n")
+    print(f"{'calls':>5}  {'err':>3}  {'lat p50':>7}  {'p95':>6}  {'p99':>6}  {'jit p50':>7}  {'p99':>5}"
+          f"  {'underrun':>8}  {'cpu/call':>8}  {'loop p99':>8}  {'client':>6}")
+    rows = []
+    knee = 0
+    try:
+        for calls in levels:
+            fixture = fixtures[len(rows) % len(fixtures)]
+            r = asyncio.run(run_level(base_url, calls, args.duration, fixture, lead_frames))
+            rows.append(r)
+            print(f"{calls:>5}  {len(r['errors']):>3}  {r['latency_p50']:>7.0f}  {r['latency_p95']:>6.0f}"
+                  f"  {r['latency_p99']:>6.0f}  {r['jitter_p50']:>7.1f}  {r['jitter_p99']:>5.1f}"
+                  f"  {r['underrun_rate']:>8.2%}  {r['cpu_per_call']:>7.1f}%  {r['loop_lag_p99']:>8.1f}"
+                  f"  {r['client_lag_max']:>6.0f}", flush=True)
+            for error in r["errors"][:3]:
+                print(f"       error: {error}")
+            baseline = rows[0]["latency_p95"]
+            ok = (not r["errors"] and r["answers"] and r["underrun_rate"] <= args.max_underrun
+                  and r["latency_p95"] <= baseline + args.latency_budget_ms)
+            if not ok:
+                break
+            knee = calls
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    print(f"\n(ms; cpu/call in % of one core; client = worst lateness of the load generator itself)")
+    print(f"Knee: {knee} concurrent calls")
+    if args.min_calls and knee < args.min_calls:
+        print(f"FAIL: knee below --min-calls {args.min_calls}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
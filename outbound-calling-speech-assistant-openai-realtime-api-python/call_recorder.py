@@ -0,0 +1,177 @@
+import os
+import re
+import time
+import wave
+import asyncio
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from audio_codec import ULAW_DECODE_TABLE
+from interaction_log import interaction_log
+
+# Optional per-call recording of both legs, for QA and disputes.
+# The taps copy 8kHz mu-law frames as they cross the relay (caller audio as it
+# arrives from Twilio, agent audio as the pacer hands it to Twilio, so cleared
+# barge-in audio is not recorded) into two preallocated ring buffers: a slice
+# assignment, no allocation. The caller leg is the clock; agent frames land
+# at the caller's current position, so the legs stay aligned through the
+# agent's silences. Every RECORDING_FLUSH_SECONDS one writer thread decodes
+# the settled part of the rings straight into a stereo 16-bit WAV
+# (left = caller, right = agent) and hands the space back. Memory per call is
+# fixed by RECORDING_BUFFER_SECONDS whatever the call length; if the disk
+# falls that far behind, frames are dropped rather than buffered. Each
+# finished file is logged as a "recording" Interaction on the lead.
+# With RECORD_CALLS off, open() returns None and the taps are a None check.
+
+RECORD_CALLS = os.getenv("RECORD_CALLS", "false").lower() in ("1", "true", "yes")
+RECORDINGS_DIR = os.getenv("RECORDINGS_DIR", "./recordings")
+# Ring size per leg; bounds memory per call and how far the writer may lag
+RECORDING_BUFFER_SECONDS = float(os.getenv("RECORDING_BUFFER_SECONDS", 20))
+RECORDING_FLUSH_SECONDS = float(os.getenv("RECORDING_FLUSH_SECONDS", 2))
+
+SAMPLE_RATE = 8000
+ULAW_SILENCE = 0xFF
+# Samples decoded per writer step (sizes the writer's scratch buffer)
+WRITE_BLOCK = SAMPLE_RATE
+
+_SAFE_NAME = re.compile(r"[^A-Za-z0-9_-]")
+# One thread for every call keeps each file's writes in order
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recorder")
+
+
+class CallRecording:
+    """One call's two legs in fixed-size mu-law rings, spilled to a WAV by the writer thread."""
+
+    def __init__(self, name: str, path: str, buffer_seconds: float = RECORDING_BUFFER_SECONDS,
+                 flush_seconds: float = RECORDING_FLUSH_SECONDS):
+        self.name = name
+        self.path = path
+        self.size = int(buffer_seconds * SAMPLE_RATE)
+        self.flush_samples = min(int(flush_seconds * SAMPLE_RATE), self.size // 2)
+        self.caller = bytearray([ULAW_SILENCE]) * self.size
+        self.agent = bytearray([ULAW_SILENCE]) * self.size
+        self._caller_view = np.frombuffer(self.caller, dtype=np.uint8)
+        self._agent_view = np.frombuffer(self.agent, dtype=np.uint8)
+        self._pcm = np.zeros((WRITE_BLOCK, 2), dtype=np.int16)
+        # Absolute sample positions: next caller / agent sample, and what the writer has taken
+        self.caller_pos = 0
+        self.agent_pos = 0
+        self.written = 0
+        self._flushing = False
+        self._wav = None
+        self.dropped_frames = 0
+        self.started = time.monotonic()
+
+    @staticmethod
+    def _put(ring: bytearray, size: int, pos: int, frame: bytes):
+        start = pos % size
+        end = start + len(frame)
+        if end <= size:
+            ring[start:end] = frame
+        else:
+            split = size - start
+            ring[start:] = frame[:split]
+            ring[:end - size] = frame[split:]
+
+    def inbound(self, frame: bytes):
+        """Caller tap (mu-law from Twilio)."""
+        if self.caller_pos + len(frame) - self.written > self.size:
+            self.dropped_frames += 1
+            return
+        self._put(self.caller, self.size, self.caller_pos, frame)
+        self.caller_pos += len(frame)
+        if self.caller_pos - self.written >= self.flush_samples and not self._flushing:
+            self._flushing = True
+            _executor.submit(self._spill, self.caller_pos)
+
+    def outbound(self, frame: bytes):
+        """Agent tap (mu-law as sent to Twilio)."""
+        pos = max(self.agent_pos, self.caller_pos)
+        if pos + len(frame) - self.written > self.size:
+            self.dropped_frames += 1
+            return
+        self._put(self.agent, self.size, pos, frame)
+        self.agent_pos = pos + len(frame)
+
+    # Writer thread. It owns [written, end) of both rings: the caller tap only
+    # writes at caller_pos >= end, the agent tap at max(agent_pos, caller_pos).
+
+    def _spill(self, end: int):
+        try:
+            if self._wav is None:
+                self._wav = wave.open(self.path, "wb")
+                self._wav.setnchannels(2)
+                self._wav.setsampwidth(2)
+                self._wav.setframerate(SAMPLE_RATE)
+            pos = self.written
+            while pos < end:
+                start = pos % self.size
+                n = min(end - pos, WRITE_BLOCK, self.size - start)
+                pcm = self._pcm[:n]
+                np.take(ULAW_DECODE_TABLE, self._caller_view[start:start + n], out=pcm[:, 0])
+                np.take(ULAW_DECODE_TABLE, self._agent_view[start:start + n], out=pcm[:, 1])
+                # The agent leg has gaps; reset the space before it comes round again
+                self._agent_view[start:start + n] = ULAW_SILENCE
+                self._wav.writeframesraw(pcm)
+                pos += n
+                self.written = pos
+        except Exception as e:
+            print(f"Recording {self.path} write failed: {e}")
+        finally:
+            self._flushing = False
+
+    def _finish(self) -> float:
+        self._spill(max(self.caller_pos, self.agent_pos))
+        if self._wav is not None:
+            self._wav.close()
+        return self.written / SAMPLE_RATE
+
+
+class CallRecorder:
+    def __init__(self, enabled: bool = RECORD_CALLS, directory: str = RECORDINGS_DIR):
+        self.enabled = enabled
+        self.directory = directory
+        self.stats = {"recordings": 0, "seconds": 0.0, "dropped_frames": 0}
+
+    def open(self, call_sid: str) -> CallRecording | None:
+        if not self.enabled:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        name = _SAFE_NAME.sub("", call_sid or "") or f"call-{int(time.time() * 1000)}"
+        return CallRecording(name, os.path.join(self.directory, f"{name}.wav"))
+
+    async def close(self, recording: CallRecording) -> float:
+        """Writes out what's left and closes the file; returns the recorded seconds."""
+        seconds = await asyncio.get_running_loop().run_in_executor(_executor, recording._finish)
+        self.stats["recordings"] += 1
+        self.stats["seconds"] += seconds
+        self.stats["dropped_frames"] += recording.dropped_frames
+        return seconds
+
+    @contextlib.asynccontextmanager
+    async def record(self, call_sid: str, lead_id: int, pacer):
+        """Records the call while open (yields None when recording is off) and logs the file on the lead."""
+        recording = self.open(call_sid)
+        if recording is None:
+            yield None
+            return
+        pacer.tap = recording.outbound
+        try:
+            yield recording
+        finally:
+            pacer.tap = None
+            seconds = await self.close(recording)
+            if recording.dropped_frames:
+                print(f"Recording {recording.path} dropped {recording.dropped_frames} frames (disk too slow)")
+            if seconds:
+                await interaction_log.log(lead_id, "recording", f"Call recording ({seconds:.0f}s): /recordings/{recording.name}")
+
+    def path_for(self, name: str) -> str | None:
+        """Recording file for a call SID, if there is one."""
+        path = os.path.join(self.directory, f"{_SAFE_NAME.sub('', name)}.wav")
+        return path if os.path.isfile(path) else None
+
+
+recorder = CallRecorder()
@@ -0,0 +1,453 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import contextlib
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, delete, func, literal, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database import async_database_url
+
+# Shared call registry for running several workers (processes or nodes).
+# Call state (Gemini session, pacer, transcoders) has to live in the worker
+# that holds the Twilio media stream, so /incoming-call pins each stream to a
+# worker: it picks a live worker with free capacity and hands Twilio that
+# worker's own stream URL. Workers heartbeat their URL and capacity; each call
+# is one row (call SID, lead, owning worker, start time) removed on hangup.
+#
+# CALL_REGISTRY_URL selects the backend:
+#   memory://                  one worker (default)
+#   sqlite:///call_registry.db workers on one host
+#   postgresql://... / redis://host:6379/0   workers on several nodes
+
+CALL_REGISTRY_URL = os.getenv("CALL_REGISTRY_URL", "memory://")
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+_domain = (os.getenv("DOMAIN") or "").replace("http://", "").replace("https://", "").replace("/", "")
+# Public wss:// base that reaches this worker; {WORKER_STREAM_URL}/media-stream is given to Twilio
+WORKER_STREAM_URL = os.getenv("WORKER_STREAM_URL") or f"wss://{_domain}"
+# Concurrent calls this worker accepts
+WORKER_MAX_CALLS = int(os.getenv("WORKER_MAX_CALLS", 50))
+REGISTRY_HEARTBEAT_SECONDS = float(os.getenv("REGISTRY_HEARTBEAT_SECONDS", 5))
+# Workers silent for this long are considered dead and get no calls
+REGISTRY_WORKER_TTL_SECONDS = float(os.getenv("REGISTRY_WORKER_TTL_SECONDS", 15))
+# A routed / dialed call holds its slot this long before its stream has to start
+REGISTRY_ROUTE_TTL_SECONDS = float(os.getenv("REGISTRY_ROUTE_TTL_SECONDS", 90))
+
+
+class CallRegistry:
+    """
+    Backend-independent registry API. Failures are logged and never fail a call:
+    routing falls back to this worker, bookkeeping is skipped.
+    """
+
+    def __init__(self, worker_id: str = WORKER_ID, stream_url: str = WORKER_STREAM_URL, capacity: int = WORKER_MAX_CALLS):
+        self.worker_id = worker_id
+        self.stream_url = stream_url
+        self.capacity = capacity
+        self._task = None
+        self.stats = {"routed": 0, "full": 0, "errors": 0}
+        # Set to the admission controller's check: a worker shedding load advertises no capacity
+        self.accepting = lambda: True
+
+    def local_worker(self) -> dict:
+        return {"worker_id": self.worker_id, "stream_url": self.stream_url, "capacity": self.capacity}
+
+    async def start(self):
+        await self._open()
+        await self._heartbeat()
+        self._task = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+        with contextlib.suppress(Exception):
+            await self._remove_worker(self.worker_id)
+        await self._close()
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(REGISTRY_HEARTBEAT_SECONDS)
+            try:
+                await self._heartbeat()
+            except Exception as e:
+                print(f"Call registry heartbeat failed: {e}")
+
+    async def _heartbeat(self):
+        capacity = self.capacity if self.accepting() else 0
+        await self._put_worker(self.worker_id, self.stream_url, capacity, time.time())
+
+    async def route(self, call_sid: str, lead_id: int = None) -> dict | None:
+        """Worker that should take this call's media stream; None if every worker is full."""
+        if not call_sid:
+            return self.local_worker()
+        try:
+            worker = await self._route(call_sid, lead_id, time.time())
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Call registry route failed ({e}); keeping call {call_sid} on this worker")
+            return self.local_worker()
+        if worker is None:
+            self.stats["full"] += 1
+        else:
+            self.stats["routed"] += 1
+        return worker
+
+    async def assign(self, call_sid: str, lead_id: int = None):
+        """Dialed from this worker: route the answered call back here (its warm session lives here)."""
+        await self._safe(self._put_call, call_sid, lead_id, self.worker_id, "routed", time.time())
+
+    @contextlib.asynccontextmanager
+    async def stream(self, call_sid: str, lead_id: int = None):
+        """Registers the call's media stream on this worker while it is open."""
+        await self._safe(self._put_call, call_sid, lead_id, self.worker_id, "streaming", time.time())
+        try:
+            yield
+        finally:
+            await self.end(call_sid)
+
+    async def end(self, call_sid: str):
+        """Hangup: forget the call."""
+        await self._safe(self._delete_call, call_sid)
+
+    async def workers(self) -> list[dict]:
+        """Live workers with their current load."""
+        return await self._workers(time.time())
+
+    async def _safe(self, fn, call_sid, *args):
+        if not call_sid:
+            return
+        try:
+            await fn(call_sid, *args)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Call registry update for {call_sid} failed: {e}")
+
+    def summary(self) -> dict:
+        return {"worker_id": self.worker_id, "backend": type(self).__name__, **self.stats}
+
+    # Backend hooks
+    async def _open(self):
+        pass
+
+    async def _close(self):
+        pass
+
+
+class MemoryCallRegistry(CallRegistry):
+    """In-process registry: a single worker, or tests."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._workers_by_id = {}
+        self._calls = {}
+
+    def _load(self, worker_id: str, now: float) -> int:
+        route_cutoff = now - REGISTRY_ROUTE_TTL_SECONDS
+        return sum(
+            1 for c in self._calls.values()
+            if c["worker_id"] == worker_id and (c["status"] == "streaming" or c["updated_at"] > route_cutoff)
+        )
+
+    def _live(self, now: float) -> list[dict]:
+        return [w for w in self._workers_by_id.values() if w["heartbeat_at"] > now - REGISTRY_WORKER_TTL_SECONDS]
+
+    async def _put_worker(self, worker_id, stream_url, capacity, now):
+        self._workers_by_id[worker_id] = {"worker_id": worker_id, "stream_url": stream_url, "capacity": capacity, "heartbeat_at": now}
+
+    async def _remove_worker(self, worker_id):
+        self._workers_by_id.pop(worker_id, None)
+        for sid in [sid for sid, c in self._calls.items() if c["worker_id"] == worker_id]:
+            del self._calls[sid]
+
+    async def _route(self, call_sid, lead_id, now):
+        live = {w["worker_id"]: w for w in self._live(now)}
+        call = self._calls.get(call_sid)
+        if call and call["worker_id"] in live:
+            return live[call["worker_id"]]
+        self._calls.pop(call_sid, None)
+        free = [(w["capacity"] - self._load(w["worker_id"], now), w) for w in live.values()]
+        free = [(n, w) for n, w in free if n > 0]
+        if not free:
+            return None
+        worker = max(free, key=lambda item: item[0])[1]
+        await self._put_call(call_sid, lead_id, worker["worker_id"], "routed", now)
+        return worker
+
+    async def _put_call(self, call_sid, lead_id, worker_id, status, now):
+        previous = self._calls.get(call_sid)
+        self._calls[call_sid] = {
+            "call_sid": call_sid,
+            "lead_id": lead_id if lead_id is not None else (previous or {}).get("lead_id"),
+            "worker_id": worker_id,
+            "status": status,
+            "started_at": now if status == "streaming" or previous is None else previous["started_at"],
+            "updated_at": now,
+        }
+
+    async def _delete_call(self, call_sid):
+        self._calls.pop(call_sid, None)
+
+    async def _workers(self, now):
+        return [{**w, "active": self._load(w["worker_id"], now)} for w in self._live(now)]
+
+
+_metadata = MetaData()
+registry_workers = Table(
+    "registry_workers", _metadata,
+    Column("worker_id", String, primary_key=True),
+    Column("stream_url", String, nullable=False),
+    Column("capacity", Integer, nullable=False),
+    Column("heartbeat_at", Float, nullable=False),
+)
+registry_calls = Table(
+    "registry_calls", _metadata,
+    Column("call_sid", String, primary_key=True),
+    Column("lead_id", Integer),
+    Column("worker_id", String, nullable=False, index=True),
+    Column("status", String, nullable=False),  # routed | streaming
+    Column("started_at", Float, nullable=False),
+    Column("updated_at", Float, nullable=False),
+)
+
+
+class SQLCallRegistry(CallRegistry):
+    """SQLite file (workers on one host) or PostgreSQL (several nodes)."""
+
+    def __init__(self, url: str, **kwargs):
+        super().__init__(**kwargs)
+        self.url = async_database_url(url)
+
+    async def _open(self):
+        self.engine = create_async_engine(self.url, pool_pre_ping=True)
+        if self.engine.dialect.name == "sqlite":
+            from sqlalchemy import event
+
+            @event.listens_for(self.engine.sync_engine, "connect")
+            def _pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA busy_timeout=5000")
+                cursor.close()
+        async with self.engine.begin() as conn:
+            await conn.run_sync(_metadata.create_all)
+
+    async def _close(self):
+        await self.engine.dispose()
+
+    def _upsert(self, table, values: dict, keys: list[str], insert_only: tuple = ()):
+        """INSERT, or UPDATE every column but the keys and `insert_only` ones on conflict."""
+        insert = (postgresql if self.engine.dialect.name == "postgresql" else sqlite).insert
+        stmt = insert(table).values(**values)
+        return stmt.on_conflict_do_update(
+            index_elements=keys, set_={k: stmt.excluded[k] for k in values if k not in keys and k not in insert_only}
+        )
+
+    @staticmethod
+    def _load(now: float):
+        """Correlated count of the calls holding a slot on registry_workers' current row."""
+        c = registry_calls.c
+        return (
+            select(func.count())
+            .where(c.worker_id == registry_workers.c.worker_id,
+                   or_(c.status == "streaming", c.updated_at > now - REGISTRY_ROUTE_TTL_SECONDS))
+            .scalar_subquery()
+        )
+
+    async def _put_worker(self, worker_id, stream_url, capacity, now):
+        async with self.engine.begin() as conn:
+            await conn.execute(self._upsert(registry_workers, {
+                "worker_id": worker_id, "stream_url": stream_url, "capacity": capacity, "heartbeat_at": now,
+            }, ["worker_id"]))
+
+    async def _remove_worker(self, worker_id):
+        async with self.engine.begin() as conn:
+            await conn.execute(delete(registry_calls).where(registry_calls.c.worker_id == worker_id))
+            await conn.execute(delete(registry_workers).where(registry_workers.c.worker_id == worker_id))
+
+    async def _route(self, call_sid, lead_id, now):
+        w, c = registry_workers.c, registry_calls.c
+        live = w.heartbeat_at > now - REGISTRY_WORKER_TTL_SECONDS
+        async with self.engine.begin() as conn:
+            if self.engine.dialect.name == "postgresql":
+                # Serialize routing decisions (SQLite's single writer already does)
+                await conn.execute(select(w.worker_id).with_for_update())
+            existing = (await conn.execute(
+                select(w.worker_id, w.stream_url, w.capacity)
+                .join(registry_calls, c.worker_id == w.worker_id)
+                .where(c.call_sid == call_sid, live)
+            )).first()
+            if existing:
+                return dict(existing._mapping)
+            await conn.execute(delete(registry_calls).where(c.call_sid == call_sid))
+            load = self._load(now)
+            # Pick the live worker with the most free slots and insert the call in one statement
+            pick = (
+                select(literal(call_sid), literal(lead_id, Integer), w.worker_id, literal("routed"), literal(now), literal(now))
+                .where(live, w.capacity > load)
+                .order_by((w.capacity - load).desc())
+                .limit(1)
+            )
+            await conn.execute(registry_calls.insert().from_select(
+                ["call_sid", "lead_id", "worker_id", "status", "started_at", "updated_at"], pick
+            ))
+            row = (await conn.execute(
+                select(w.worker_id, w.stream_url, w.capacity)
+                .join(registry_calls, c.worker_id == w.worker_id)
+                .where(c.call_sid == call_sid)
+            )).first()
+        return dict(row._mapping) if row else None
+
+    async def _put_call(self, call_sid, lead_id, worker_id, status, now):
+        values = {"call_sid": call_sid, "worker_id": worker_id, "status": status, "updated_at": now, "started_at": now}
+        if lead_id is not None:
+            values["lead_id"] = lead_id
+        async with self.engine.begin() as conn:
+            # Like the memory backend: the stream starting resets started_at, other updates keep it
+            await conn.execute(self._upsert(
+                registry_calls, values, ["call_sid"], insert_only=() if status == "streaming" else ("started_at",)
+            ))
+
+    async def _delete_call(self, call_sid):
+        async with self.engine.begin() as conn:
+            await conn.execute(delete(registry_calls).where(registry_calls.c.call_sid == call_sid))
+
+    async def _workers(self, now):
+        w = registry_workers.c
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(
+                select(w.worker_id, w.stream_url, w.capacity, w.heartbeat_at, self._load(now).label("active"))
+                .where(w.heartbeat_at > now - REGISTRY_WORKER_TTL_SECONDS)
+                .order_by(w.worker_id)
+            )).all()
+        return [dict(r._mapping) for r in rows]
+
+
+# KEYS: workers hash, heartbeat zset, call hash key, key prefix. ARGV: call_sid, lead_id, now, worker_ttl, route_ttl
+# Picks the live worker with the most free slots and files the call under it, atomically.
+_REDIS_ROUTE = """
+local workers, beats, call_key, prefix = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local sid, lead, now = ARGV[1], ARGV[2], tonumber(ARGV[3])
+local live_after, route_after = now - tonumber(ARGV[4]), now - tonumber(ARGV[5])
+local current = redis.call('HGET', call_key, 'worker_id')
+if current and (tonumber(redis.call('ZSCORE', beats, current) or 0) > live_after) then
+    return {current, redis.call('HGET', workers, current)}
+end
+if current then redis.call('ZREM', prefix .. 'load:' .. current, sid) end
+local best, best_free = nil, 0
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', beats, '(' .. live_after, '+inf')) do
+    local load_key = prefix .. 'load:' .. id
+    redis.call('ZREMRANGEBYSCORE', load_key, '-inf', route_after)
+    local info = cjson.decode(redis.call('HGET', workers, id))
+    local free = info.capacity - redis.call('ZCARD', load_key)
+    if free > best_free then best, best_free = id, free end
+end
+if not best then return false end
+redis.call('ZADD', prefix .. 'load:' .. best, now, sid)
+redis.call('HSET', call_key, 'worker_id', best, 'lead_id', lead, 'status', 'routed', 'started_at', now, 'updated_at', now)
+return {best, redis.call('HGET', workers, best)}
+"""
+
+
+class RedisCallRegistry(CallRegistry):
+    """
+    Redis backend (needs `pip install redis`). Per-worker load is a sorted set of
+    call SIDs scored by route time; streaming calls are scored +inf so they
+    never expire.
+    """
+
+    prefix = "callreg:"
+
+    def __init__(self, url: str, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+
+    async def _open(self):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("CALL_REGISTRY_URL is redis:// but the redis package is not installed (pip install redis)")
+        self.redis = redis.from_url(self.url, decode_responses=True)
+        self._route_script = self.redis.register_script(_REDIS_ROUTE)
+
+    async def _close(self):
+        await self.redis.aclose()
+
+    def _key(self, *parts) -> str:
+        return self.prefix + ":".join(parts)
+
+    async def _put_worker(self, worker_id, stream_url, capacity, now):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._key("workers"), worker_id, json.dumps({"stream_url": stream_url, "capacity": capacity}))
+            pipe.zadd(self._key("heartbeats"), {worker_id: now})
+            await pipe.execute()
+
+    async def _remove_worker(self, worker_id):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hdel(self._key("workers"), worker_id)
+            pipe.zrem(self._key("heartbeats"), worker_id)
+            pipe.delete(self._key("load", worker_id))
+            await pipe.execute()
+
+    async def _route(self, call_sid, lead_id, now):
+        result = await self._route_script(
+            keys=[self._key("workers"), self._key("heartbeats"), self._key("call", call_sid), self.prefix],
+            args=[call_sid, "" if lead_id is None else lead_id, now, REGISTRY_WORKER_TTL_SECONDS, REGISTRY_ROUTE_TTL_SECONDS],
+        )
+        if not result:
+            return None
+        worker_id, info = result
+        return {"worker_id": worker_id, **json.loads(info)}
+
+    async def _put_call(self, call_sid, lead_id, worker_id, status, now):
+        call_key = self._key("call", call_sid)
+        previous = await self.redis.hget(call_key, "worker_id")
+        fields = {"worker_id": worker_id, "status": status, "updated_at": now}
+        if status == "streaming":
+            fields["started_at"] = now
+        if lead_id is not None:
+            fields["lead_id"] = lead_id
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if previous and previous != worker_id:
+                pipe.zrem(self._key("load", previous), call_sid)
+            pipe.zadd(self._key("load", worker_id), {call_sid: "+inf" if status == "streaming" else now})
+            pipe.hset(call_key, mapping=fields)
+            # Other updates keep the original started_at (set here only for a new call)
+            pipe.hsetnx(call_key, "started_at", now)
+            # Backstop for calls whose hangup never got recorded
+            pipe.expire(call_key, 24 * 3600)
+            await pipe.execute()
+
+    async def _delete_call(self, call_sid):
+        call_key = self._key("call", call_sid)
+        worker_id = await self.redis.hget(call_key, "worker_id")
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if worker_id:
+                pipe.zrem(self._key("load", worker_id), call_sid)
+            pipe.delete(call_key)
+            await pipe.execute()
+
+    async def _workers(self, now):
+        ids = await self.redis.zrangebyscore(self._key("heartbeats"), f"({now - REGISTRY_WORKER_TTL_SECONDS}", "+inf", withscores=True)
+        workers = []
+        for worker_id, heartbeat_at in ids:
+            info = json.loads(await self.redis.hget(self._key("workers"), worker_id) or "{}")
+            active = await self.redis.zcount(self._key("load", worker_id), now - REGISTRY_ROUTE_TTL_SECONDS, "+inf")
+            workers.append({"worker_id": worker_id, **info, "heartbeat_at": heartbeat_at, "active": active})
+        return workers
+
+
+def create_registry(url: str = CALL_REGISTRY_URL) -> CallRegistry:
+    scheme = url.split(":", 1)[0].lower()
+    if scheme == "memory":
+        return MemoryCallRegistry()
+    if scheme.startswith("redis"):
+        return RedisCallRegistry(url)
+    return SQLCallRegistry(url)
+
+
+call_registry = create_registry()
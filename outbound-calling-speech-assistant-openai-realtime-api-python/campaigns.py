@@ -0,0 +1,334 @@
+import os
+import time
+import asyncio
+import contextlib
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import func, insert, literal, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from database import async_session_maker, Lead, Campaign, CampaignCall
+from lead_queries import search_clause
+from twilio_transport import TwilioError
+
+# Outbound campaign dialer.
+# A campaign snapshots a lead filter into a persistent queue (campaigncall rows).
+# One scheduler task per worker claims due rows and dials them through a
+# token bucket (calls per second), never running more than
+# DIALER_MAX_ACTIVE_CALLS live calls at once; Twilio's status callback reports
+# the outcome, and busy / no-answer / failed calls are retried with backoff, as
+# are dials that hit a network error or a Twilio 5xx; other dial errors are final.
+
+# Twilio's default outbound limit is 1 call per second per account
+DIALER_CPS = float(os.getenv("DIALER_CPS", 1))
+DIALER_BURST = int(os.getenv("DIALER_BURST", 1))
+# Live /media-stream sessions + calls still ringing, per worker
+DIALER_MAX_ACTIVE_CALLS = int(os.getenv("DIALER_MAX_ACTIVE_CALLS", 10))
+DIALER_POLL_SECONDS = float(os.getenv("DIALER_POLL_SECONDS", 1))
+# A dialed call holds its slot until the stream starts or Twilio reports an outcome
+DIALER_RING_TIMEOUT_SECONDS = float(os.getenv("DIALER_RING_TIMEOUT_SECONDS", 60))
+DIALER_RETRY_BASE_SECONDS = float(os.getenv("DIALER_RETRY_BASE_SECONDS", 300))
+DIALER_RETRY_MAX_SECONDS = float(os.getenv("DIALER_RETRY_MAX_SECONDS", 3600))
+
+# Twilio CallStatus values worth another attempt
+RETRY_OUTCOMES = {"busy", "no-answer", "failed"}
+# "canceled" means the call was cancelled through the API (by an operator or by
+# us) on purpose, so like "completed" it is never redialed
+FINAL_OUTCOMES = {"completed", "canceled"}
+TERMINAL_OUTCOMES = RETRY_OUTCOMES | FINAL_OUTCOMES
+
+
+class TokenBucket:
+    """Async token bucket: acquire() waits until a token is available."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff after the given number of attempts."""
+    return min(DIALER_RETRY_MAX_SECONDS, DIALER_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+
+
+async def create_campaign(session: AsyncSession, name: str, lead_status: str = None, query: str = None, max_attempts: int = 3) -> dict:
+    """Creates a draft campaign and queues every lead matching the filter, in one INSERT ... SELECT."""
+    campaign = Campaign(name=name, lead_status=lead_status, query=query, max_attempts=max(1, max_attempts))
+    session.add(campaign)
+    await session.flush()
+
+    now = datetime.utcnow()
+    leads = select(
+        literal(campaign.id), Lead.id, Lead.phone, literal("queued"), literal(0), literal(now), literal(now)
+    )
+    if lead_status:
+        leads = leads.where(Lead.status == lead_status)
+    if query and query.strip():
+        clause = search_clause(query.strip())
+        if clause is not None:
+            leads = leads.where(clause)
+    table = CampaignCall.__table__
+    await session.exec(insert(table).from_select(
+        ["campaign_id", "lead_id", "phone", "status", "attempts", "next_attempt_at", "updated_at"],
+        leads.order_by(Lead.id),
+    ))
+    await session.commit()
+    await session.refresh(campaign)
+    return await campaign_stats(session, campaign)
+
+
+async def campaign_stats(session: AsyncSession, campaign: Campaign) -> dict:
+    """Queue progress: calls per status, attempts made and last outcomes."""
+    by_status = dict((await session.exec(
+        select(CampaignCall.status, func.count()).where(CampaignCall.campaign_id == campaign.id).group_by(CampaignCall.status)
+    )).all())
+    outcomes = dict((await session.exec(
+        select(CampaignCall.outcome, func.count())
+        .where(CampaignCall.campaign_id == campaign.id, CampaignCall.outcome.is_not(None))
+        .group_by(CampaignCall.outcome)
+    )).all())
+    attempts = (await session.exec(
+        select(func.coalesce(func.sum(CampaignCall.attempts), 0)).where(CampaignCall.campaign_id == campaign.id)
+    )).one()
+    total = sum(by_status.values())
+    done = by_status.get("completed", 0) + by_status.get("failed", 0)
+    return {
+        "id": campaign.id,
+        "name": campaign.name,
+        "status": campaign.status,
+        "total": total,
+        "calls": {s: by_status.get(s, 0) for s in ("queued", "dialing", "completed", "failed")},
+        "outcomes": outcomes,
+        "attempts": attempts,
+        "progress": round(done / total, 3) if total else 1.0,
+    }
+
+
+class CampaignDialer:
+    """Per-worker scheduler that drains the queues of running campaigns."""
+
+    def __init__(self, cps: float = DIALER_CPS, burst: int = DIALER_BURST, max_active: int = DIALER_MAX_ACTIVE_CALLS):
+        self.bucket = TokenBucket(cps, burst)
+        self.max_active = max_active
+        # Live /media-stream sessions on this worker, campaign or not
+        self.active_streams = 0
+        # call_sid -> ring deadline for dialed calls that have no stream yet
+        self.ringing = {}
+        # Dial requests still waiting on Twilio
+        self._dials = set()
+        self.place_call = None
+        self._task = None
+        self._wakeup = asyncio.Event()
+        self.stats = {"dialed": 0, "dial_errors": 0, "completed": 0, "retried": 0, "failed": 0}
+
+    def start(self, place_call, admit=None):
+        """
+        place_call(to, lead_id, campaign_call_id) -> call_sid coroutine, e.g. Twilio calls.create;
+        admit() -> False pauses dialing (worker overloaded).
+        """
+        self.place_call = place_call
+        self.admit = admit or (lambda: True)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+        if self._dials:
+            await asyncio.gather(*self._dials, return_exceptions=True)
+
+    def wake(self):
+        self._wakeup.set()
+
+    @contextlib.asynccontextmanager
+    async def stream_slot(self, call_sid: str = None):
+        """Counts a live media stream against this worker's call cap."""
+        self.active_streams += 1
+        self.stream_started(call_sid)
+        try:
+            yield
+        finally:
+            self.active_streams -= 1
+            self.wake()
+
+    def stream_started(self, call_sid: str):
+        # The stream itself now holds the slot
+        self.ringing.pop(call_sid, None)
+
+    def free_slots(self) -> int:
+        now = time.monotonic()
+        for sid in [sid for sid, deadline in self.ringing.items() if deadline < now]:
+            del self.ringing[sid]
+        return self.max_active - self.active_streams - len(self.ringing) - len(self._dials)
+
+    async def _requeue_orphans(self):
+        """Rows left in "dialing" without a call by a crashed worker go back in the queue."""
+        now = datetime.utcnow()
+        # Other workers may be mid-dial on recent rows
+        cutoff = now - timedelta(seconds=DIALER_RING_TIMEOUT_SECONDS)
+        async with async_session_maker() as session:
+            await session.exec(
+                update(CampaignCall)
+                .where(CampaignCall.status == "dialing", CampaignCall.call_sid.is_(None), CampaignCall.updated_at < cutoff)
+                .values(status="queued", updated_at=now)
+            )
+            await session.commit()
+
+    async def _claim_due(self, limit: int) -> list[tuple[int, int, str]]:
+        """Marks up to `limit` due calls of running campaigns as dialing and returns them."""
+        now = datetime.utcnow()
+        async with async_session_maker() as session:
+            rows = (await session.exec(
+                select(CampaignCall.id, CampaignCall.lead_id, CampaignCall.phone)
+                .join(Campaign, Campaign.id == CampaignCall.campaign_id)
+                .where(Campaign.status == "running", CampaignCall.status == "queued", CampaignCall.next_attempt_at <= now)
+                .order_by(CampaignCall.next_attempt_at, CampaignCall.id)
+                .limit(limit)
+            )).all()
+            claimed = []
+            if rows:
+                # Only rows still queued: another worker may have claimed some meanwhile
+                claimed = (await session.exec(
+                    update(CampaignCall)
+                    .where(CampaignCall.id.in_([r[0] for r in rows]), CampaignCall.status == "queued")
+                    .values(status="dialing", attempts=CampaignCall.attempts + 1, call_sid=None, updated_at=now)
+                    .returning(CampaignCall.id, CampaignCall.lead_id, CampaignCall.phone)
+                )).all()
+            await session.commit()
+        return [tuple(r) for r in claimed]
+
+    async def _complete_finished_campaigns(self):
+        async with async_session_maker() as session:
+            pending = select(CampaignCall.id).where(
+                CampaignCall.campaign_id == Campaign.id, CampaignCall.status.in_(["queued", "dialing"])
+            ).exists()
+            await session.exec(
+                update(Campaign).where(Campaign.status == "running", ~pending).values(status="completed")
+            )
+            await session.commit()
+
+    async def run(self):
+        next_sweep = 0.0
+        while True:
+            try:
+                if time.monotonic() >= next_sweep:
+                    await self._requeue_orphans()
+                    next_sweep = time.monotonic() + DIALER_RING_TIMEOUT_SECONDS / 2
+                slots = self.free_slots() if self.admit() else 0
+                due = await self._claim_due(slots) if slots > 0 else []
+                if not due:
+                    if slots > 0:
+                        await self._complete_finished_campaigns()
+                    self._wakeup.clear()
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(self._wakeup.wait(), DIALER_POLL_SECONDS)
+                    continue
+                for call_id, lead_id, phone in due:
+                    await self.bucket.acquire()
+                    # Twilio's response time must not eat into the call rate
+                    task = asyncio.create_task(self._dial(call_id, lead_id, phone))
+                    self._dials.add(task)
+                    task.add_done_callback(self._dials.discard)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Dialer loop error: {e}")
+                await asyncio.sleep(DIALER_POLL_SECONDS)
+
+    async def _dial(self, call_id: int, lead_id: int, phone: str):
+        try:
+            call_sid = await self.place_call(phone, lead_id, call_id)
+        except Exception as e:
+            self.stats["dial_errors"] += 1
+            print(f"Campaign call {call_id} to {phone} failed to dial: {e}")
+            # Network errors and Twilio 5xx may pass next time; a blocked or invalid number (ValueError, 4xx) won't
+            transient = isinstance(e, httpx.HTTPError) or (isinstance(e, TwilioError) and e.status >= 500)
+            await self._record(CampaignCall.id == call_id, "retry" if transient else "failed", f"error: {e}"[:200])
+            return
+        self.stats["dialed"] += 1
+        self.ringing[call_sid] = time.monotonic() + DIALER_RING_TIMEOUT_SECONDS
+        await self._set_call_sid(call_id, call_sid)
+
+    async def _set_call_sid(self, call_id: int, call_sid: str):
+        async with async_session_maker() as session:
+            await session.exec(
+                update(CampaignCall).where(CampaignCall.id == call_id).values(call_sid=call_sid, updated_at=datetime.utcnow())
+            )
+            await session.commit()
+
+    async def _record(self, where, status: str, outcome: str) -> bool:
+        """
+        Applies a call result: "completed", "failed" (final), or "retry" (requeued
+        with backoff until max_attempts, then failed).
+        """
+        async with async_session_maker() as session:
+            row = (await session.exec(
+                select(CampaignCall, Campaign.max_attempts)
+                .join(Campaign, Campaign.id == CampaignCall.campaign_id)
+                .where(where, CampaignCall.status == "dialing")
+            )).first()
+            if row is None:
+                return False
+            call, max_attempts = row
+            call.outcome = outcome
+            call.updated_at = datetime.utcnow()
+            if status == "completed":
+                call.status = "completed"
+                self.stats["completed"] += 1
+            elif status == "retry" and call.attempts < max_attempts:
+                call.status = "queued"
+                call.next_attempt_at = call.updated_at + timedelta(seconds=retry_delay(call.attempts))
+                self.stats["retried"] += 1
+            else:
+                call.status = "failed"
+                self.stats["failed"] += 1
+            session.add(call)
+            await session.commit()
+            return True
+
+    async def on_status(self, call_sid: str, call_status: str) -> bool:
+        """Twilio status callback; returns False for calls the dialer didn't place."""
+        if call_status not in TERMINAL_OUTCOMES:
+            return False
+        self.ringing.pop(call_sid, None)
+        if call_status == "completed":
+            status = "completed"
+        elif call_status in FINAL_OUTCOMES:
+            status = "failed"
+        else:
+            status = "retry"
+        recorded = await self._record(CampaignCall.call_sid == call_sid, status, call_status)
+        self.wake()
+        return recorded
+
+    def summary(self) -> dict:
+        return {
+            **self.stats,
+            "active_streams": self.active_streams,
+            "ringing": len(self.ringing),
+            "max_active": self.max_active,
+            "cps": self.bucket.rate,
+        }
+
+
+dialer = CampaignDialer()
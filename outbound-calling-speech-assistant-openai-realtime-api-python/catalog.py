@@ -0,0 +1,280 @@
+import os
+import re
+import time
+import threading
+from datetime import datetime
+
+import numpy as np
+from sqlmodel import Session, select, func
+
+from database import engine, Product
+
+# Product catalog search for check_inventory.
+# Products are loaded from the `product` table into an in-memory inverted index
+# (word tokens + character trigrams) and ranked with IDF weights, so spoken
+# names like "fifty five inch tv" or "s twenty four ultra" still find the SKU.
+# Numbers in the query must all be in the product name, so a size or model the
+# catalog doesn't carry is reported as not found instead of a neighbouring SKU.
+# Stock/price edits are picked up by a background poll without re-indexing;
+# new, renamed or deleted products trigger a rebuild.
+
+CATALOG_RELOAD_SECONDS = float(os.getenv("CATALOG_RELOAD_SECONDS", 5))
+# Full rebuild regardless of updated_at, for writes that bypass it (e.g. raw SQL on PostgreSQL)
+CATALOG_FULL_RELOAD_SECONDS = float(os.getenv("CATALOG_FULL_RELOAD_SECONDS", 300))
+# Minimum normalized score for a match to be reported as found
+CATALOG_MIN_SCORE = float(os.getenv("CATALOG_MIN_SCORE", 0.35))
+# Score cap for products missing a number from the query (size, model, capacity):
+# "65 inch tv" must not resolve to the 55 inch one, only list it as an alternative
+NUMBER_MISMATCH_SCORE = CATALOG_MIN_SCORE * 0.5
+# Terms present in more than this share of products are too common to rank on
+# ("samsung" is in every name); dropping them keeps posting lists short
+MAX_TOKEN_DF = 0.5
+MAX_TRIGRAM_DF = 0.1
+# Postings longer than this share of the catalog are stored as dense masks:
+# a vectorized masked add beats a scattered fancy-index add at that size
+DENSE_DF = 1 / 32
+
+_UNITS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13,
+    "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19,
+}
+_TENS = {"twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90}
+_SYNONYMS = {
+    "television": "tv", "inches": "inch", "air": "ac", "conditioner": "ac",
+    "smartphone": "phone", "mobile": "phone", "laptops": "laptop",
+}
+_STOPWORDS = {"the", "a", "an", "of", "for", "in", "do", "you", "have", "is", "any", "model"}
+_TOKEN = re.compile(r"[a-z0-9]+")
+_ALNUM_SPLIT = re.compile(r"[a-z]+|[0-9]+")
+
+
+def _words_to_numbers(words: list[str]) -> list[str]:
+    """"fifty five" -> "55", "twenty" -> "20"; other words pass through."""
+    out = []
+    i = 0
+    while i < len(words):
+        word = words[i]
+        if word in _TENS:
+            value = _TENS[word]
+            if i + 1 < len(words) and words[i + 1] in _UNITS and 0 < _UNITS[words[i + 1]] < 10:
+                value += _UNITS[words[i + 1]]
+                i += 1
+            out.append(str(value))
+        elif word in _UNITS:
+            out.append(str(_UNITS[word]))
+        else:
+            out.append(word)
+        i += 1
+    return out
+
+
+def tokenize(text: str) -> list[str]:
+    """Normalized search tokens, including letter/digit splits ("s24" -> s24, s, 24) and joins ("s 24" -> s24)."""
+    words = _words_to_numbers(_TOKEN.findall(text.lower()))
+    tokens = []
+    for i, word in enumerate(words):
+        word = _SYNONYMS.get(word, word)
+        if word in _STOPWORDS:
+            continue
+        # Lone letters ("s", "a") only matter joined to the number that follows
+        if len(word) > 1 or word.isdigit():
+            tokens.append(word)
+        parts = _ALNUM_SPLIT.findall(word)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if len(part) > 1 or part.isdigit())
+        # Spoken model numbers arrive split: "s 24", "a 55"
+        if i + 1 < len(words) and word.isalpha() and len(word) <= 2 and words[i + 1].isdigit():
+            tokens.append(word + words[i + 1])
+    return tokens
+
+
+def trigrams(text: str) -> set[str]:
+    compact = " " + " ".join(_TOKEN.findall(text.lower())) + " "
+    return {compact[i:i + 3] for i in range(len(compact) - 2)}
+
+
+def format_inr(amount: int) -> str:
+    """Indian digit grouping: 400000 -> ₹4,00,000."""
+    digits = str(int(amount))
+    if len(digits) > 3:
+        head, tail = digits[:-3], digits[-3:]
+        groups = []
+        while len(head) > 2:
+            groups.insert(0, head[-2:])
+            head = head[:-2]
+        if head:
+            groups.insert(0, head)
+        digits = ",".join(groups) + "," + tail
+    return f"₹{digits}"
+
+
+class CatalogIndex:
+    """Immutable ranked-search index over a list of product dicts."""
+
+    def __init__(self, products: list[dict]):
+        self.products = products
+        self.by_id = {p["id"]: i for i, p in enumerate(products)}
+        n = max(len(products), 1)
+        token_postings = {}
+        trigram_postings = {}
+        for i, product in enumerate(products):
+            text = f"{product['name']} {product.get('sku') or ''} {product.get('category') or ''}"
+            for token in set(tokenize(text)):
+                token_postings.setdefault(token, []).append(i)
+            for gram in trigrams(product["name"]):
+                trigram_postings.setdefault(gram, []).append(i)
+
+        max_df = max(1, int(n * MAX_TOKEN_DF))
+        self.tokens = {
+            t: self._posting(p, n)
+            for t, p in token_postings.items() if len(p) <= max_df or n < 4
+        }
+        self.common_tokens = {t for t, p in token_postings.items() if t not in self.tokens}
+        # Every token with a digit, however common, for the exact-number check
+        self.numbers = {
+            t: np.array(p, dtype=np.int32)
+            for t, p in token_postings.items() if any(ch.isdigit() for ch in t)
+        }
+        max_df = max(1, int(n * MAX_TRIGRAM_DF))
+        self.trigrams = {
+            g: self._posting(p, n)
+            for g, p in trigram_postings.items() if len(p) <= max_df
+        }
+
+    def _posting(self, ids: list[int], n: int):
+        """(ids or dense 0/1 mask, idf)."""
+        idf = float(np.log(1 + n / len(ids)))
+        if len(ids) > n * DENSE_DF and n >= 1024:
+            mask = np.zeros(len(self.products), dtype=np.uint8)
+            mask[ids] = 1
+            return mask, idf
+        return np.array(ids, dtype=np.int32), idf
+
+    @staticmethod
+    def _accumulate(scores: np.ndarray, scratch: np.ndarray, posting: np.ndarray, weight: float):
+        if posting.dtype == np.uint8:
+            np.multiply(posting, np.float32(weight), out=scratch)
+            scores += scratch
+        else:
+            scores[posting] += weight
+
+    def search(self, query: str, limit: int = 3) -> list[tuple[dict, float]]:
+        """Returns up to `limit` (product, score) pairs, score normalized to 0..1."""
+        if not self.products:
+            return []
+        scores = np.zeros(len(self.products), dtype=np.float32)
+        scratch = np.empty_like(scores)
+        possible = 0.0
+        query_tokens = set(tokenize(query))
+        # Exact tokens count double, trigrams make it tolerant of ASR spelling
+        for token in query_tokens - self.common_tokens:
+            entry = self.tokens.get(token)
+            weight = 2.0 * (entry[1] if entry else 1.0)
+            possible += weight
+            if entry:
+                self._accumulate(scores, scratch, entry[0], weight)
+        for gram in trigrams(" ".join(tokenize(query))):
+            entry = self.trigrams.get(gram)
+            if entry:
+                self._accumulate(scores, scratch, entry[0], entry[1] * 0.25)
+                possible += entry[1] * 0.25
+        if possible == 0:
+            return []
+        # Numbers are decisive: products with every number of the query rank
+        # alone; only if there are none do the others come back, capped
+        capped = False
+        numbers = [t for t in query_tokens if any(ch.isdigit() for ch in t)]
+        if numbers:
+            hits = np.zeros(len(self.products), dtype=np.int32)
+            for token in numbers:
+                ids = self.numbers.get(token)
+                if ids is not None:
+                    hits[ids] += 1
+            complete = np.where(hits == len(numbers), scores, 0)
+            if complete.max() > 0:
+                scores = complete
+            else:
+                capped = True
+        best = float(scores.max())
+        if best <= 0:
+            return []
+        # Anything under half the best score is noise; this keeps the partition tiny
+        candidates = np.flatnonzero(scores >= best * 0.5)
+        if candidates.size > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        top = candidates[np.argsort(-scores[candidates], kind="stable")]
+        cap = NUMBER_MISMATCH_SCORE if capped else 1.0
+        return [(self.products[i], min(cap, float(scores[i]) / possible)) for i in top]
+
+
+class Catalog:
+    """DB-backed catalog: builds a CatalogIndex and keeps stock/price current."""
+
+    def __init__(self):
+        self.index = CatalogIndex([])
+        self._loaded_at = 0.0
+        self._rebuilt_at = 0.0
+        self._last_update = datetime.min
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    @staticmethod
+    def _as_dict(product: Product) -> dict:
+        return {
+            "id": product.id, "sku": product.sku, "name": product.name, "category": product.category,
+            "stock": product.stock, "price": product.price, "note": product.note,
+        }
+
+    def load(self):
+        """Full rebuild from the product table."""
+        with Session(engine) as session:
+            products = session.exec(select(Product)).all()
+        index = CatalogIndex([self._as_dict(p) for p in products])
+        self.index = index
+        self._last_update = max((p.updated_at for p in products), default=datetime.min)
+        self._loaded_at = self._rebuilt_at = time.monotonic()
+        print(f"Catalog indexed: {len(products)} products")
+
+    def _refresh(self):
+        try:
+            with Session(engine) as session:
+                changed = session.exec(select(Product).where(Product.updated_at > self._last_update)).all()
+                count = session.exec(select(func.count(Product.id))).one()
+            index = self.index
+            # A row count that differs from the index means deletes, which leave no updated_at behind
+            rebuild = count != len(index.products) or time.monotonic() - self._rebuilt_at >= CATALOG_FULL_RELOAD_SECONDS
+            if not rebuild:
+                for product in changed:
+                    pos = index.by_id.get(product.id)
+                    if pos is None or index.products[pos]["name"] != product.name:
+                        rebuild = True
+                        break
+                    # Stock and price don't affect ranking: patch in place
+                    index.products[pos].update(self._as_dict(product))
+            if rebuild:
+                self.load()
+            elif changed:
+                self._last_update = max(p.updated_at for p in changed)
+            self._loaded_at = time.monotonic()
+        except Exception as e:
+            print(f"Catalog refresh failed: {e}")
+        finally:
+            self._refreshing = False
+
+    def refresh_if_stale(self):
+        """Kicks off a background refresh if the last one is older than CATALOG_RELOAD_SECONDS."""
+        if time.monotonic() - self._loaded_at < CATALOG_RELOAD_SECONDS:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, daemon=True).start()
+
+    def lookup(self, query: str, limit: int = 3) -> list[tuple[dict, float]]:
+        self.refresh_if_stale()
+        return self.index.search(query, limit)
+
+
+catalog = Catalog()
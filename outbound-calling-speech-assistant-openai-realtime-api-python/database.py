@@ -1,6 +1,10 @@
 import os
 from sqlmodel import SQLModel, create_engine, Session, Field, select
-from typing import Optional, List, Generator
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import Index, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from typing import Optional, List, Generator, AsyncGenerator
 from datetime import datetime
 
 # Fallback to SQLite if DATABASE_URL is not set
@@ -17,8 +21,54 @@ if "postgresql" in DATABASE_URL:
 else:
     engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 
+# Connection pool for the async engine used by request handlers and in-call tools
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+
+def async_database_url(url: str) -> str:
+    """Same database through an asyncio driver: asyncpg for PostgreSQL, aiosqlite for SQLite."""
+    parsed = make_url(url)
+    driver = "postgresql+asyncpg" if parsed.get_backend_name() == "postgresql" else "sqlite+aiosqlite"
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets the dashboard read while a call or import is writing;
+    # NORMAL sync is durable across app crashes in WAL mode
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA cache_size=-16000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    async_engine = create_async_engine(async_database_url(DATABASE_URL), pool_pre_ping=True)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+else:
+    async_engine = create_async_engine(
+        async_database_url(DATABASE_URL),
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+async_session_maker = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
 
 class Lead(SQLModel, table=True):
+    # Keyset pagination walks (created_at, id) newest first
+    __table_args__ = (
+        Index("ix_lead_created_at_id", "created_at", "id"),
+        Index("ix_lead_status_created_at_id", "status", "created_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
     phone: str = Field(unique=True, index=True)
@@ -35,15 +85,163 @@ class LeadCreate(SQLModel):
     notes: Optional[str] = None
 
 class Interaction(SQLModel, table=True):
+    # A lead's history is read newest first
+    __table_args__ = (
+        Index("ix_interaction_lead_id_timestamp", "lead_id", "timestamp"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     lead_id: int
-    type: str  # "call", "sms"
+    type: str  # "call", "sms", "sms_inbound", "call_start", "call_end", "tool", "transcript_user", "transcript_model", "note"
     content: str
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
+class Product(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    sku: str = Field(unique=True, index=True)
+    name: str
+    category: Optional[str] = None
+    stock: int = Field(default=0)
+    price: int = Field(default=0)  # INR
+    note: Optional[str] = None
+    # Bumped on every write (ORM onupdate; on SQLite also a trigger for raw UPDATEs)
+    # so the catalog's hot reload sees stock and price changes
+    updated_at: datetime = Field(default_factory=datetime.utcnow, index=True, sa_column_kwargs={"onupdate": datetime.utcnow})
+
+class Campaign(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str
+    status: str = Field(default="draft")  # "draft", "running", "paused", "completed"
+    # Lead filter the queue was built from
+    lead_status: Optional[str] = None
+    query: Optional[str] = None
+    max_attempts: int = Field(default=3)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class CampaignCreate(SQLModel):
+    name: str
+    lead_status: Optional[str] = None
+    query: Optional[str] = None
+    max_attempts: int = 3
+
+class CampaignCall(SQLModel, table=True):
+    # The dialer polls for due calls of a campaign in next_attempt_at order
+    __table_args__ = (
+        Index("ix_campaigncall_campaign_status_due", "campaign_id", "status", "next_attempt_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    campaign_id: int = Field(index=True)
+    lead_id: int
+    phone: str
+    status: str = Field(default="queued")  # "queued", "dialing", "completed", "failed"
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow)
+    call_sid: Optional[str] = Field(default=None, index=True)
+    outcome: Optional[str] = None  # last Twilio CallStatus or dial error
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class SmsBroadcast(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str
+    # Message with {name}, {first_name}, {phone}, {email}, {status} placeholders
+    template: str
+    status: str = Field(default="draft")  # "draft", "running", "paused", "completed"
+    # Lead filter the queue was built from
+    lead_status: Optional[str] = None
+    query: Optional[str] = None
+    max_attempts: int = Field(default=3)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class SmsBroadcastCreate(SQLModel):
+    name: str
+    template: str
+    lead_status: Optional[str] = None
+    query: Optional[str] = None
+    max_attempts: int = 3
+
+class SmsDelivery(SQLModel, table=True):
+    # The sender polls for due messages of a broadcast in next_attempt_at order
+    __table_args__ = (
+        Index("ix_smsdelivery_broadcast_status_due", "broadcast_id", "status", "next_attempt_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    broadcast_id: int = Field(index=True)
+    lead_id: int
+    phone: str
+    status: str = Field(default="queued")  # "queued", "sending", "sent", "delivered", "failed"
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow)
+    message_sid: Optional[str] = Field(default=None, index=True)
+    body: Optional[str] = None  # rendered text, once sent
+    outcome: Optional[str] = None  # last Twilio MessageStatus / error code or send error
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+# Concatenated, lower-cased search document for the PostgreSQL trigram index
+LEAD_SEARCH_EXPRESSION = "lower(name || ' ' || phone || ' ' || coalesce(email, '') || ' ' || coalesce(notes, ''))"
+
+def init_search_indexes():
+    """
+    Full-text search over lead name/phone/email/notes.
+    SQLite: an FTS5 table kept in sync by triggers. PostgreSQL: a pg_trgm GIN
+    index so ILIKE '%term%' (including partial phone numbers) is indexed.
+    Also creates the Lead / Interaction indexes on databases that predate them.
+    """
+    for index in [*Lead.__table__.indexes, *Interaction.__table__.indexes]:
+        index.create(engine, checkfirst=True)
+
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'lead_fts'")).first()
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS lead_fts USING fts5("
+                "name, phone, email, notes, content='lead', content_rowid='id', tokenize='unicode61')"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS lead_fts_ai AFTER INSERT ON lead BEGIN "
+                "INSERT INTO lead_fts(rowid, name, phone, email, notes) VALUES (new.id, new.name, new.phone, new.email, new.notes); END"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS lead_fts_ad AFTER DELETE ON lead BEGIN "
+                "INSERT INTO lead_fts(lead_fts, rowid, name, phone, email, notes) VALUES ('delete', old.id, old.name, old.phone, old.email, old.notes); END"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS lead_fts_au AFTER UPDATE ON lead BEGIN "
+                "INSERT INTO lead_fts(lead_fts, rowid, name, phone, email, notes) VALUES ('delete', old.id, old.name, old.phone, old.email, old.notes); "
+                "INSERT INTO lead_fts(rowid, name, phone, email, notes) VALUES (new.id, new.name, new.phone, new.email, new.notes); END"
+            ))
+            if not exists:
+                conn.execute(text("INSERT INTO lead_fts(lead_fts) VALUES ('rebuild')"))
+        elif engine.dialect.name == "postgresql":
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_lead_search_trgm ON lead USING gin (({LEAD_SEARCH_EXPRESSION}) gin_trgm_ops)"
+            ))
+
+def init_product_triggers():
+    """
+    SQLite: stamps product.updated_at on UPDATEs that don't set it (edits made
+    outside the app, e.g. `UPDATE product SET stock = 0`). Same text format as
+    the ORM writes, so the catalog's `updated_at >` poll compares correctly.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS product_touch_au AFTER UPDATE ON product "
+            "WHEN new.updated_at IS old.updated_at BEGIN "
+            "UPDATE product SET updated_at = strftime('%Y-%m-%d %H:%M:%f000', 'now') WHERE id = new.id; END"
+        ))
+
 def init_db():
+    """Creates missing tables and indexes; seeding is a separate step (seed.py)."""
     SQLModel.metadata.create_all(engine)
-    # Seed Data
+    init_search_indexes()
+    init_product_triggers()
+
+def seed_db():
+    """Demo leads and the starter product catalog, for an empty database."""
     with Session(engine) as session:
         if not session.exec(select(Lead)).first():
             seeds = [
@@ -55,7 +253,22 @@ def init_db():
                 session.add(lead)
             session.commit()
             print("Database initialized with seed data.")
+        if not session.exec(select(Product)).first():
+            products = [
+                Product(sku="SM-TV55", name="Samsung 55 inch TV", category="Displays", stock=5, price=65000),
+                Product(sku="SM-S24", name="Samsung Galaxy S24", category="Mobility", stock=12, price=75000),
+                Product(sku="SM-WATCH", name="Samsung Galaxy Watch", category="Mobility", stock=0, price=25000),
+                Product(sku="SM-VRF", name="Samsung VRF System", category="HVAC", stock=2, price=400000, note="Requires installation team"),
+            ]
+            for product in products:
+                session.add(product)
+            session.commit()
+            print("Product catalog initialized with seed data.")
 
 def get_session() -> Generator[Session, None, None]:
     with Session(engine) as session:
         yield session
+
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    async with async_session_maker() as session:
+        yield session
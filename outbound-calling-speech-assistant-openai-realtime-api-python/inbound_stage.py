@@ -0,0 +1,130 @@
+import os
+from collections import deque
+
+# Inbound stage between Twilio and Gemini.
+# Twilio delivers a media event every 20ms; forwarding each one is 50 websocket
+# messages/s per call, silence included. This stage batches speech into larger
+# chunks and thins out long silences. It works on the raw mu-law frames, ahead
+# of the transcoder: a batch is decoded and resampled in one call, and dropped
+# silence is never resampled.
+
+INBOUND_BATCH_MS = int(os.getenv("INBOUND_BATCH_MS", 80))
+# RMS (16-bit scale) at or above which a frame counts as speech
+INBOUND_SILENCE_RMS = int(os.getenv("INBOUND_SILENCE_RMS", 200))
+# Keep streaming silence at full rate this long after speech, so Gemini's own
+# end-of-speech detection still sees the pause
+INBOUND_HANGOVER_MS = int(os.getenv("INBOUND_HANGOVER_MS", 1000))
+# During long silence send one batch this often (0 = drop silence entirely)
+INBOUND_KEEPALIVE_MS = int(os.getenv("INBOUND_KEEPALIVE_MS", 500))
+# Silence kept in front of a speech onset so the first syllable isn't clipped
+INBOUND_PREROLL_MS = int(os.getenv("INBOUND_PREROLL_MS", 100))
+
+ULAW_BYTES_PER_MS = 8  # 8kHz mu-law, one byte per sample
+
+
+class InboundCoalescer:
+    """
+    Batches Twilio mu-law frames into larger chunks and gates silence.
+
+    push() returns a chunk to send (or None). A speech onset after silence
+    flushes immediately together with the pre-roll so barge-in latency is one
+    frame, not one batch.
+    """
+
+    def __init__(
+        self,
+        batch_ms: int = INBOUND_BATCH_MS,
+        hangover_ms: int = INBOUND_HANGOVER_MS,
+        keepalive_ms: int = INBOUND_KEEPALIVE_MS,
+        preroll_ms: int = INBOUND_PREROLL_MS,
+    ):
+        self.batch_bytes = max(1, batch_ms) * ULAW_BYTES_PER_MS
+        self.hangover_bytes = hangover_ms * ULAW_BYTES_PER_MS
+        self.keepalive_bytes = keepalive_ms * ULAW_BYTES_PER_MS
+        self.preroll_bytes = preroll_ms * ULAW_BYTES_PER_MS
+
+        self._pending = bytearray()
+        self._preroll = deque()
+        self._preroll_size = 0
+        self._silence_run = self.hangover_bytes  # start gated until the caller speaks
+        self._since_keepalive = 0
+
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.messages_out = 0
+        self.bytes_out = 0
+        self.frames_dropped = 0
+
+    def _emit(self) -> bytes | None:
+        if not self._pending:
+            return None
+        chunk = bytes(self._pending)
+        self._pending.clear()
+        self.messages_out += 1
+        self.bytes_out += len(chunk)
+        return chunk
+
+    def _drop_to_preroll(self, frame: bytes):
+        self._preroll.append(frame)
+        self._preroll_size += len(frame)
+        while self._preroll_size > self.preroll_bytes and self._preroll:
+            self._preroll_size -= len(self._preroll.popleft())
+            self.frames_dropped += 1
+
+    def push(self, frame: bytes, speech: bool) -> bytes | None:
+        """Feeds one mu-law frame (speech: RMS at or above INBOUND_SILENCE_RMS); returns a chunk to transcode and send, if any."""
+        self.frames_in += 1
+        self.bytes_in += len(frame)
+
+        if speech:
+            onset = self._silence_run >= self.hangover_bytes
+            self._silence_run = 0
+            self._since_keepalive = 0
+            if onset:
+                # Speech after a gated stretch: flush pre-roll + this frame right away
+                for earlier in self._preroll:
+                    self._pending += earlier
+                self._preroll.clear()
+                self._preroll_size = 0
+                self._pending += frame
+                return self._emit()
+            self._pending += frame
+            return self._emit() if len(self._pending) >= self.batch_bytes else None
+
+        self._silence_run += len(frame)
+        if self._silence_run < self.hangover_bytes:
+            # Trailing silence right after speech is forwarded normally
+            self._pending += frame
+            return self._emit() if len(self._pending) >= self.batch_bytes else None
+
+        # Long silence: flush what's left of the last utterance, then thin out
+        if self._pending:
+            self._drop_to_preroll(frame)
+            return self._emit()
+        self._since_keepalive += len(frame)
+        if self.keepalive_bytes and self._since_keepalive >= self.keepalive_bytes:
+            self._since_keepalive = 0
+            # Older pre-roll would arrive out of order after this frame
+            self.frames_dropped += len(self._preroll)
+            self._preroll.clear()
+            self._preroll_size = 0
+            self._pending += frame
+            return self._emit()
+        self._drop_to_preroll(frame)
+        return None
+
+    def flush(self) -> bytes | None:
+        """Returns any buffered audio (e.g. on stream stop)."""
+        return self._emit()
+
+    def summary(self) -> dict:
+        """Per-call message and byte reduction versus one message per Twilio frame."""
+        return {
+            "frames_in": self.frames_in,
+            "messages_out": self.messages_out,
+            "frames_dropped": self.frames_dropped + len(self._preroll),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "message_reduction": round(1 - self.messages_out / self.frames_in, 3) if self.frames_in else 0.0,
+            "byte_reduction": round(1 - self.bytes_out / self.bytes_in, 3) if self.bytes_in else 0.0,
+        }
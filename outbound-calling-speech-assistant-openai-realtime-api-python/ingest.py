@@ -0,0 +1,245 @@
+"""
+Bulk knowledge-base ingestion.
+
+Streams text files (txt / markdown / text extracted from PDFs), splits them into
+overlapping chunks, embeds them in batched requests with bounded concurrency
+and retry, and upserts them into the `yexis_docs` collection in bulk. Each
+chunk carries a content hash: re-runs skip chunks that haven't changed, and a
+chunk whose text only moved (an edit earlier in the file shifts every later
+chunk's index) reuses the embedding already stored for that hash.
+
+Usage:
+    python ingest.py docs/ price_lists/amc.md [--chunk-size 1000] [--overlap 200]
+"""
+import os
+import sys
+import time
+import codecs
+import asyncio
+import hashlib
+import argparse
+
+from rag_service import get_client, get_collection, EMBEDDING_MODEL, invalidate_search_cache
+from rag_index import knowledge_index
+
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", 1000))
+INGEST_CHUNK_OVERLAP = int(os.getenv("INGEST_CHUNK_OVERLAP", 200))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 64))
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", 4))
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", 4))
+
+TEXT_EXTENSIONS = {".txt", ".md", ".markdown", ".text"}
+READ_BLOCK = 64 * 1024
+
+
+class Chunker:
+    """Incremental splitter: feed() text blocks, get back finished overlapping chunks."""
+
+    def __init__(self, chunk_size: int = INGEST_CHUNK_SIZE, overlap: int = INGEST_CHUNK_OVERLAP):
+        if overlap >= chunk_size:
+            raise ValueError("overlap must be smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self._buffer = ""
+
+    def _cut(self) -> int:
+        """Chunk end: prefer a paragraph, then sentence, then word boundary in the back half."""
+        window = self._buffer[:self.chunk_size]
+        for sep in ("\n\n", ". ", "\n", " "):
+            pos = window.rfind(sep, self.chunk_size // 2)
+            if pos != -1:
+                return pos + len(sep)
+        return self.chunk_size
+
+    def feed(self, text: str) -> list[str]:
+        self._buffer += text
+        chunks = []
+        while len(self._buffer) >= self.chunk_size:
+            end = self._cut()
+            chunks.append(self._buffer[:end].strip())
+            self._buffer = self._buffer[max(end - self.overlap, 1):]
+        return [c for c in chunks if c]
+
+    def finish(self) -> list[str]:
+        tail, self._buffer = self._buffer.strip(), ""
+        return [tail] if tail else []
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class IngestPipeline:
+    """Batches chunks, skips unchanged ones, embeds and upserts with bounded concurrency."""
+
+    def __init__(self, batch_size: int = INGEST_BATCH_SIZE, concurrency: int = INGEST_CONCURRENCY):
+        self.batch_size = batch_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._batch = []
+        self._tasks = set()
+        self._chunk_counts = {}
+        self.started = time.perf_counter()
+        self.stats = {"files": 0, "chunks": 0, "skipped": 0, "reused": 0, "embedded": 0, "failed": 0}
+
+    async def add(self, source: str, text: str):
+        index = self._chunk_counts.get(source, 0)
+        self._chunk_counts[source] = index + 1
+        self.stats["chunks"] += 1
+        self._batch.append((f"{source}::{index}", source, index, text, content_hash(text)))
+        if len(self._batch) >= self.batch_size:
+            await self._dispatch()
+
+    async def _dispatch(self):
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        # Waiting here is the backpressure: at most `concurrency` batches in flight
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._process(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, batch):
+        try:
+            existing = await asyncio.to_thread(get_collection().get, ids=[row[0] for row in batch], include=["metadatas"])
+            known = {
+                doc_id: (meta or {}).get("hash")
+                for doc_id, meta in zip(existing["ids"], existing["metadatas"] or [])
+            }
+            fresh = [row for row in batch if known.get(row[0]) != row[4]]
+            self.stats["skipped"] += len(batch) - len(fresh)
+            if not fresh:
+                return
+            embeddings = await self._embeddings(fresh)
+            ids = [row[0] for row in fresh]
+            documents = [row[3] for row in fresh]
+            metadatas = [{"source": row[1], "chunk": row[2], "hash": row[4]} for row in fresh]
+            await asyncio.to_thread(
+                get_collection().upsert, ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas
+            )
+            if knowledge_index.loaded:
+                # Served by the app's index straight away, without waiting for its next sync
+                await asyncio.to_thread(knowledge_index.upsert, ids, documents, embeddings, metadatas)
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            print(f"Ingest batch failed ({batch[0][0]}...): {e}")
+        finally:
+            self._semaphore.release()
+
+    async def _embeddings(self, rows) -> list:
+        """Vectors for `rows`, reusing stored ones with the same content hash and embedding the rest."""
+        hashes = list({row[4] for row in rows})
+        stored = await asyncio.to_thread(
+            get_collection().get, where={"hash": {"$in": hashes}}, include=["metadatas", "embeddings"]
+        )
+        by_hash = {}
+        for meta, vector in zip(stored["metadatas"] or [], stored["embeddings"] if stored["embeddings"] is not None else []):
+            by_hash.setdefault((meta or {}).get("hash"), [float(x) for x in vector])
+        missing = list({row[4]: row[3] for row in rows if row[4] not in by_hash}.items())
+        if missing:
+            by_hash.update(zip([h for h, _ in missing], await self._embed([text for _, text in missing])))
+        self.stats["embedded"] += len(missing)
+        self.stats["reused"] += len(rows) - len(missing)
+        return [by_hash[row[4]] for row in rows]
+
+    async def _embed(self, texts: list[str]) -> list[list[float]]:
+        delay = 1.0
+        for attempt in range(INGEST_MAX_RETRIES + 1):
+            try:
+                response = await get_client().aio.models.embed_content(model=EMBEDDING_MODEL, contents=texts)
+                return [e.values for e in response.embeddings]
+            except Exception as e:
+                if attempt == INGEST_MAX_RETRIES:
+                    raise
+                print(f"Embedding batch failed ({e}); retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay *= 2
+
+    async def end_source(self, source: str):
+        """Removes chunks left over from a longer previous version of `source`."""
+        self.stats["files"] += 1
+        count = self._chunk_counts.get(source, 0)
+        await asyncio.to_thread(
+            get_collection().delete, where={"$and": [{"source": source}, {"chunk": {"$gte": count}}]}
+        )
+        if knowledge_index.loaded:
+            knowledge_index.delete_source_tail(source, count)
+
+    async def finish(self) -> dict:
+        await self._dispatch()
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+        invalidate_search_cache()
+        elapsed = time.perf_counter() - self.started
+        return {
+            **self.stats,
+            "seconds": round(elapsed, 2),
+            "chunks_per_second": round(self.stats["chunks"] / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+async def ingest_stream(pipeline: IngestPipeline, source: str, blocks, chunker: Chunker = None):
+    """Feeds an (async) iterable of byte or str blocks for one source through the pipeline."""
+    chunker = chunker or Chunker()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    async def consume(block):
+        text = decoder.decode(block) if isinstance(block, bytes) else block
+        for chunk in chunker.feed(text):
+            await pipeline.add(source, chunk)
+
+    if hasattr(blocks, "__aiter__"):
+        async for block in blocks:
+            await consume(block)
+    else:
+        for block in blocks:
+            await consume(block)
+    for chunk in chunker.feed(decoder.decode(b"", final=True)) + chunker.finish():
+        await pipeline.add(source, chunk)
+    await pipeline.end_source(source)
+
+
+def iter_files(paths: list[str]):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if os.path.splitext(name)[1].lower() in TEXT_EXTENSIONS:
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def read_blocks(path: str):
+    with open(path, "rb") as f:
+        while block := f.read(READ_BLOCK):
+            yield block
+
+
+async def ingest_paths(paths: list[str], chunk_size: int, overlap: int, batch_size: int, concurrency: int) -> dict:
+    pipeline = IngestPipeline(batch_size=batch_size, concurrency=concurrency)
+    for path in iter_files(paths):
+        source = os.path.relpath(path).replace(os.sep, "/")
+        await ingest_stream(pipeline, source, read_blocks(path), Chunker(chunk_size, overlap))
+    return await pipeline.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="Files or directories to ingest")
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE)
+    parser.add_argument("--overlap", type=int, default=INGEST_CHUNK_OVERLAP)
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=INGEST_CONCURRENCY)
+    args = parser.parse_args()
+
+    stats = asyncio.run(ingest_paths(args.paths, args.chunk_size, args.overlap, args.batch_size, args.concurrency))
+    print(f"Ingested {stats['files']} files: {stats['chunks']} chunks "
+          f"({stats['embedded']} embedded, {stats['reused']} reused, {stats['skipped']} unchanged, "
+          f"{stats['failed']} failed) "
+          f"in {stats['seconds']}s = {stats['chunks_per_second']} chunks/s")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import os
+import time
+import asyncio
+import contextlib
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from database import async_engine, Interaction
+
+# Write-behind logger for the Interaction table.
+# Call events, tool calls, transcripts and AI notes are queued from the call
+# path and written by one background task as multi-row INSERTs, so a call
+# costs a handful of commits instead of one per event. The queue is bounded and
+# log() never waits: live calls must not stall on the audit log, so when the
+# queue is full (database far behind, or the writer never started) rows are
+# dropped and counted as "overflowed".
+# Interaction.lead_id is required, so events of calls with no CRM lead (an
+# unknown inbound caller) are not stored; they are counted as "no_lead".
+
+INTERACTION_BATCH_SIZE = int(os.getenv("INTERACTION_BATCH_SIZE", 200))
+INTERACTION_FLUSH_MS = float(os.getenv("INTERACTION_FLUSH_MS", 500))
+INTERACTION_QUEUE_SIZE = int(os.getenv("INTERACTION_QUEUE_SIZE", 10000))
+INTERACTION_MAX_RETRIES = int(os.getenv("INTERACTION_MAX_RETRIES", 3))
+# Long tool results / transcripts are truncated in the log
+MAX_CONTENT_CHARS = 4000
+
+
+class InteractionLogger:
+    """Queues Interaction rows and flushes them in batches on a size / time threshold."""
+
+    def __init__(self, batch_size: int = INTERACTION_BATCH_SIZE, flush_ms: float = INTERACTION_FLUSH_MS,
+                 max_queue: int = INTERACTION_QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+        self.stats = {"rows": 0, "batches": 0, "max_batch": 0, "dropped": 0, "no_lead": 0, "overflowed": 0}
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Writes everything still queued, then stops the writer."""
+        if self._task is None:
+            return
+        await self.queue.join()
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    async def log(self, lead_id: int, type: str, content: str) -> bool:
+        """Queues one row without waiting; False when it isn't stored (no lead to attach it to, or the queue is full)."""
+        if lead_id is None:
+            self.stats["no_lead"] += 1
+            return False
+        row = {"lead_id": lead_id, "type": type, "content": content[:MAX_CONTENT_CHARS], "timestamp": datetime.utcnow()}
+        try:
+            self.queue.put_nowait(row)
+        except asyncio.QueueFull:
+            if not self.stats["overflowed"]:
+                print(f"Interaction log: queue full ({self.queue.maxsize} rows), dropping new rows")
+            self.stats["overflowed"] += 1
+            return False
+        return True
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _write(self, batch: list[dict]):
+        delay = 0.5
+        for attempt in range(INTERACTION_MAX_RETRIES + 1):
+            try:
+                async with async_engine.begin() as conn:
+                    await conn.execute(insert(Interaction.__table__).values(batch))
+                self.stats["rows"] += len(batch)
+                self.stats["batches"] += 1
+                self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+                return
+            except Exception as e:
+                if attempt == INTERACTION_MAX_RETRIES:
+                    self.stats["dropped"] += len(batch)
+                    print(f"Interaction log: dropped {len(batch)} rows after {attempt + 1} attempts: {e}")
+                    return
+                print(f"Interaction log write failed ({e}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                delay *= 2
+
+    def summary(self) -> dict:
+        return {**self.stats, "pending": self.queue.qsize()}
+
+
+interaction_log = InteractionLogger()
@@ -0,0 +1,249 @@
+"""
+Streaming bulk lead import / export.
+
+Rows are parsed incrementally from CSV or NDJSON, phone numbers are normalized
+to E.164, and leads are upserted in batches on the unique `lead.phone` index
+with the dialect's native ON CONFLICT (SQLite and PostgreSQL). Exports stream
+leads or interactions row by row from a server-side cursor.
+
+Usage:
+    python lead_io.py import campaign.csv [--batch-size 2000]
+    python lead_io.py export leads --format ndjson > leads.ndjson
+    python lead_io.py export interactions > interactions.csv
+"""
+import io
+import os
+import re
+import csv
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+
+from database import engine, Lead, Interaction
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 2000))
+DEFAULT_COUNTRY_CODE = os.getenv("DEFAULT_COUNTRY_CODE", "+91")
+# Error report is capped so a garbage file can't blow up the response
+MAX_REPORTED_ERRORS = 1000
+
+IMPORT_COLUMNS = ("name", "phone", "email", "status", "notes")
+_HEADER_ALIASES = {
+    "full_name": "name", "customer": "name", "customer_name": "name",
+    "mobile": "phone", "phone_number": "phone", "number": "phone", "contact": "phone",
+    "e-mail": "email", "email_address": "email", "comment": "notes", "comments": "notes",
+}
+_PHONE_JUNK = re.compile(r"[\s\-().]")
+
+
+def normalize_phone(raw: str) -> str:
+    """E.164-style normalization; raises ValueError if it can't be a phone number."""
+    phone = _PHONE_JUNK.sub("", raw or "")
+    if phone.startswith("00"):
+        phone = "+" + phone[2:]
+    if not phone.startswith("+"):
+        # National number without a country code
+        phone = DEFAULT_COUNTRY_CODE + phone.lstrip("0")
+    digits = phone[1:]
+    if not digits.isdigit() or not 7 <= len(digits) <= 15:
+        raise ValueError(f"invalid phone number {raw!r}")
+    return phone
+
+
+def _normalize_header(key: str) -> str:
+    key = (key or "").strip().lower().replace(" ", "_")
+    return _HEADER_ALIASES.get(key, key)
+
+
+def iter_csv(stream) -> iter:
+    """Yields (line number, dict row) from a text stream, one row in memory at a time."""
+    reader = csv.reader(stream)
+    header = [_normalize_header(h) for h in next(reader, [])]
+    for values in reader:
+        if any(v.strip() for v in values):
+            yield reader.line_num, dict(zip(header, values))
+
+
+def iter_ndjson(stream) -> iter:
+    """Yields (line number, dict row or the parse error) from a text stream."""
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, e
+            continue
+        if isinstance(row, dict):
+            yield line_number, {_normalize_header(k): v for k, v in row.items()}
+        else:
+            yield line_number, ValueError("not a JSON object")
+
+
+def _upsert_statement(dialect: str, update_status: bool):
+    table = Lead.__table__
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = insert(table)
+    # Re-imports refresh the lead but never blank out fields the file leaves empty
+    updates = {
+        "name": stmt.excluded.name,
+        "email": func.coalesce(stmt.excluded.email, table.c.email),
+        "notes": func.coalesce(stmt.excluded.notes, table.c.notes),
+    }
+    if update_status:
+        updates["status"] = stmt.excluded.status
+    return stmt.on_conflict_do_update(index_elements=[table.c.phone], set_=updates)
+
+
+class LeadImporter:
+    """Accumulates validated rows and flushes them as batched upserts."""
+
+    def __init__(self, batch_size: int = IMPORT_BATCH_SIZE):
+        if engine.dialect.name not in ("sqlite", "postgresql"):
+            raise RuntimeError(f"Bulk upsert is not supported on {engine.dialect.name}")
+        self.batch_size = batch_size
+        # Rows without a status insert as "New" but must not reset an existing lead's status
+        self.statements = {
+            True: _upsert_statement(engine.dialect.name, update_status=True),
+            False: _upsert_statement(engine.dialect.name, update_status=False),
+        }
+        self._batch = {}
+        self.rows = 0
+        self.upserted = 0
+        self.errors = []
+        self.error_count = 0
+        self.started = time.perf_counter()
+
+    def _error(self, line_number: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_number, "error": message})
+
+    def add(self, line_number: int, row):
+        self.rows += 1
+        if isinstance(row, Exception):
+            self._error(line_number, str(row))
+            return
+        try:
+            name = str(row.get("name") or "").strip()
+            if not name:
+                raise ValueError("missing name")
+            phone = normalize_phone(str(row.get("phone") or ""))
+        except ValueError as e:
+            self._error(line_number, str(e))
+            return
+        values = {c: (str(row[c]).strip() or None) if row.get(c) not in (None, "") else None for c in IMPORT_COLUMNS}
+        has_status = values["status"] is not None
+        values.update(name=name, phone=phone, status=values["status"] or "New", created_at=datetime.utcnow())
+        # One row per phone per statement: PostgreSQL refuses to update a row twice
+        self._batch[phone] = (has_status, values)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._batch:
+            return
+        batch = list(self._batch.values())
+        self._batch = {}
+        with engine.begin() as conn:
+            for has_status, statement in self.statements.items():
+                rows = [values for flag, values in batch if flag == has_status]
+                if rows:
+                    conn.execute(statement, rows)
+        self.upserted += len(batch)
+
+    def report(self) -> dict:
+        self.flush()
+        elapsed = time.perf_counter() - self.started
+        return {
+            "rows": self.rows,
+            "upserted": self.upserted,
+            "failed": self.error_count,
+            "errors": self.errors,
+            "seconds": round(elapsed, 2),
+            "rows_per_second": round(self.rows / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+def import_stream(stream, fmt: str = "csv", batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """Imports leads from a text stream; returns the per-row error report."""
+    importer = LeadImporter(batch_size)
+    rows = iter_ndjson(stream) if fmt == "ndjson" else iter_csv(stream)
+    for line_number, row in rows:
+        importer.add(line_number, row)
+    return importer.report()
+
+
+EXPORTS = {
+    "leads": (Lead, Lead.id),
+    "interactions": (Interaction, Interaction.id),
+}
+
+
+def _jsonable(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def iter_export(table: str, fmt: str = "csv", chunk_rows: int = 1000):
+    """Yields CSV / NDJSON text chunks for a whole table without materializing it."""
+    model, order = EXPORTS[table]
+    columns = list(model.__table__.columns.keys())
+    with Session(engine) as session:
+        result = session.exec(
+            select(*[getattr(model, c) for c in columns]).order_by(order).execution_options(yield_per=chunk_rows)
+        )
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == "csv":
+            writer.writerow(columns)
+        for i, row in enumerate(result, start=1):
+            if fmt == "ndjson":
+                buffer.write(json.dumps({c: _jsonable(v) for c, v in zip(columns, row)}) + "\n")
+            else:
+                writer.writerow([_jsonable(v) for v in row])
+            if i % chunk_rows == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="Upsert leads from a CSV/NDJSON file ('-' for stdin)")
+    imp.add_argument("path")
+    imp.add_argument("--format", choices=["csv", "ndjson"], help="Defaults to the file extension")
+    imp.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    exp = sub.add_parser("export", help="Stream a table to stdout")
+    exp.add_argument("table", choices=sorted(EXPORTS))
+    exp.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        for chunk in iter_export(args.table, args.format):
+            sys.stdout.write(chunk)
+        return 0
+
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    if args.path == "-":
+        report = import_stream(sys.stdin, fmt, args.batch_size)
+    else:
+        with open(args.path, newline="", encoding="utf-8-sig") as f:
+            report = import_stream(f, fmt, args.batch_size)
+    for error in report["errors"]:
+        print(f"line {error['line']}: {error['error']}", file=sys.stderr)
+    print(f"{report['rows']} rows, {report['upserted']} upserted, {report['failed']} failed "
+          f"in {report['seconds']}s ({report['rows_per_second']} rows/s)", file=sys.stderr)
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import re
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, or_, text
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from database import engine, Lead, LEAD_SEARCH_EXPRESSION
+
+# Keyset-paginated lead listing for GET /leads.
+# Pages are addressed by an opaque cursor over (created_at, id) instead of
+# OFFSET, so the cost of a page doesn't grow with how deep the dashboard scrolls.
+
+LEAD_FIELDS = {"id", "name", "phone", "email", "status", "notes", "created_at"}
+MAX_PAGE_SIZE = 500
+
+_FTS_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def encode_cursor(created_at: datetime, lead_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{lead_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Raises ValueError on a malformed cursor."""
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    created_at, lead_id = raw.rsplit("|", 1)
+    return datetime.fromisoformat(created_at), int(lead_id)
+
+
+def parse_fields(fields: str = None) -> list[str]:
+    """Comma-separated projection; id and created_at are always included for the cursor."""
+    if not fields:
+        return sorted(LEAD_FIELDS)
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested - LEAD_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return sorted(requested | {"id", "created_at"})
+
+
+def _escape_like(term: str) -> str:
+    """Makes %, _ and \\ in user input match literally (with ESCAPE '\\')."""
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts_match(terms: list[str], name: str):
+    match = " ".join(f'"{t}"*' for t in terms)
+    return text(f"lead.id IN (SELECT rowid FROM lead_fts WHERE lead_fts MATCH :{name})").bindparams(**{name: match})
+
+
+def search_clause(q: str):
+    if engine.dialect.name == "sqlite":
+        # Prefix match on every term: "ali 555" -> "ali"* AND "555"*
+        terms = _FTS_TOKEN.findall(q)
+        if not terms:
+            return None
+        words = [t for t in terms if not t.isdigit()]
+        clauses = [_fts_match(words, "fts_query")] if words else []
+        # A phone is a single token ("15550101"): digits can also be anywhere in it
+        for i, digits in enumerate(t for t in terms if t.isdigit()):
+            clauses.append(or_(_fts_match([digits], f"fts_digits_{i}"), Lead.phone.like(f"%{digits}%")))
+        return and_(*clauses)
+    like = f"%{_escape_like(q)}%"
+    if engine.dialect.name == "postgresql":
+        # Served by the pg_trgm GIN index on the same expression
+        return text(f"{LEAD_SEARCH_EXPRESSION} LIKE :like_query ESCAPE '\\'").bindparams(like_query=like.lower())
+    return or_(*(column.ilike(like, escape="\\") for column in (Lead.name, Lead.phone, Lead.email, Lead.notes)))
+
+
+async def list_leads(session: AsyncSession, limit: int = 50, cursor: str = None, status: str = None, q: str = None, fields: str = None) -> dict:
+    """One page of leads, newest first, plus the cursor for the next page."""
+    columns = parse_fields(fields)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    statement = select(*[getattr(Lead, c) for c in columns])
+    if status:
+        statement = statement.where(Lead.status == status)
+    if q and q.strip():
+        clause = search_clause(q.strip())
+        if clause is not None:
+            statement = statement.where(clause)
+    if cursor:
+        created_at, lead_id = decode_cursor(cursor)
+        statement = statement.where(or_(
+            Lead.created_at < created_at,
+            and_(Lead.created_at == created_at, Lead.id < lead_id),
+        ))
+    statement = statement.order_by(Lead.created_at.desc(), Lead.id.desc()).limit(limit + 1)
+
+    rows = (await session.exec(statement)).all()
+    items = [dict(zip(columns, row)) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+    return {"items": items, "next_cursor": next_cursor}
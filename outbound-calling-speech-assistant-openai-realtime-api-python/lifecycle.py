@@ -0,0 +1,130 @@
+import os
+import time
+import asyncio
+import contextlib
+
+# Application startup and shutdown.
+# Importing main.py does no I/O: the FastAPI lifespan starts every subsystem
+# (schema check, catalog index, Chroma, Gemini client, call registry, ...)
+# concurrently in the background, so uvicorn accepts connections right away.
+# Each subsystem waits only for the ones it names in `after`. /healthz is
+# liveness; /readyz turns 200 once every required subsystem is up and reports
+# each one's state either way. Shutdown stops them in reverse order.
+
+# Give up on a subsystem that takes longer than this to start
+STARTUP_TIMEOUT_SECONDS = float(os.getenv("STARTUP_TIMEOUT_SECONDS", 60))
+# How long a request that needs a subsystem waits for it while the app starts
+STARTUP_WAIT_SECONDS = float(os.getenv("STARTUP_WAIT_SECONDS", 10))
+
+
+class Subsystem:
+    def __init__(self, name: str, start, stop, blocking: bool, required: bool, after: tuple):
+        self.name = name
+        self.start = start
+        self.stop = stop
+        self.blocking = blocking
+        self.required = required
+        self.after = after
+        self.state = "pending"   # pending -> starting -> ready | failed; stopped after shutdown
+        self.error = None
+        self.started_ms = None
+        self.task = None
+
+
+class Lifecycle:
+    """Named subsystems started concurrently (respecting `after`) and stopped in reverse."""
+
+    def __init__(self, timeout: float = STARTUP_TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self.subsystems: dict[str, Subsystem] = {}
+        self.started = None
+        self._report_task = None
+
+    def register(self, name: str, start=None, stop=None, blocking: bool = False, required: bool = True, after: tuple = ()):
+        """start/stop are coroutine functions, or plain functions run on a thread if blocking=True."""
+        self.subsystems[name] = Subsystem(name, start, stop, blocking, required, tuple(after))
+
+    async def _call(self, fn, blocking: bool):
+        if blocking:
+            return await asyncio.to_thread(fn)
+        result = fn()
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+    async def _start(self, sub: Subsystem):
+        if sub.after:
+            await asyncio.gather(*(self.subsystems[name].task for name in sub.after), return_exceptions=True)
+            failed = [name for name in sub.after if self.subsystems[name].state != "ready"]
+            if failed:
+                sub.state, sub.error = "failed", f"waiting on {', '.join(failed)}"
+                print(f"Startup: {sub.name} skipped ({sub.error})")
+                return
+        sub.state = "starting"
+        started = time.perf_counter()
+        try:
+            if sub.start:
+                await asyncio.wait_for(self._call(sub.start, sub.blocking), self.timeout)
+            sub.state = "ready"
+        except Exception as e:
+            sub.state, sub.error = "failed", f"{type(e).__name__}: {e}"
+            print(f"Startup: {sub.name} failed ({sub.error})")
+        sub.started_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def start(self):
+        """Starts every subsystem in the background and returns immediately."""
+        self.started = time.monotonic()
+        for sub in self.subsystems.values():
+            sub.task = asyncio.create_task(self._start(sub))
+        self._report_task = asyncio.create_task(self._report())
+
+    async def _report(self):
+        await asyncio.gather(*(sub.task for sub in self.subsystems.values()), return_exceptions=True)
+        timings = {sub.name: sub.started_ms for sub in self.subsystems.values()}
+        print(f"Startup finished in {time.monotonic() - self.started:.2f}s: {timings}")
+
+    async def wait(self, *names: str, timeout: float = STARTUP_WAIT_SECONDS):
+        """Waits until the named subsystems are ready; RuntimeError if one failed or timed out."""
+        for name in names:
+            sub = self.subsystems[name]
+            if sub.state != "ready" and sub.task is not None:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(asyncio.shield(sub.task), timeout)
+            if sub.state != "ready":
+                raise RuntimeError(f"{name} is not available ({sub.error or sub.state})")
+
+    def ready(self) -> bool:
+        return all(sub.state == "ready" for sub in self.subsystems.values() if sub.required)
+
+    async def stop(self):
+        if self._report_task:
+            self._report_task.cancel()
+        for sub in reversed(self.subsystems.values()):
+            if sub.task and not sub.task.done():
+                sub.task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await sub.task
+            if sub.stop and sub.state in ("ready", "starting"):
+                try:
+                    await self._call(sub.stop, sub.blocking)
+                except Exception as e:
+                    print(f"Shutdown: {sub.name} failed to stop ({type(e).__name__}: {e})")
+            sub.state = "stopped"
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready(),
+            "uptime_s": round(time.monotonic() - self.started, 1) if self.started else 0.0,
+            "subsystems": {
+                sub.name: {
+                    "state": sub.state,
+                    "required": sub.required,
+                    "started_ms": sub.started_ms,
+                    **({"error": sub.error} if sub.error else {}),
+                }
+                for sub in self.subsystems.values()
+            },
+        }
+
+
+lifecycle = Lifecycle()
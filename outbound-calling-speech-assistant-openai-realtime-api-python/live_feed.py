@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import asyncio
+import contextlib
+
+# Server-sent events feed for the dashboard.
+# Handlers publish small change events (lead created / updated, call started
+# / ended, live call counts) instead of the dashboard re-downloading /leads.
+# Each event is serialized once, however many browsers are connected. Every
+# client has its own bounded buffer keyed by what the event is about (a lead,
+# a call, the counters): a newer event for the same key replaces the pending
+# one (lead patches are merged), so a slow browser receives the latest state
+# rather than every step. A client whose buffer still overflows is dropped to
+# a single "resync" event and reloads the list itself. Events are per worker:
+# a call shows up on the feed of the worker holding its media stream.
+
+# Distinct pending keys per client before it is told to resync
+LIVE_FEED_BUFFER = int(os.getenv("LIVE_FEED_BUFFER", 500))
+# Comment line sent on an idle stream so proxies don't close it
+LIVE_FEED_HEARTBEAT_SECONDS = float(os.getenv("LIVE_FEED_HEARTBEAT_SECONDS", 15))
+LIVE_FEED_MAX_CLIENTS = int(os.getenv("LIVE_FEED_MAX_CLIENTS", 200))
+
+
+class Event:
+    __slots__ = ("kind", "key", "data", "_frame")
+
+    def __init__(self, kind: str, key, data: dict):
+        self.kind = kind
+        self.key = key
+        self.data = data
+        self._frame = None
+
+    def frame(self) -> str:
+        """The SSE frame, encoded on first use and shared by every client."""
+        if self._frame is None:
+            self._frame = f"event: {self.kind}\ndata: {json.dumps(self.data, default=str, separators=(',', ':'))}\n\n"
+        return self._frame
+
+
+class FeedClient:
+    """One browser's pending events, at most one per key."""
+
+    def __init__(self, max_pending: int, stats: dict):
+        self.max_pending = max_pending
+        self.stats = stats
+        self.pending: dict = {}
+        self.wakeup = asyncio.Event()
+
+    def push(self, event: Event):
+        key = (event.kind, event.key)
+        previous = self.pending.get(key)
+        if previous is not None:
+            self.stats["coalesced"] += 1
+            if event.kind == "lead":
+                # Patches: keep fields the newer one doesn't carry
+                event = Event(event.kind, event.key, {**previous.data, **event.data})
+            # Same slot in the order it was first queued
+            self.pending[key] = event
+        elif len(self.pending) >= self.max_pending:
+            self.stats["resyncs"] += 1
+            self.pending = {("resync", None): Event("resync", None, {"reason": "client too slow"})}
+        else:
+            self.pending[key] = event
+        self.wakeup.set()
+
+    def drain(self) -> str:
+        events, self.pending = self.pending, {}
+        self.wakeup.clear()
+        return "".join(event.frame() for event in events.values())
+
+
+class LiveFeed:
+    def __init__(self, max_pending: int = LIVE_FEED_BUFFER, max_clients: int = LIVE_FEED_MAX_CLIENTS):
+        self.max_pending = max_pending
+        self.max_clients = max_clients
+        self.clients: set[FeedClient] = set()
+        # call_sid -> {"call_sid", "lead_id", "started_at"} for calls on this worker
+        self.calls = {}
+        self.stats = {"published": 0, "connections": 0, "rejected": 0, "coalesced": 0, "resyncs": 0}
+
+    def publish(self, kind: str, key, data: dict):
+        """Queues an event for every connected client; never blocks."""
+        self.stats["published"] += 1
+        if not self.clients:
+            return
+        event = Event(kind, key, data)
+        for client in self.clients:
+            client.push(event)
+
+    def lead_changed(self, lead: dict):
+        """A lead patch: "id" plus the fields that changed (all of them for a new lead)."""
+        self.publish("lead", lead["id"], lead)
+
+    def counts(self) -> dict:
+        return {"active_calls": len(self.calls), "clients": len(self.clients)}
+
+    @contextlib.asynccontextmanager
+    async def call(self, call_sid: str, lead_id: int = None):
+        """Publishes call started / ended around a live media stream."""
+        call = {"call_sid": call_sid, "lead_id": lead_id, "started_at": time.time()}
+        key = call_sid or f"stream-{id(call)}"
+        self.calls[key] = call
+        self.publish("call", key, {**call, "state": "started"})
+        self.publish("counts", None, self.counts())
+        try:
+            yield
+        finally:
+            self.calls.pop(key, None)
+            self.publish("call", key, {**call, "state": "ended", "duration_s": round(time.time() - call["started_at"], 1)})
+            self.publish("counts", None, self.counts())
+
+    def snapshot(self) -> str:
+        """What a new client gets first: the calls in progress and the counters."""
+        return Event("snapshot", None, {"calls": list(self.calls.values()), **self.counts()}).frame()
+
+    async def stream(self, is_disconnected=None):
+        """SSE body for one client: snapshot, then coalesced batches of events and heartbeats."""
+        client = FeedClient(self.max_pending, self.stats)
+        self.clients.add(client)
+        self.stats["connections"] += 1
+        try:
+            yield "retry: 3000\n\n" + self.snapshot()
+            while True:
+                try:
+                    await asyncio.wait_for(client.wakeup.wait(), LIVE_FEED_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if is_disconnected is not None and await is_disconnected():
+                        return
+                    yield ": ping\n\n"
+                    continue
+                # Everything pending goes out in one write
+                yield client.drain()
+        finally:
+            self.clients.discard(client)
+
+    def full(self) -> bool:
+        if len(self.clients) < self.max_clients:
+            return False
+        self.stats["rejected"] += 1
+        return True
+
+    def summary(self) -> dict:
+        return {
+            **self.stats,
+            **self.counts(),
+            "pending": sum(len(c.pending) for c in self.clients),
+        }
+
+
+live_feed = LiveFeed()
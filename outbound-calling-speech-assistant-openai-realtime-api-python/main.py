@@ -3,27 +3,58 @@ import json
 import asyncio
 import base64
 import sys
-import audioop
+import time
+import io
+import tempfile
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, WebSocket, Request, HTTPException, Depends
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse, PlainTextResponse, FileResponse
 from fastapi.websockets import WebSocketDisconnect
 from twilio.twiml.voice_response import VoiceResponse, Connect
 from twilio.twiml.messaging_response import MessagingResponse
-from twilio.rest import Client
+from twilio.request_validator import RequestValidator
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-from database import init_db, get_session, Lead, LeadCreate, engine
-from sqlmodel import Session, select
-from rag_service import search_knowledge_base
-
-# Initialize DB on startup
-init_db()
+from database import init_db, get_async_session, async_session_maker, async_engine, Lead, LeadCreate, Interaction, Campaign, CampaignCreate, SmsBroadcast, SmsBroadcastCreate
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from rag_service import search_knowledge_base, open_knowledge_base
+from ingest import IngestPipeline, ingest_stream
+from catalog import catalog, format_inr, CATALOG_MIN_SCORE
+from lead_queries import list_leads
+from lead_io import import_stream, iter_export
+from audio_codec import InboundTranscoder, OutboundTranscoder
+from inbound_stage import INBOUND_SILENCE_RMS, InboundCoalescer
+from outbound_pacer import OutboundPacer
+from tool_dispatcher import ToolRegistry
+from campaigns import dialer, create_campaign, campaign_stats, TERMINAL_OUTCOMES
+from sms import sms_sender, sms_inbox, create_broadcast, broadcast_stats
+from twilio_transport import twilio_rest
+from interaction_log import interaction_log
+from prewarm import CallWarmer
+from call_registry import call_registry
+from metrics import registry, CallMetrics, monitor_loop_lag
+from lifecycle import lifecycle
+from admission import admission, ADMISSION_FALLBACK, ADMISSION_RETRY_AFTER_SECONDS, ADMISSION_VOICEMAIL_LEADS
+from call_recorder import recorder
+from live_feed import live_feed
 
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Subsystems (DB schema, catalog, Gemini, dialer, ...) are registered with
+    # lifecycle below and start in the background; uvicorn serves right away
+    loop_lag_task = asyncio.create_task(monitor_loop_lag(on_sample=admission.observe_lag))
+    lifecycle.start()
+    yield
+    loop_lag_task.cancel()
+    await lifecycle.stop()
+    await async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,25 +67,83 @@ app.add_middleware(
 # ... (Previous code remains the same until Endpoints)
 
 # CRM API Endpoints
-@app.get("/leads", response_model=list[Lead])
-async def get_leads(session: Session = Depends(get_session)):
-    """Fetch all leads from the database."""
-    leads = session.exec(select(Lead).order_by(Lead.created_at.desc())).all()
-    return leads
+@app.get("/leads")
+async def get_leads(
+    limit: int = 50,
+    cursor: str = None,
+    status: str = None,
+    q: str = None,
+    fields: str = None,
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    Fetch a page of leads, newest first.
+    Filter by `status`, full-text search with `q`, project with `fields=name,phone`
+    and pass back `next_cursor` as `cursor` for the next page.
+    """
+    try:
+        return await list_leads(session, limit=limit, cursor=cursor, status=status, q=q, fields=fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/leads", response_model=Lead)
-async def create_lead(lead: LeadCreate, session: Session = Depends(get_session)):
+async def create_lead(lead: LeadCreate, session: AsyncSession = Depends(get_async_session)):
     """Create a new lead."""
     db_lead = Lead.from_orm(lead)
     session.add(db_lead)
-    session.commit()
-    session.refresh(db_lead)
+    await session.commit()
+    await session.refresh(db_lead)
+    live_feed.lead_changed(db_lead.model_dump())
     return db_lead
 
+@app.post("/leads/import")
+async def import_leads(request: Request, format: str = "csv"):
+    """
+    Bulk upsert of leads from a CSV or NDJSON request body (keyed on phone).
+    The body is spooled to disk, then parsed and written in batches off the event loop.
+    """
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    async for block in request.stream():
+        spool.write(block)
+    spool.seek(0)
+    with io.TextIOWrapper(spool, encoding="utf-8-sig", newline="") as stream:
+        report = await asyncio.to_thread(import_stream, stream, format)
+    if report["upserted"]:
+        # Too many rows to send as patches; open dashboards reload the list
+        live_feed.publish("resync", None, {"reason": "import", "upserted": report["upserted"]})
+    return report
+
+@app.get("/leads/export")
+async def export_leads(format: str = "csv"):
+    """Streams every lead as CSV or NDJSON."""
+    return _export_response("leads", format)
+
+@app.get("/interactions/export")
+async def export_interactions(format: str = "csv"):
+    """Streams every interaction as CSV or NDJSON."""
+    return _export_response("interactions", format)
+
+@app.get("/recordings/{call_sid}")
+async def get_recording(call_sid: str):
+    """Stereo WAV of a recorded call (left: caller, right: agent)."""
+    path = recorder.path_for(call_sid)
+    if path is None:
+        raise HTTPException(status_code=404, detail="No recording for this call")
+    return FileResponse(path, media_type="audio/wav")
+
+def _export_response(table: str, format: str) -> StreamingResponse:
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    headers = {"Content-Disposition": f'attachment; filename="{table}.{format}"'}
+    return StreamingResponse(iter_export(table, format), media_type=media_type, headers=headers)
+
 @app.put("/leads/{lead_id}", response_model=Lead)
-async def update_lead(lead_id: int, lead: LeadCreate, session: Session = Depends(get_session)):
+async def update_lead(lead_id: int, lead: LeadCreate, session: AsyncSession = Depends(get_async_session)):
     """Update a lead."""
-    db_lead = session.get(Lead, lead_id)
+    db_lead = await session.get(Lead, lead_id)
     if not db_lead:
         raise HTTPException(status_code=404, detail="Lead not found")
     
@@ -63,10 +152,33 @@ async def update_lead(lead_id: int, lead: LeadCreate, session: Session = Depends
         setattr(db_lead, key, value)
         
     session.add(db_lead)
-    session.commit()
-    session.refresh(db_lead)
+    await session.commit()
+    await session.refresh(db_lead)
+    live_feed.lead_changed(db_lead.model_dump())
     return db_lead
 
+@app.get("/leads/{lead_id}/interactions")
+async def get_lead_interactions(lead_id: int, limit: int = 100, type: str = None, session: AsyncSession = Depends(get_async_session)):
+    """A lead's call / SMS / note history, newest first."""
+    statement = select(Interaction).where(Interaction.lead_id == lead_id)
+    if type:
+        statement = statement.where(Interaction.type == type)
+    statement = statement.order_by(Interaction.timestamp.desc(), Interaction.id.desc()).limit(max(1, min(limit, 500)))
+    return (await session.exec(statement)).all()
+
+@app.get("/products/search")
+async def search_products(q: str, limit: int = 5):
+    """Ranked fuzzy search over the product catalog."""
+    return [{**product, "score": round(score, 3)} for product, score in catalog.lookup(q, limit)]
+
+# Knowledge Base Ingestion
+@app.post("/knowledge-base/ingest")
+async def ingest_document(request: Request, source: str):
+    """Streams a text document (request body) into the knowledge base as overlapping chunks."""
+    pipeline = IngestPipeline()
+    await ingest_stream(pipeline, source, request.stream())
+    return await pipeline.finish()
+
 # Gemini System Instruction
 # Gemini System Instruction
 SYSTEM_INSTRUCTION = """
@@ -106,19 +218,21 @@ TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 PHONE_NUMBER_FROM = os.getenv("PHONE_NUMBER_FROM")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Alternative Gemini API endpoint, e.g. benchmarks/fake_gemini_live.py for load tests
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
 DOMAIN = os.getenv("DOMAIN") # e.g. "your-id.ngrok-free.app"
 if DOMAIN:
     DOMAIN = DOMAIN.replace("http://", "").replace("https://", "").replace("/", "")
 PORT = int(os.getenv("PORT", 6060))
+# Reject webhooks that create CRM rows (/voicemail) unless X-Twilio-Signature checks out
+TWILIO_VALIDATE_SIGNATURES = os.getenv("TWILIO_VALIDATE_SIGNATURES", "true").lower() in ("1", "true", "yes")
+# Ask Gemini Live for transcripts of both sides (logged as Interactions)
+LOG_TRANSCRIPTS = os.getenv("LOG_TRANSCRIPTS", "true").lower() in ("1", "true", "yes")
 
-# Mock Inventory Data
-INVENTORY = {
-    "samsung 55 tv": {"stock": 5, "price": "₹65,000"},
-    "samsung s24": {"stock": 12, "price": "₹75,000"},
-    "galaxy watch": {"stock": 0, "price": "₹25,000"},
-    "vrf system": {"stock": 2, "price": "₹4,00,000", "note": "Requires installation team"},
-}
+# Gemini tools: blocking ones run on the dispatcher's thread pool
+tool_registry = ToolRegistry()
 
+@tool_registry.register(blocking=False)
 def check_inventory(product_name: str):
     """
     Checks the stock status and price of a product in the warehouse.
@@ -130,15 +244,18 @@ def check_inventory(product_name: str):
         JSON string with stock details.
     """
     print(f"Tool Triggered: check_inventory({product_name})")
-    product_key = product_name.lower()
+    matches = catalog.lookup(product_name)
     
-    # Simple fuzzy match
-    for key, data in INVENTORY.items():
-        if key in product_key or product_key in key:
-            return json.dumps({"product": key, "status": data})
+    if matches and matches[0][1] >= CATALOG_MIN_SCORE:
+        product, score = matches[0]
+        status = {"stock": product["stock"], "price": format_inr(product["price"])}
+        if product["note"]:
+            status["note"] = product["note"]
+        return json.dumps({"product": product["name"], "sku": product["sku"], "status": status})
     
-    return json.dumps({"product": product_name, "status": "Not found in catalog", "available_items": list(INVENTORY.keys())})
+    return json.dumps({"product": product_name, "status": "Not found in catalog", "closest_items": [p["name"] for p, _ in matches]})
 
+@tool_registry.register(fallback="The knowledge base is slow right now. Answer from general knowledge or offer to follow up.")
 def query_knowledge_base(query: str):
     """
     Searches the knowledge base for policies, warranty info, and general support questions.
@@ -151,13 +268,12 @@ def query_knowledge_base(query: str):
     """
     print(f"Tool Triggered: query_knowledge_base({query})")
     results = search_knowledge_base(query)
-    if results:
-        return f"Context found: {results}"
     if results:
         return f"Context found: {results}"
     return "No relevant info found in knowledge base."
 
-def update_lead_tool(phone: str, notes: str, status: str = None):
+@tool_registry.register
+async def update_lead_tool(phone: str, notes: str, status: str = None):
     """
     Updates the CRM lead information for the given phone number.
     
@@ -166,43 +282,25 @@ def update_lead_tool(phone: str, notes: str, status: str = None):
         notes: New notes to append or save.
         status: (Optional) New status (e.g., 'Interested', 'Follow-up').
     """
-    print(f"Tool Triggered: update_lead_tool({phone}, {status})")
-    
-    with Session(get_db_connection()) as session: # Re-using connection logic for tool, might need adjustment if using get_session generator
-         # Actually database.py exposes 'engine'. Let's import engine or use a helper.
-         # Reviewing database.py... it has 'engine'.
-         pass
-    
-    # Let's fix the import first to get 'engine' or just use the existing get_db_connection logic if compatible, 
-    # but database.py was refactored to SQLModel where get_session yields a session.
-    # I will stick to a fresh session approach using the engine from database.
-    return "Lead updated successfully."
-
-# Refined implementation below
-from database import engine 
-
-def update_lead_tool(phone: str, notes: str, status: str = None):
-    """
-    Updates the CRM lead information for the given phone number.
-    """
     print(f"Tool Triggered: update_lead_tool({phone})")
-    with Session(engine) as session:
-        statement = select(Lead).where(Lead.phone == phone)
-        lead = session.exec(statement).first()
+    async with async_session_maker() as session:
+        statement = select(Lead.id, Lead.name).where(Lead.phone == phone)
+        lead = (await session.exec(statement)).first()
         
         if lead:
+            # Notes are appended to the interaction log; only a status change touches the lead row
             if notes:
-                lead.notes = (lead.notes or "") + f"\n[AI]: {notes}"
+                await interaction_log.log(lead.id, "note", notes)
             if status:
-                lead.status = status
-            session.add(lead)
-            session.commit()
+                await session.exec(update(Lead).where(Lead.id == lead.id).values(status=status))
+                await session.commit()
+            live_feed.lead_changed({"id": lead.id, **({"status": status} if status else {}), **({"last_note": notes} if notes else {})})
             return f"Updated lead {lead.name}."
         else:
              # Create new lead if not exists? For now just report.
             return "Lead not found for this number."
 
-tools = [check_inventory, query_knowledge_base, update_lead_tool]
+tools = tool_registry.declarations
 
 # Emergency Safety
 BLOCKED_NUMBERS = {"911", "112", "999"}
@@ -212,13 +310,97 @@ BLOCKED_NUMBERS = {"911", "112", "999"}
 if not (TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and PHONE_NUMBER_FROM and GEMINI_API_KEY):
     print("Error: Missing environment variables in .env")
 
-client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-gemini_client = genai.Client(api_key=GEMINI_API_KEY, http_options={"api_version": "v1alpha"})
+gemini_http_options = {"api_version": "v1alpha"}
+if GEMINI_BASE_URL:
+    gemini_http_options["base_url"] = GEMINI_BASE_URL
+gemini_client = None
+GEMINI_MODEL = "gemini-2.0-flash-exp"
+
+def open_gemini_client():
+    """Imports the SDK and builds the client (startup subsystem "gemini")."""
+    global gemini_client
+    from google import genai
+    gemini_client = genai.Client(api_key=GEMINI_API_KEY, http_options=gemini_http_options)
+
+async def build_live_config(lead_id: int = None) -> dict:
+    """Gemini Live config for a call: system instruction with the lead's context, voice and tools."""
+    # A call that comes in while the app is still starting waits for what it needs
+    await lifecycle.wait("catalog", "gemini")
+    from google.genai import types
+    # Dynamic Context Loading
+    dynamic_instruction = SYSTEM_INSTRUCTION
+    if lead_id:
+        async with async_session_maker() as db_session:
+            lead = await db_session.get(Lead, lead_id)
+            if lead:
+                print(f"Loading context for: {lead.name}")
+                ai_notes = (await db_session.exec(
+                    select(Interaction.content)
+                    .where(Interaction.lead_id == lead_id, Interaction.type == "note")
+                    .order_by(Interaction.timestamp.desc()).limit(10)
+                )).all()
+                previous_notes = "\n".join(filter(None, [lead.notes, *(f"[AI]: {n}" for n in reversed(ai_notes))]))
+                context_note = f"\n\n**CURRENT CALL CONTEXT**\n" \
+                               f"You are speaking with {lead.name}.\n" \
+                               f"Phone: {lead.phone}\n" \
+                               f"Status: {lead.status}\n" \
+                               f"Previous Notes: {previous_notes or 'None'}\n" \
+                               f"Goal: Update them on their inquiry and save any new notes using the 'update_lead_tool'."
+                dynamic_instruction += context_note
+
+    # Gemini takes 16kHz PCM in and returns 24kHz PCM; audio_codec transcodes both legs.
+    config = {
+        "response_modalities": ["AUDIO"],
+        "system_instruction": types.Content(parts=[types.Part(text=dynamic_instruction)]),
+        "speech_config": {
+            "voice_config": {"prebuilt_voice_config": {"voice_name": "Puck"}},
+        },
+        # Plain callables: the SDK derives the function declarations from signatures/docstrings
+        "tools": tools,
+    }
+    if LOG_TRANSCRIPTS:
+        config["input_audio_transcription"] = {}
+        config["output_audio_transcription"] = {}
+    return config
+
+# Gemini sessions opened at dial time, picked up by /media-stream
+warmer = CallWarmer(build_live_config, lambda config: gemini_client.aio.live.connect(model=GEMINI_MODEL, config=config))
+
+# Point-in-time gauges, read when /metrics is scraped
+registry.gauge("voice_active_calls", "Media streams open on this worker", lambda: dialer.active_streams)
+registry.gauge("voice_ringing_calls", "Campaign calls dialed and not yet answered", lambda: len(dialer.ringing))
+registry.gauge("voice_warm_sessions", "Pre-warmed Gemini sessions waiting for their call", lambda: len(warmer.calls))
+registry.gauge("interaction_log_pending", "Interaction rows queued for the database", lambda: interaction_log.queue.qsize())
+registry.counter("interaction_log_no_lead_total", "Call events not stored because the call has no CRM lead", callback=lambda: interaction_log.stats["no_lead"])
+registry.counter("interaction_log_dropped_total", "Interaction rows lost to a full queue or failed writes",
+                 callback=lambda: interaction_log.stats["overflowed"] + interaction_log.stats["dropped"])
+registry.gauge("live_feed_clients", "Dashboards connected to the /live event stream", lambda: len(live_feed.clients))
+registry.gauge("sms_inbox_pending", "Inbound SMS and delivery callbacks queued for processing", lambda: sms_inbox.queue.qsize())
+registry.gauge("voice_admission_accepting", "1 while this worker admits new calls, 0 while it sheds load", lambda: int(not admission.shedding))
+
+# An overloaded worker takes itself out of call routing
+call_registry.accepting = admission.accepting
 
 @app.get("/", response_class=HTMLResponse)
 async def index():
     return "<h1>Twilio + Gemini Voice Agent</h1><p>Server is running.</p>"
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and its event loop answers."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once every required subsystem has started, 503 until then; per-subsystem state either way."""
+    status = lifecycle.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of the call-path histograms and gauges."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/make-call")
 async def make_call(to: str, lead_id: int = None):
     """Initiates an outbound call to the specified number."""
@@ -229,6 +411,13 @@ async def make_call(to: str, lead_id: int = None):
     cleaned_number = to.replace("+", "").strip()
     if cleaned_number in BLOCKED_NUMBERS or to.strip() in BLOCKED_NUMBERS:
         raise HTTPException(status_code=400, detail="Emergency numbers are blocked for safety.")
+
+    if not admission.admit_dial():
+        raise HTTPException(
+            status_code=503,
+            detail=f"Worker is at capacity ({', '.join(admission.reasons)}); retry later",
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER_SECONDS)},
+        )
     
     try:
         # Pass lead_id to the webhook
@@ -236,27 +425,237 @@ async def make_call(to: str, lead_id: int = None):
         if lead_id:
             webhook_url += f"?lead_id={lead_id}"
 
-        call = client.calls.create(
-            to=to,
-            from_=PHONE_NUMBER_FROM,
-            url=webhook_url
-        )
-        return {"message": "Call initiated", "call_sid": call.sid}
+        # Lead lookup and Gemini connect run while the phone rings
+        warm = warmer.start(lead_id)
+        try:
+            call = await twilio_rest.create_call(to=to, url=webhook_url, status_callback=f"https://{DOMAIN}/call-status")
+        except Exception:
+            await warmer.discard(warm)
+            raise
+        warmer.bind(warm, call["sid"])
+        await call_registry.assign(call["sid"], lead_id)
+        return {"message": "Call initiated", "call_sid": call["sid"]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def place_campaign_call(to: str, lead_id: int, campaign_call_id: int) -> str:
+    """Dials one queued campaign call; the outcome comes back on /call-status."""
+    if to.replace("+", "").strip() in BLOCKED_NUMBERS:
+        raise ValueError("Emergency numbers are blocked for safety.")
+    warm = warmer.start(lead_id)
+    try:
+        call = await twilio_rest.create_call(
+            to=to,
+            url=f"https://{DOMAIN}/incoming-call?lead_id={lead_id}",
+            status_callback=f"https://{DOMAIN}/call-status",
+        )
+    except Exception:
+        await warmer.discard(warm)
+        raise
+    warmer.bind(warm, call["sid"])
+    await call_registry.assign(call["sid"], lead_id)
+    return call["sid"]
+
+async def send_broadcast_sms(to: str, body: str) -> str:
+    """Sends one broadcast message; delivery comes back on /sms-status."""
+    if to.replace("+", "").strip() in BLOCKED_NUMBERS:
+        raise ValueError("Emergency numbers are blocked for safety.")
+    message = await twilio_rest.send_sms(to=to, body=body, status_callback=f"https://{DOMAIN}/sms-status")
+    return message["sid"]
+
+async def send_sms_reply(to: str, body: str):
+    await twilio_rest.send_sms(to=to, body=body)
+
+# Startup subsystems, started concurrently by the lifespan and stopped in reverse order.
+# Seeding is not part of startup: run `python seed.py` once on a fresh install.
+lifecycle.register("database", init_db, blocking=True)
+lifecycle.register("catalog", catalog.load, blocking=True, after=("database",))
+# Optional: query_knowledge_base answers with its fallback while Chroma is unavailable
+lifecycle.register("knowledge_base", open_knowledge_base, blocking=True, required=False)
+lifecycle.register("gemini", open_gemini_client, blocking=True)
+lifecycle.register("twilio", twilio_rest.open, twilio_rest.aclose)
+lifecycle.register("call_registry", call_registry.start, call_registry.stop)
+lifecycle.register("interaction_log", interaction_log.start, interaction_log.stop, after=("database",))
+lifecycle.register("dialer", lambda: dialer.start(place_campaign_call, admit=admission.accepting), dialer.stop, after=("database", "call_registry"))
+lifecycle.register("sms_sender", lambda: sms_sender.start(send_broadcast_sms, admit=admission.accepting), sms_sender.stop, after=("database",))
+lifecycle.register("sms_inbox", lambda: sms_inbox.start(reply=send_sms_reply), sms_inbox.stop, after=("database", "interaction_log"))
+
+# Campaigns
+@app.post("/campaigns")
+async def new_campaign(campaign: CampaignCreate, session: AsyncSession = Depends(get_async_session)):
+    """Creates a draft campaign queuing every lead that matches `lead_status` / `query`."""
+    return await create_campaign(session, campaign.name, campaign.lead_status, campaign.query, campaign.max_attempts)
+
+@app.get("/campaigns")
+async def list_campaigns(session: AsyncSession = Depends(get_async_session)):
+    """All campaigns with their progress."""
+    campaigns = (await session.exec(select(Campaign).order_by(Campaign.id.desc()))).all()
+    return [await campaign_stats(session, c) for c in campaigns]
+
+@app.get("/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: int, session: AsyncSession = Depends(get_async_session)):
+    """Campaign progress plus this worker's dialer state."""
+    campaign = await session.get(Campaign, campaign_id)
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return {**await campaign_stats(session, campaign), "dialer": dialer.summary()}
+
+@app.post("/campaigns/{campaign_id}/start")
+async def start_campaign(campaign_id: int, session: AsyncSession = Depends(get_async_session)):
+    """Starts or resumes dialing."""
+    return await _set_campaign_status(session, campaign_id, "running")
+
+@app.post("/campaigns/{campaign_id}/pause")
+async def pause_campaign(campaign_id: int, session: AsyncSession = Depends(get_async_session)):
+    """Stops dialing new calls; calls in progress finish normally."""
+    return await _set_campaign_status(session, campaign_id, "paused")
+
+async def _set_campaign_status(session: AsyncSession, campaign_id: int, status: str) -> dict:
+    campaign = await session.get(Campaign, campaign_id)
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    if campaign.status == "completed":
+        raise HTTPException(status_code=409, detail="Campaign already completed")
+    if status == "running" and not DOMAIN:
+        raise HTTPException(status_code=500, detail="DOMAIN environment variable not set")
+    campaign.status = status
+    session.add(campaign)
+    await session.commit()
+    await session.refresh(campaign)
+    dialer.wake()
+    return await campaign_stats(session, campaign)
+
+@app.post("/call-status")
+async def call_status(request: Request):
+    """Twilio status callback for outbound calls: campaign outcomes and warm-session cleanup."""
+    form_data = await request.form()
+    call_sid = form_data.get("CallSid")
+    call_status = form_data.get("CallStatus")
+    await warmer.release(call_sid)
+    await dialer.on_status(call_sid, call_status)
+    if call_status in TERMINAL_OUTCOMES:
+        await call_registry.end(call_sid)
+    return Response(status_code=204)
+
+@app.get("/live")
+async def live(request: Request):
+    """
+    Server-sent events for the dashboard: lead (patch), call (started / ended),
+    counts, and resync when the client should reload its list.
+    """
+    if live_feed.full():
+        raise HTTPException(status_code=503, detail="Too many live dashboard connections")
+    return StreamingResponse(
+        live_feed.stream(request.is_disconnected),
+        media_type="text/event-stream",
+        # Proxies must pass events through as they come
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/live/status")
+async def live_status():
+    """Connected dashboards and how much the feed has coalesced for slow ones."""
+    return live_feed.summary()
+
+@app.get("/workers")
+async def list_workers():
+    """Live workers sharing the call registry, with their call counts."""
+    return {"this_worker": call_registry.summary(), "workers": await call_registry.workers()}
+
+@app.get("/admission")
+async def admission_status():
+    """Admission state for load balancers and dashboards: 200 while accepting calls, 503 while shedding."""
+    status = admission.status()
+    return JSONResponse(status, status_code=200 if status["accepting"] else 503)
+
+def fallback_twiml(lead_id: int = None) -> HTMLResponse:
+    """What a call hears when no worker can take it: an apology, or voicemail (ADMISSION_FALLBACK)."""
+    response = VoiceResponse()
+    if ADMISSION_FALLBACK == "voicemail":
+        response.say("Sorry, all our agents are busy right now. Please leave a message after the tone and we will call you back.")
+        action = f"https://{DOMAIN}/voicemail" + (f"?lead_id={lead_id}" if lead_id else "")
+        response.record(action=action, max_length=120, play_beep=True)
+    else:
+        response.say("All our agents are busy right now. Please call again in a few minutes.")
+    response.hangup()
+    return HTMLResponse(content=str(response), media_type="application/xml")
+
+async def lead_for_caller(phone: str) -> int | None:
+    """Id of the lead with this phone number, creating one for an unknown caller."""
+    async with async_session_maker() as session:
+        lead_id = (await session.exec(select(Lead.id).where(Lead.phone == phone))).first()
+        if lead_id is not None:
+            return lead_id
+        lead = Lead(name=f"Caller {phone}", phone=phone, notes="Left a voicemail while all agents were busy")
+        session.add(lead)
+        try:
+            await session.commit()
+        except IntegrityError:
+            # Created by a concurrent request for the same number
+            await session.rollback()
+            return (await session.exec(select(Lead.id).where(Lead.phone == phone))).first()
+        await session.refresh(lead)
+        live_feed.lead_changed(lead.model_dump())
+        return lead.id
+
+def from_twilio(request: Request, form_data) -> bool:
+    """Whether X-Twilio-Signature matches the public URL Twilio called (behind ngrok/proxies, via DOMAIN)."""
+    if not TWILIO_VALIDATE_SIGNATURES:
+        return True
+    signature = request.headers.get("X-Twilio-Signature")
+    if not (signature and TWILIO_AUTH_TOKEN and DOMAIN):
+        return False
+    url = f"https://{DOMAIN}{request.url.path}" + (f"?{request.url.query}" if request.url.query else "")
+    return RequestValidator(TWILIO_AUTH_TOKEN).validate(url, dict(form_data), signature)
+
+@app.post("/voicemail")
+async def voicemail(request: Request, lead_id: int = None):
+    """Twilio <Record> callback from the fallback TwiML: logs the message against the lead."""
+    form_data = await request.form()
+    if not from_twilio(request, form_data):
+        print(f"Voicemail callback rejected: bad or missing X-Twilio-Signature from {request.client.host if request.client else '?'}")
+        raise HTTPException(status_code=403, detail="Invalid Twilio signature")
+    recording_url = form_data.get("RecordingUrl")
+    caller = form_data.get("From")
+    if recording_url and lead_id is None and caller and ADMISSION_VOICEMAIL_LEADS:
+        # Inbound caller: match the lead by phone number, or file them as a new lead so
+        # the message (these are the callers shed under load) isn't lost
+        lead_id = await lead_for_caller(caller)
+    if recording_url:
+        content = f"Voicemail ({form_data.get('RecordingDuration', '?')}s) from {caller}: {recording_url}"
+        if not await interaction_log.log(lead_id, "voicemail", content):
+            print(f"Voicemail not logged: {content}")
+    response = VoiceResponse()
+    response.hangup()
+    return HTMLResponse(content=str(response), media_type="application/xml")
+
 @app.post("/incoming-call")
 async def incoming_call(request: Request, lead_id: int = None):
     """Returns TwiML to connect the call to the WebSocket stream."""
+    form_data = await request.form()
+    call_sid = form_data.get("CallSid")
+    # Pin the media stream to a worker with room for it
+    worker = await call_registry.route(call_sid, lead_id)
+    if worker is not None and worker["worker_id"] == call_registry.worker_id and not admission.admit_call(call_sid):
+        # Routed here but this worker is overloaded (other workers see it advertising no capacity)
+        await call_registry.end(call_sid)
+        worker = None
+    if worker is None:
+        await warmer.release(call_sid)
+        return fallback_twiml(lead_id)
+
     response = VoiceResponse()
     response.say("Connected to Gemini AI. Please start speaking.")
     connect = Connect()
     
-    stream_url = f"wss://{DOMAIN}/media-stream"
+    stream_url = f"{worker['stream_url']}/media-stream"
     if lead_id:
         stream_url += f"?lead_id={lead_id}"
         
-    connect.stream(url=stream_url)
+    stream = connect.stream(url=stream_url)
+    if lead_id:
+        # Twilio may drop query strings from stream URLs; custom parameters come back in "start"
+        stream.parameter(name="lead_id", value=str(lead_id))
     response.append(connect)
     return HTMLResponse(content=str(response), media_type="application/xml")
 
@@ -269,171 +668,239 @@ async def send_sms(to: str, message: str):
         raise HTTPException(status_code=400, detail="Emergency numbers are blocked.")
 
     try:
-        msg = client.messages.create(
-            to=to,
-            from_=PHONE_NUMBER_FROM,
-            body=message
-        )
-        return {"message": "SMS sent", "sid": msg.sid}
+        msg = await twilio_rest.send_sms(to=to, body=message)
+        return {"message": "SMS sent", "sid": msg["sid"]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+class SmsMessage(SQLModel):
+    to: str
+    message: str
+
+@app.post("/send-sms/batch")
+async def send_sms_batch(messages: list[SmsMessage]):
+    """Sends many SMS concurrently over the pooled Twilio client; reports per-message sid or error."""
+    blocked = [m.to for m in messages if m.to.replace("+", "").strip() in BLOCKED_NUMBERS]
+    if blocked:
+        raise HTTPException(status_code=400, detail=f"Emergency numbers are blocked: {', '.join(blocked)}")
+    results = await twilio_rest.send_sms_batch([(m.to, m.message) for m in messages])
+    return {"sent": sum(1 for r in results if "sid" in r), "failed": sum(1 for r in results if "error" in r), "results": results}
+
 @app.post("/incoming-sms")
 async def incoming_sms(request: Request):
-    """Handles incoming SMS webhooks from Twilio."""
+    """Handles incoming SMS webhooks from Twilio: queued for the SMS inbox, acknowledged at once."""
     form_data = await request.form()
-    sender = form_data.get("From")
-    body = form_data.get("Body")
-    
-    print(f"Received SMS from {sender}: {body}")
-    
-    # Simple Auto-Reply
-    response = MessagingResponse()
-    response.message(f"Thanks for your message: '{body}'. Gemini Voice Agent received it.")
-    
-    return HTMLResponse(content=str(response), media_type="application/xml")
+    await sms_inbox.message(form_data.get("From"), form_data.get("Body"), form_data.get("MessageSid"))
+    # Empty TwiML: any auto-reply goes out through the REST API once the message is processed
+    return HTMLResponse(content=str(MessagingResponse()), media_type="application/xml")
 
+@app.post("/sms-status")
+async def sms_status(request: Request):
+    """Twilio status callback for broadcast messages."""
+    form_data = await request.form()
+    await sms_inbox.status(form_data.get("MessageSid"), form_data.get("MessageStatus"), form_data.get("ErrorCode"))
+    return Response(status_code=204)
 
+# SMS broadcasts
+@app.post("/sms-broadcasts")
+async def new_sms_broadcast(broadcast: SmsBroadcastCreate, session: AsyncSession = Depends(get_async_session)):
+    """Creates a draft broadcast queuing a message to every lead that matches `lead_status` / `query`."""
+    try:
+        return await create_broadcast(session, broadcast.name, broadcast.template, broadcast.lead_status,
+                                      broadcast.query, broadcast.max_attempts)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/sms-broadcasts")
+async def list_sms_broadcasts(session: AsyncSession = Depends(get_async_session)):
+    """All broadcasts with their progress."""
+    broadcasts = (await session.exec(select(SmsBroadcast).order_by(SmsBroadcast.id.desc()))).all()
+    return [await broadcast_stats(session, b) for b in broadcasts]
+
+@app.get("/sms-broadcasts/{broadcast_id}")
+async def get_sms_broadcast(broadcast_id: int, session: AsyncSession = Depends(get_async_session)):
+    """Broadcast progress plus this worker's sender and inbox counters."""
+    broadcast = await session.get(SmsBroadcast, broadcast_id)
+    if not broadcast:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return {**await broadcast_stats(session, broadcast), "sender": sms_sender.summary(), "inbox": sms_inbox.summary()}
+
+@app.post("/sms-broadcasts/{broadcast_id}/start")
+async def start_sms_broadcast(broadcast_id: int, session: AsyncSession = Depends(get_async_session)):
+    """Starts or resumes sending."""
+    return await _set_broadcast_status(session, broadcast_id, "running")
+
+@app.post("/sms-broadcasts/{broadcast_id}/pause")
+async def pause_sms_broadcast(broadcast_id: int, session: AsyncSession = Depends(get_async_session)):
+    """Stops sending new messages; messages already handed to Twilio are still delivered."""
+    return await _set_broadcast_status(session, broadcast_id, "paused")
+
+async def _set_broadcast_status(session: AsyncSession, broadcast_id: int, status: str) -> dict:
+    broadcast = await session.get(SmsBroadcast, broadcast_id)
+    if not broadcast:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    if broadcast.status == "completed":
+        raise HTTPException(status_code=409, detail="Broadcast already completed")
+    if status == "running" and not DOMAIN:
+        raise HTTPException(status_code=500, detail="DOMAIN environment variable not set")
+    broadcast.status = status
+    session.add(broadcast)
+    await session.commit()
+    await session.refresh(broadcast)
+    sms_sender.wake()
+    return await broadcast_stats(session, broadcast)
+
+
+async def live_responses(session):
+    """session.receive() ends after every model turn; this keeps reading until the session closes."""
+    while True:
+        received = False
+        async for response in session.receive():
+            received = True
+            yield response
+        if not received:
+            return
+
+# /w/<worker>/media-stream is the same endpoint; the prefix lets a reverse
+# proxy send a pinned stream to its worker (see workers.py)
+@app.websocket("/w/{worker}/media-stream")
 @app.websocket("/media-stream")
 async def handle_media_stream(websocket: WebSocket, lead_id: int = None):
     """Handles the WebSocket connection between Twilio and Gemini."""
     await websocket.accept()
     print(f"Twilio connected. Lead ID: {lead_id}")
 
-    stream_sid = None
-    
-    # Dynamic Context Loading
-    dynamic_instruction = SYSTEM_INSTRUCTION
-    if lead_id:
-        with Session(engine) as db_session:
-            lead = db_session.get(Lead, lead_id)
-            if lead:
-                print(f"Loading context for: {lead.name}")
-                context_note = f"\n\n**CURRENT CALL CONTEXT**\n" \
-                               f"You are speaking with {lead.name}.\n" \
-                               f"Phone: {lead.phone}\n" \
-                               f"Status: {lead.status}\n" \
-                               f"Previous Notes: {lead.notes or 'None'}\n" \
-                               f"Goal: Update them on their inquiry and save any new notes using the 'update_lead_tool'."
-                dynamic_instruction += context_note
-
-    # Configuration for Gemini Session
-    # Gemini usually expects PCM 16kHz or 24kHz. Twilio sends 8kHz mulaw.
-    # We will need to resample/transcode.
-    # For this implementation, we rely on Gemini's robust input handling if possible,
-    # but strictly we should decode mulaw->pcm.
-    
-    model = "gemini-2.0-flash-exp"
-    config = {
-        "response_modalities": ["AUDIO"],
-        "system_instruction": types.Content(parts=[types.Part(text=dynamic_instruction)]),
-        "speech_config": {
-            "voice_config": {"prebuilt_voice_config": {"voice_name": "Puck"}},
-        },
-        "tools": [types.Tool(function_declarations=[check_inventory, query_knowledge_base, update_lead_tool])]
-    }
+    connected_at = time.monotonic()
+    call_metrics = CallMetrics()
+    # perf_counter() of the caller's last voiced frame, cleared once the model answers
+    speech_ended_at = None
+    # Paced, clearable playback queue towards Twilio
+    pacer = OutboundPacer(websocket)
 
-    async with gemini_client.aio.live.connect(model=model, config=config) as session:
+    # Twilio sends "connected" then "start" before any audio; the call SID in
+    # "start" picks up the Gemini session pre-warmed when the call was dialed
+    start = None
+    try:
+        async for message in websocket.iter_text():
+            data = json.loads(message)
+            if data["event"] == "start":
+                start = data["start"]
+                break
+    except WebSocketDisconnect:
+        pass
+    if start is None:
+        print("Twilio disconnected before the stream started")
+        return
+    stream_sid = start["streamSid"]
+    call_sid = start.get("callSid")
+    lead_param = (start.get("customParameters") or {}).get("lead_id")
+    if lead_id is None and lead_param and str(lead_param).isdigit():
+        lead_id = int(lead_param)
+    pacer.set_stream_sid(stream_sid)
+    print(f"Stream started: {stream_sid}")
+    await interaction_log.log(lead_id, "call_start", f"Call connected (call {call_sid})")
+
+    # The stream is registered to this worker and counts against the dialer's
+    # per-worker call cap and admission control while it's open
+    async with call_registry.stream(call_sid, lead_id), dialer.stream_slot(call_sid), \
+            admission.session(call_sid, pacer), recorder.record(call_sid, lead_id, pacer) as recording, \
+            live_feed.call(call_sid, lead_id), warmer.session(call_sid, lead_id) as session:
         print("Connected to Gemini Live API")
         
         async def receive_from_twilio():
-            nonlocal stream_sid
-            # Maintain state for consistent audio processing
-            # state is used by ratecv to handle fractional samples between chunks
-            downstream_state = None 
+            nonlocal speech_ended_at
+            # Batches frames and thins out silence before they are transcoded
+            coalescer = InboundCoalescer()
+            # Stateful transcoder keeps resampler history between batches
+            transcoder = InboundTranscoder(INBOUND_SILENCE_RMS)
+
+            async def forward(outgoing: bytes):
+                # Transcoding: Twilio (8kHz mulaw) -> Gemini (16kHz PCM), decode and upsample in one pass
+                started = time.perf_counter()
+                pcm_16k = transcoder.process(outgoing)
+                call_metrics.observe_transcode("in", time.perf_counter() - started)
+                await session.send(input={"data": pcm_16k, "mime_type": "audio/pcm"}, end_of_turn=False)
 
             try:
                 async for message in websocket.iter_text():
+                    arrived = time.perf_counter()
                     data = json.loads(message)
-                    if data["event"] == "start":
-                        stream_sid = data["start"]["streamSid"]
-                        print(f"Stream started: {stream_sid}")
+                    if data["event"] == "mark":
+                        pacer.on_mark(data["mark"]["name"])
                     elif data["event"] == "media":
                         media_payload = data["media"]["payload"]
                         chunk = base64.b64decode(media_payload)
+                        if recording is not None:
+                            recording.inbound(chunk)
                         
-                        # Transcoding: Twilio (8kHz mulaw) -> Gemini (16kHz PCM)
-                        # 1. Decode mulaw to 16-bit PCM (8kHz)
-                        pcm_8k = audioop.ulaw2lin(chunk, 2)
-                        
-                        # Debug: Print audio energy (RMS) to see if we are receiving silence
-                        rms = audioop.rms(pcm_8k, 2)
-                        if rms > 100: # Only log if there's significant sound to avoid spam
-                            print(f"Audio received (RMS: {rms})")
-                        
-                        # 2. Upsample 8kHz -> 16kHz
-                        # simple way: ratecv(fragment, width, nchannels, inrate, outrate, state)
-                        pcm_16k, downstream_state = audioop.ratecv(pcm_8k, 2, 1, 8000, 16000, downstream_state)
-                        
-                        await session.send(input={"data": pcm_16k, "mime_type": "audio/pcm"}, end_of_turn=False)
+                        # Energy (RMS) of the raw frame decides speech vs. silence
+                        speech = transcoder.is_speech(chunk)
+                        if speech:
+                            speech_ended_at = time.perf_counter()
+
+                        outgoing = coalescer.push(chunk, speech)
+                        if outgoing:
+                            await forward(outgoing)
+                            call_metrics.observe("frame_to_send", time.perf_counter() - arrived)
                         
                     elif data["event"] == "stop":
                         print("Stream stopped")
+                        outgoing = coalescer.flush()
+                        if outgoing:
+                            await forward(outgoing)
             except WebSocketDisconnect:
                 print("Twilio disconnected")
             except Exception as e:
                 print(f"Error receiving from Twilio: {e}")
+            finally:
+                print(f"Inbound audio stats: {coalescer.summary()}")
 
         async def send_to_twilio():
-            # Maintain state for consistent audio processing
-            upstream_state = None
+            nonlocal speech_ended_at
+            # Stateful transcoder keeps resampler history between Gemini chunks
+            transcoder = OutboundTranscoder()
+            tool_tasks = set()
+            # Set from the first audio chunk of a model turn until it completes
+            answering = False
+            # Transcription arrives in fragments; one log row per turn
+            user_text, model_text = [], []
+
+            async def flush_transcript(parts: list, type: str):
+                text = "".join(parts).strip()
+                parts.clear()
+                if text:
+                    await interaction_log.log(lead_id, type, text)
+
+            async def run_tools(tool_call):
+                for name, args, result in await tool_registry.respond(session, tool_call):
+                    await interaction_log.log(lead_id, "tool", f"{name}({json.dumps(args)}) -> {result}")
 
             try:
-                async for response in session.receive():
+                async for response in live_responses(session):
+                    # Handle Tool Call (runs off the receive loop so audio keeps flowing)
+                    if response.tool_call is not None:
+                        names = [fc.name for fc in response.tool_call.function_calls or []]
+                        print(f"Gemini requested tools: {names}")
+                        task = asyncio.create_task(run_tools(response.tool_call))
+                        tool_tasks.add(task)
+                        task.add_done_callback(tool_tasks.discard)
+
                     if response.server_content is None:
                         continue
 
-                    # Handle Tool Call
-                    tool_call = response.server_content.tool_call
-                    if tool_call is not None:
-                        print(f"Gemini requested tool: {tool_call.function_calls[0].name}")
-                        for fc in tool_call.function_calls:
-                            if fc.name == "check_inventory":
-                                args = fc.args
-                                result = check_inventory(args["product_name"])
-                                
-                                # Send result back to Gemini
-                                tool_response = types.LiveClientToolResponse(
-                                    function_responses=[types.FunctionResponse(
-                                        name=fc.name,
-                                        id=fc.id,
-                                        response={"result": result}
-                                    )]
-                                )
-                                print(f"Sending tool response: {result}")
-                                await session.send(input=tool_response)
-                            elif fc.name == "query_knowledge_base":
-                                args = fc.args
-                                result = query_knowledge_base(args["query"])
-                                
-                                tool_response = types.LiveClientToolResponse(
-                                    function_responses=[types.FunctionResponse(
-                                        name=fc.name, # Corrected: using fc.name dynamically is safer or string literal "query_knowledge_base"
-                                        id=fc.id,
-                                        response={"result": result}
-                                    )]
-                                )
-                                print(f"Sending RAG response: {result[:50]}...")
-                                await session.send(input=tool_response)
-
-                            elif fc.name == "update_lead_tool":
-                                args = fc.args
-                                # Gemini might pass status as None/null, need to handle
-                                result = update_lead_tool(
-                                    phone=args.get("phone"), 
-                                    notes=args.get("notes"),
-                                    status=args.get("status")
-                                )
-                                
-                                tool_response = types.LiveClientToolResponse(
-                                    function_responses=[types.FunctionResponse(
-                                        name=fc.name,
-                                        id=fc.id,
-                                        response={"result": result}
-                                    )]
-                                )
-                                print(f"Sending CRM Update response: {result}")
-                                await session.send(input=tool_response)
+                    if response.server_content.input_transcription and response.server_content.input_transcription.text:
+                        user_text.append(response.server_content.input_transcription.text)
+                    if response.server_content.output_transcription and response.server_content.output_transcription.text:
+                        # The model answering closes the caller's turn
+                        await flush_transcript(user_text, "transcript_user")
+                        model_text.append(response.server_content.output_transcription.text)
+
+                    # Caller barged in: stop playing the stale answer
+                    if response.server_content.interrupted:
+                        speech_ended_at = None
+                        answering = False
+                        await pacer.interrupt()
+                        await flush_transcript(model_text, "transcript_model")
 
                     # Handle Audio
                     model_turn = response.server_content.model_turn
@@ -442,33 +909,63 @@ async def handle_media_stream(websocket: WebSocket, lead_id: int = None):
                             if part.inline_data is not None:
                                 # Audio back from Gemini
                                 audio_data = part.inline_data.data 
+                                received = time.perf_counter()
+                                if not answering and speech_ended_at is not None:
+                                    # First audio of the answer to what the caller just said
+                                    call_metrics.observe("response_latency", received - speech_ended_at)
+                                    speech_ended_at = None
+                                answering = True
                                 
                                 # Transcoding: Gemini (24kHz PCM) -> Twilio (8kHz mulaw)
-                                # 1. Downsample 24kHz -> 8kHz
                                 # Gemini Live usually returns 24kHz. If voice sounds weird, check this rate.
-                                pcm_8k, upstream_state = audioop.ratecv(audio_data, 2, 1, 24000, 8000, upstream_state)
+                                mulaw_8k = transcoder.process(audio_data)
+                                call_metrics.observe_transcode("out", time.perf_counter() - received)
                                 
-                                # 2. Encode 16-bit PCM -> 8-bit mulaw
-                                mulaw_8k = audioop.lin2ulaw(pcm_8k, 2)
-                                
-                                b64_audio = base64.b64encode(mulaw_8k).decode("utf-8")
-                                
-                                await websocket.send_json({
-                                    "event": "media",
-                                    "streamSid": stream_sid,
-                                    "media": {
-                                        "payload": b64_audio
-                                    }
-                                })
+                                # Re-sliced into 20ms frames and paced out by the pacer
+                                pacer.feed(mulaw_8k)
+
+                    if response.server_content.turn_complete:
+                        answering = False
+                        pacer.end_turn()
+                        await flush_transcript(user_text, "transcript_user")
+                        await flush_transcript(model_text, "transcript_model")
             except Exception as e:
                 print(f"Error sending to Twilio: {e}")
                 import traceback
                 traceback.print_exc()
-
-        await asyncio.gather(receive_from_twilio(), send_to_twilio())
+            finally:
+                for task in tool_tasks:
+                    task.cancel()
+                await flush_transcript(user_text, "transcript_user")
+                await flush_transcript(model_text, "transcript_model")
+
+        def pacer_done(task: asyncio.Task):
+            if not task.cancelled() and task.exception() is not None:
+                print(f"Outbound pacer failed, ending call {call_sid}: {task.exception()!r}")
+
+        pacer_task = asyncio.create_task(pacer.run())
+        pacer_task.add_done_callback(pacer_done)
+        legs = [asyncio.create_task(receive_from_twilio()), asyncio.create_task(send_to_twilio())]
+        try:
+            # Either side ending (caller hung up, Gemini closed) ends the call,
+            # and so does the pacer dying: the caller would hear nothing more
+            await asyncio.wait([*legs, pacer_task], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in legs:
+                task.cancel()
+            pacer_task.cancel()
+            await asyncio.gather(*legs, pacer_task, return_exceptions=True)
+            await interaction_log.log(lead_id, "call_end", f"Call ended after {time.monotonic() - connected_at:.0f}s")
+            print(f"Outbound audio stats: {pacer.summary()}")
+            print(f"Tool latency: {tool_registry.stats()}")
+            print(f"Call warm-up: {warmer.summary()}")
+            print(f"Call metrics: {call_metrics.summary()}")
 
 if __name__ == "__main__":
     import uvicorn
+    from workers import WORKERS, run_workers
+    if WORKERS > 1 and not os.getenv("WORKER_INDEX"):
+        sys.exit(run_workers(os.path.abspath(__file__)))
     # Twilio does not support WebSocket Ping/Pong, so we must disable it in Uvicorn
     # to prevent "keepalive ping timeout" errors.
     uvicorn.run(app, host="0.0.0.0", port=PORT, ws_ping_interval=None, ws_ping_timeout=None, timeout_keep_alive=60)
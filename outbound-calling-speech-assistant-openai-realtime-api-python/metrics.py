@@ -0,0 +1,217 @@
+import os
+import time
+import asyncio
+from bisect import bisect_left
+
+# In-process latency / throughput metrics with a Prometheus text exporter.
+# Histograms have fixed buckets, so observe() is a bisect and two adds: cheap
+# enough for the per-frame audio path. Each call also keeps its own copies of
+# the call-path histograms for the summary printed at hangup.
+
+LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", 0.1))
+
+LATENCY_BUCKETS = (0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TRANSCODE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _HistogramData:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """Fixed-bucket histogram, optionally split by label values."""
+
+    def __init__(self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series: dict[tuple, _HistogramData] = {}
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = _HistogramData(len(self.buckets) + 1)
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def quantile(self, q: float, *label_values) -> float | None:
+        """Upper bound of the bucket holding the q-quantile (None without data)."""
+        series = self._series.get(label_values)
+        if series is None or series.count == 0:
+            return None
+        rank = q * series.count
+        seen = 0
+        for i, n in enumerate(series.counts):
+            seen += n
+            if seen >= rank and n:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def summary(self, *label_values, scale: float = 1000.0) -> dict:
+        """count / avg / p50 / p95 / p99 in milliseconds (bucket resolution)."""
+        series = self._series.get(label_values)
+        if series is None or series.count == 0:
+            return {"count": 0}
+        return {
+            "count": series.count,
+            "avg": round(series.sum / series.count * scale, 2),
+            **{f"p{int(q * 100)}": round(self.quantile(q, *label_values) * scale, 2) for q in (0.5, 0.95, 0.99)},
+        }
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), series.counts):
+                cumulative += n
+                labels = _format_labels(self.labels, label_values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {series.sum}")
+            lines.append(f"{self.name}_count{labels} {series.count}")
+        return lines
+
+
+class Counter:
+    """Either inc() directly or read a running total from a callback at scrape time."""
+
+    def __init__(self, name: str, help: str, labels: tuple = (), callback=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.callback = callback
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, *label_values):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        if self.callback:
+            return lines + [f"{self.name} {self.callback()}"]
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Gauge:
+    """Either set() directly or read from a callback at scrape time."""
+
+    def __init__(self, name: str, help: str, callback=None):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def render(self) -> list[str]:
+        value = self.callback() if self.callback else self.value
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                print(f"Metric {metric.name} failed to render: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+FRAME_TO_SEND_SECONDS = registry.histogram(
+    "voice_inbound_frame_to_send_seconds", "Twilio media frame arrival to audio sent to Gemini")
+RESPONSE_LATENCY_SECONDS = registry.histogram(
+    "voice_response_latency_seconds", "End of caller speech to first model audio byte")
+TRANSCODE_SECONDS = registry.histogram(
+    "voice_transcode_seconds", "Audio transcoding time per frame / chunk", TRANSCODE_BUCKETS, labels=("direction",))
+TOOL_SECONDS = registry.histogram(
+    "voice_tool_duration_seconds", "Gemini tool call duration", labels=("tool",))
+LOOP_LAG_SECONDS = registry.histogram(
+    "event_loop_lag_seconds", "How late the event loop woke a periodic timer")
+CALLS_TOTAL = registry.counter("voice_calls_total", "Media streams handled")
+LOOP_LAG_LAST = registry.gauge("event_loop_lag_last_seconds", "Most recent event loop lag sample")
+PROCESS_CPU_SECONDS = registry.counter(
+    "process_cpu_seconds_total", "CPU time used by this worker process", callback=time.process_time)
+
+# Metrics recorded per call as well as globally
+CALL_METRICS = {
+    "frame_to_send": FRAME_TO_SEND_SECONDS,
+    "response_latency": RESPONSE_LATENCY_SECONDS,
+}
+
+
+class CallMetrics:
+    """Per-call view of the call-path histograms; observations also go to the global ones."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.local = {
+            key: Histogram(metric.name, metric.help, metric.buckets) for key, metric in CALL_METRICS.items()
+        }
+        self.transcode = Histogram(TRANSCODE_SECONDS.name, TRANSCODE_SECONDS.help, TRANSCODE_BUCKETS, labels=("direction",))
+        CALLS_TOTAL.inc()
+
+    def observe(self, key: str, value: float):
+        self.local[key].observe(value)
+        CALL_METRICS[key].observe(value)
+
+    def observe_transcode(self, direction: str, value: float):
+        self.transcode.observe(value, direction)
+        TRANSCODE_SECONDS.observe(value, direction)
+
+    def summary(self) -> dict:
+        return {
+            "duration_s": round(time.monotonic() - self.started, 1),
+            **{key: hist.summary() for key, hist in self.local.items()},
+            "transcode_in": self.transcode.summary("in"),
+            "transcode_out": self.transcode.summary("out"),
+        }
+
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL_SECONDS, on_sample=None):
+    """Samples event loop lag forever: how much later than asked a sleep returns; on_sample(lag) sees each sample."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        LOOP_LAG_SECONDS.observe(lag)
+        LOOP_LAG_LAST.set(lag)
+        if on_sample:
+            on_sample(lag)
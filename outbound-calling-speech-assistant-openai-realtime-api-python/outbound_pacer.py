@@ -0,0 +1,144 @@
+import os
+import json
+import asyncio
+import base64
+
+# Outbound stage between Gemini and Twilio.
+# Gemini returns audio in bursts of arbitrary size. The pacer re-slices it into
+# 20ms Twilio frames, pre-serializes the media envelopes and sends them at
+# real-time pace with a small lead, so Twilio never holds more than a few
+# frames. On barge-in the local queue is dropped and Twilio is told to `clear`.
+
+FRAME_BYTES = 160  # 20ms of 8kHz mu-law
+FRAME_SECONDS = 0.02
+ULAW_SILENCE = b"\xff"
+# How far ahead of real-time playback we let Twilio's buffer run
+OUTBOUND_LEAD_MS = int(os.getenv("OUTBOUND_LEAD_MS", 100))
+# Bounded per-call playback queue (frames, 30s by default). feed() never waits:
+# it runs on the loop that also delivers Gemini's `interrupted` event, so
+# frames beyond the cap are dropped (and counted) instead
+OUTBOUND_QUEUE_FRAMES = int(os.getenv("OUTBOUND_QUEUE_FRAMES", 1500))
+
+
+class OutboundPacer:
+    """Per-call paced playback queue with Twilio `clear`/`mark` support."""
+
+    def __init__(self, websocket, stream_sid: str = None, lead_ms: int = OUTBOUND_LEAD_MS, max_frames: int = OUTBOUND_QUEUE_FRAMES):
+        self.websocket = websocket
+        self.lead = lead_ms / 1000
+        self.queue = asyncio.Queue(maxsize=max_frames)
+        self.stream_sid = None
+        self._carry = b""
+        self._generation = 0
+        self._turn = 0
+        self.pending_marks = set()
+        # Optional tap(frame) called with each mu-law frame as it is sent (call recording)
+        self.tap = None
+
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.frames_overflowed = 0
+        self.clears = 0
+        self.set_stream_sid(stream_sid)
+
+    def set_stream_sid(self, stream_sid: str):
+        self.stream_sid = stream_sid
+        head = json.dumps({"event": "media", "streamSid": stream_sid, "media": {"payload": ""}})
+        # Split the envelope around the empty payload so each frame is one concat
+        self._prefix, self._suffix = head.rsplit('""', 1)
+        self._prefix += '"'
+        self._suffix = '"' + self._suffix
+
+    @property
+    def depth(self) -> int:
+        """Frames waiting locally (not yet handed to Twilio)."""
+        return self.queue.qsize()
+
+    def _put(self, item) -> bool:
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def feed(self, mulaw: bytes):
+        """Slices model audio into 20ms frames and queues their envelopes; never blocks."""
+        if self._carry:
+            mulaw = self._carry + mulaw
+        whole = len(mulaw) - len(mulaw) % FRAME_BYTES
+        self._carry = mulaw[whole:]
+        generation = self._generation
+        for i in range(0, whole, FRAME_BYTES):
+            frame = mulaw[i:i + FRAME_BYTES]
+            payload = base64.b64encode(frame).decode("ascii")
+            if not self._put((generation, None, self._prefix + payload + self._suffix, frame)):
+                self.frames_overflowed += 1
+
+    def end_turn(self):
+        """Pads out the last partial frame and queues a mark behind the turn's audio."""
+        if self._carry:
+            self.feed(ULAW_SILENCE * (FRAME_BYTES - len(self._carry)))
+        self._turn += 1
+        name = f"turn-{self._turn}"
+        mark = json.dumps({"event": "mark", "streamSid": self.stream_sid, "mark": {"name": name}})
+        if self._put((self._generation, name, mark, None)):
+            self.pending_marks.add(name)
+
+    def on_mark(self, name: str):
+        """Twilio echoes a mark once everything queued before it has played (or was cleared)."""
+        self.pending_marks.discard(name)
+
+    async def interrupt(self):
+        """Barge-in: drop queued audio and tell Twilio to discard its buffer."""
+        self._generation += 1
+        self._carry = b""
+        while not self.queue.empty():
+            _, mark, _, _ = self.queue.get_nowait()
+            if mark is None:
+                self.frames_dropped += 1
+            else:
+                # Never reached Twilio, so it will never be echoed back
+                self.pending_marks.discard(mark)
+        self.clears += 1
+        if self.stream_sid:
+            await self.websocket.send_text(json.dumps({"event": "clear", "streamSid": self.stream_sid}))
+
+    async def run(self):
+        """Sends queued envelopes at 20ms spacing, at most `lead` ahead of playback."""
+        loop = asyncio.get_running_loop()
+        next_due = None
+        generation = self._generation
+        while True:
+            item_generation, mark, envelope, frame = await self.queue.get()
+            if item_generation != self._generation:
+                continue
+            if generation != self._generation:
+                # Playback was cleared: restart the schedule from now
+                generation = self._generation
+                next_due = None
+            if mark is not None:
+                await self.websocket.send_text(envelope)
+                continue
+            now = loop.time()
+            if next_due is None or next_due < now:
+                next_due = now
+            delay = next_due - self.lead - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+                if item_generation != self._generation:
+                    self.frames_dropped += 1
+                    continue
+            await self.websocket.send_text(envelope)
+            if self.tap is not None:
+                self.tap(frame)
+            self.frames_sent += 1
+            next_due += FRAME_SECONDS
+
+    def summary(self) -> dict:
+        return {
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "frames_overflowed": self.frames_overflowed,
+            "clears": self.clears,
+            "pending_marks": len(self.pending_marks),
+        }
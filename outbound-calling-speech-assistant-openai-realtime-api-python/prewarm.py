@@ -0,0 +1,136 @@
+import os
+import time
+import asyncio
+import contextlib
+
+# Call pre-warming.
+# Opening the Gemini Live session (lead lookup, instruction, websocket + setup
+# handshake) used to start only once Twilio connected /media-stream, i.e.
+# after the callee picked up. The warmer starts that work when the call is
+# dialed, parks the open session under the Twilio call SID, and hands it to
+# the media stream when it starts. Sessions for calls nobody answers are
+# closed after WARM_TTL_SECONDS or on the final status callback.
+
+WARM_TTL_SECONDS = float(os.getenv("WARM_TTL_SECONDS", 60))
+# How long a media stream waits for a warm session still connecting before going cold
+WARM_WAIT_SECONDS = float(os.getenv("WARM_WAIT_SECONDS", 5))
+PREWARM_CALLS = os.getenv("PREWARM_CALLS", "true").lower() in ("1", "true", "yes")
+
+
+class WarmCall:
+    def __init__(self, lead_id: int = None):
+        self.lead_id = lead_id
+        self.call_sid = None
+        self.started = time.monotonic()
+        self.ready_at = None
+        self.claimed_at = None
+        self.context = None   # the live.connect() async context manager
+        self.session = None
+        self.task = None
+        self.expiry = None
+
+
+class CallWarmer:
+    """
+    Registry of Gemini Live sessions opened ahead of the call.
+    build_config(lead_id) -> live config coroutine; open_session(config) -> async context manager.
+    """
+
+    def __init__(self, build_config, open_session, ttl: float = WARM_TTL_SECONDS, enabled: bool = PREWARM_CALLS):
+        self.build_config = build_config
+        self.open_session = open_session
+        self.ttl = ttl
+        self.enabled = enabled
+        self.calls: dict[str, WarmCall] = {}
+        self.stats = {"started": 0, "hits": 0, "misses": 0, "expired": 0, "failed": 0, "saved_ms": 0.0}
+
+    def start(self, lead_id: int = None) -> WarmCall | None:
+        """Starts preparing a session for a call about to be dialed."""
+        if not self.enabled:
+            return None
+        warm = WarmCall(lead_id)
+        warm.task = asyncio.create_task(self._prepare(warm))
+        warm.expiry = asyncio.get_running_loop().call_later(self.ttl, self._expire, warm)
+        self.stats["started"] += 1
+        return warm
+
+    async def _prepare(self, warm: WarmCall):
+        config = await self.build_config(warm.lead_id)
+        warm.context = self.open_session(config)
+        warm.session = await warm.context.__aenter__()
+        warm.ready_at = time.monotonic()
+
+    def bind(self, warm: WarmCall | None, call_sid: str):
+        """Files a warm session under the SID Twilio gave the call."""
+        if warm is None:
+            return
+        warm.call_sid = call_sid
+        self.calls[call_sid] = warm
+
+    def _expire(self, warm: WarmCall):
+        if warm.call_sid is None or self.calls.get(warm.call_sid) is warm:
+            self.stats["expired"] += 1
+            self.calls.pop(warm.call_sid, None)
+            asyncio.create_task(self.discard(warm))
+
+    async def discard(self, warm: WarmCall | None):
+        """Closes a warm session that won't be used (dial failed, unanswered, expired)."""
+        if warm is None:
+            return
+        if warm.expiry:
+            warm.expiry.cancel()
+        if not warm.task.done():
+            warm.task.cancel()
+        with contextlib.suppress(BaseException):
+            await warm.task
+        if warm.session is not None:
+            warm.session = None
+            with contextlib.suppress(Exception):
+                await warm.context.__aexit__(None, None, None)
+
+    async def release(self, call_sid: str):
+        """Final call status arrived: drop the session if the call never streamed."""
+        warm = self.calls.pop(call_sid, None)
+        if warm is not None:
+            await self.discard(warm)
+
+    async def _claim(self, call_sid: str) -> WarmCall | None:
+        warm = self.calls.pop(call_sid, None) if call_sid else None
+        if warm is None:
+            return None
+        warm.expiry.cancel()
+        warm.claimed_at = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(warm.task), WARM_WAIT_SECONDS)
+            return warm
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"Warm session for {call_sid} unusable ({type(e).__name__}: {e}); connecting cold")
+            await self.discard(warm)
+            return None
+
+    @contextlib.asynccontextmanager
+    async def session(self, call_sid: str = None, lead_id: int = None):
+        """The call's Gemini Live session: the pre-warmed one if there is one, else opened now."""
+        warm = await self._claim(call_sid)
+        if warm is not None:
+            self.stats["hits"] += 1
+            # Connect time the caller didn't have to wait for
+            self.stats["saved_ms"] += (min(warm.ready_at, warm.claimed_at) - warm.started) * 1000
+            print(f"Using warm Gemini session (ready {warm.claimed_at - warm.ready_at:.1f}s before the stream)")
+            async with contextlib.AsyncExitStack() as stack:
+                stack.push_async_exit(warm.context)
+                yield warm.session
+            return
+        self.stats["misses"] += 1
+        config = await self.build_config(lead_id)
+        async with self.open_session(config) as session:
+            yield session
+
+    def summary(self) -> dict:
+        hits = self.stats["hits"]
+        return {
+            **{k: v for k, v in self.stats.items() if k != "saved_ms"},
+            "waiting": len(self.calls),
+            "avg_connect_saved_ms": round(self.stats["saved_ms"] / hits, 1) if hits else 0.0,
+        }
@@ -0,0 +1,137 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+
+# Cache tiers for the knowledge base.
+# - LRUCache: in-process, size + TTL bounded, thread safe (tools run on a pool).
+# - DiskEmbeddingCache: SQLite file so embeddings survive restarts; the file is
+#   opened on first lookup, so creating the cache (at import) touches no disk.
+# Callers ask the same few questions (warranty, returns, support hours) over and
+# over, so most lookups never need the remote embedding call.
+
+RAG_CACHE_SIZE = int(os.getenv("RAG_CACHE_SIZE", 2048))
+RAG_CACHE_TTL_SECONDS = float(os.getenv("RAG_CACHE_TTL_SECONDS", 3600))
+RAG_DISK_CACHE_PATH = os.getenv("RAG_DISK_CACHE_PATH", "./embedding_cache.db")
+RAG_DISK_CACHE_TTL_SECONDS = float(os.getenv("RAG_DISK_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+RAG_DISK_CACHE_MAX_ROWS = int(os.getenv("RAG_DISK_CACHE_MAX_ROWS", 100_000))
+
+_PUNCT = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Case/whitespace/punctuation-insensitive cache key ("Return policy?" == "return  policy")."""
+    return _SPACES.sub(" ", _PUNCT.sub(" ", text.lower())).strip()
+
+
+class LRUCache:
+    """Least-recently-used cache with per-entry TTL and hit/miss counters."""
+
+    def __init__(self, max_size: int = RAG_CACHE_SIZE, ttl: float = RAG_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                self.evictions += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class DiskEmbeddingCache:
+    """Persistent (model, normalized text) -> embedding store backed by SQLite."""
+
+    def __init__(self, path: str = RAG_DISK_CACHE_PATH, ttl: float = RAG_DISK_CACHE_TTL_SECONDS, max_rows: int = RAG_DISK_CACHE_MAX_ROWS):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        """Opens (and creates) the database on first use; call with the lock held."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, created REAL NOT NULL,"
+                " PRIMARY KEY (model, key))"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, model: str, key: str):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT vector, created FROM embeddings WHERE model = ? AND key = ?", (model, key)
+            ).fetchone()
+        if row is None or row[1] + self.ttl < time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return array("f", row[0]).tolist()
+
+    def set(self, model: str, key: str, vector: list[float]):
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO embeddings (model, key, vector, created) VALUES (?, ?, ?, ?)",
+                (model, key, array("f", vector).tobytes(), time.time()),
+            )
+            self._writes += 1
+            if self._writes % 500 == 0:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drops expired rows, then the oldest rows beyond max_rows."""
+        self._conn.execute("DELETE FROM embeddings WHERE created < ?", (time.time() - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN ("
+            " SELECT rowid FROM embeddings ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,),
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            # Not opened yet: nothing has been looked up or stored this run
+            size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] if self._conn else 0
+        return {"size": size, "hits": self.hits, "misses": self.misses}
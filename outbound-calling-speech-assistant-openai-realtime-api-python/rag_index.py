@@ -0,0 +1,436 @@
+import os
+import re
+import math
+import time
+import hashlib
+import threading
+from collections import Counter
+
+import numpy as np
+
+# In-process hybrid retrieval over the `yexis_docs` collection.
+# Chroma stays the store of record; this keeps a copy of its chunks in memory:
+# a BM25 inverted index and a matrix of the stored embeddings. A query whose
+# words clearly pick out one chunk ("return policy", "support hours") is
+# answered from BM25 alone, with no embedding call. Anything else embeds the
+# query (through the rag_cache tiers), scores every chunk with one
+# matrix-vector product and fuses the lexical and dense rankings (reciprocal
+# rank fusion, the lexical side weighted by how much of the query the index
+# knows). Both rankings are thresholded first, so weak matches are left out
+# instead of padding the model's context.
+# Updates are incremental: upserted chunks are appended, replaced or deleted
+# ones are tombstoned, and the arrays are compacted once enough are dead.
+# sync() diffs the collection by content hash and fetches only the embeddings
+# of new or changed chunks, so ingest runs from another process show up too.
+
+# Share of the query's IDF weight the top chunk must contain to skip the embedding call
+RAG_LEXICAL_MIN_COVERAGE = float(os.getenv("RAG_LEXICAL_MIN_COVERAGE", 0.75))
+# ... and how far its BM25 score must lead the runner-up (usually the same product, another topic)
+RAG_LEXICAL_MARGIN = float(os.getenv("RAG_LEXICAL_MARGIN", 1.2))
+# Fusion candidates: cosine similarity for the dense side, IDF coverage of the query words
+# the index knows for the lexical side
+RAG_MIN_SIMILARITY = float(os.getenv("RAG_MIN_SIMILARITY", 0.45))
+RAG_MIN_COVERAGE = float(os.getenv("RAG_MIN_COVERAGE", 0.34))
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", 60))
+# "int8" stores embeddings quantized per row (4x less memory, ~1% score error)
+RAG_INDEX_DTYPE = os.getenv("RAG_INDEX_DTYPE", "float32")
+# How often searches check the collection for chunks ingested by other processes
+RAG_INDEX_REFRESH_SECONDS = float(os.getenv("RAG_INDEX_REFRESH_SECONDS", 30))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Rows ranked on each side before fusion
+FUSION_DEPTH = 50
+# Compact once this share of rows are tombstones
+MAX_DEAD_RATIO = 0.25
+SYNC_PAGE = 1000
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "about", "an", "and", "any", "are", "as", "at", "be", "by", "can", "could", "do", "does", "for",
+    "from", "get", "has", "have", "how", "i", "if", "in", "is", "it", "its", "me", "my", "of", "on", "or",
+    "our", "please", "tell", "that", "the", "there", "this", "to", "us", "we", "what", "when", "where",
+    "which", "who", "will", "with", "would", "you", "your",
+}
+
+
+def _stem(word: str) -> str:
+    # Plurals only: "policies" -> "policy", "hours" -> "hour"
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    return [_stem(w) for w in _TOKEN.findall(text.lower()) if w not in _STOPWORDS]
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class HybridIndex:
+    """BM25 postings plus an embedding matrix over the collection's chunks; thread safe."""
+
+    def __init__(self, dtype: str = RAG_INDEX_DTYPE):
+        self.quantized = dtype == "int8"
+        self._lock = threading.RLock()
+        self.loaded = False
+        self._synced_at = 0.0
+        self._syncing = False
+        self.stats = {"lexical": 0, "hybrid": 0, "empty": 0, "embed_failures": 0, "compactions": 0}
+        self._reset()
+
+    def _reset(self):
+        self.ids = []
+        self.docs = []
+        self.hashes = []
+        # (source, chunk) from ingest metadata, for end_source deletes
+        self.sources = []
+        # Per-row term counts; None once the row is dead
+        self.terms = []
+        self.rows = {}
+        self.postings = {}
+        self.df = Counter()
+        self._compiled = {}
+        self.lengths = np.zeros(0, dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.total_length = 0
+        self.live = 0
+        self.dim = None
+        self.matrix = None
+        self.scales = None
+        self.has_vector = np.zeros(0, dtype=bool)
+        # Bumped by every write; a search that released the lock re-scores if it moved
+        self.version = getattr(self, "version", 0) + 1
+
+    # Writes
+
+    def _grow(self, needed: int):
+        capacity = len(self.alive)
+        if needed <= capacity:
+            return
+        size = max(needed, capacity * 2, 64)
+        self.lengths = np.resize(self.lengths, size)
+        self.alive = np.concatenate([self.alive, np.zeros(size - capacity, dtype=bool)])
+        self.has_vector = np.concatenate([self.has_vector, np.zeros(size - capacity, dtype=bool)])
+        if self.matrix is not None:
+            matrix = np.zeros((size, self.dim), dtype=self.matrix.dtype)
+            matrix[:capacity] = self.matrix
+            self.matrix = matrix
+            if self.scales is not None:
+                self.scales = np.resize(self.scales, size)
+
+    def _set_vector(self, row: int, embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vector.shape[0]
+            capacity = len(self.alive)
+            self.matrix = np.zeros((capacity, self.dim), dtype=np.int8 if self.quantized else np.float32)
+            self.scales = np.zeros(capacity, dtype=np.float32) if self.quantized else None
+        if vector.shape != (self.dim,):
+            print(f"Knowledge index: {self.ids[row]} has a {vector.shape[0]}-dim embedding, expected {self.dim}; lexical only")
+            return
+        norm = float(np.linalg.norm(vector))
+        if norm == 0:
+            return
+        vector = vector / norm
+        if self.quantized:
+            scale = float(np.abs(vector).max()) / 127 or 1.0
+            self.matrix[row] = np.round(vector / scale).astype(np.int8)
+            self.scales[row] = scale
+        else:
+            self.matrix[row] = vector
+        self.has_vector[row] = True
+
+    def _append(self, doc_id: str, text: str, embedding, doc_hash: str, source):
+        row = len(self.ids)
+        self._grow(row + 1)
+        counts = Counter(tokenize(text))
+        self.ids.append(doc_id)
+        self.docs.append(text)
+        self.hashes.append(doc_hash)
+        self.sources.append(source)
+        self.terms.append(counts)
+        self.rows[doc_id] = row
+        length = sum(counts.values())
+        self.lengths[row] = length
+        self.alive[row] = True
+        self.has_vector[row] = False
+        self.total_length += length
+        self.live += 1
+        for term, tf in counts.items():
+            self.postings.setdefault(term, []).append((row, tf))
+            self.df[term] += 1
+            self._compiled.pop(term, None)
+        if embedding is not None:
+            self._set_vector(row, embedding)
+
+    def _kill(self, row: int):
+        if not self.alive[row]:
+            return
+        self.alive[row] = False
+        self.has_vector[row] = False
+        for term in self.terms[row]:
+            self.df[term] -= 1
+        self.total_length -= int(self.lengths[row])
+        self.live -= 1
+        self.terms[row] = None
+        self.docs[row] = None
+        del self.rows[self.ids[row]]
+
+    def upsert(self, ids: list[str], documents: list[str], embeddings=None, metadatas=None):
+        """Adds or replaces chunks; unchanged ones (same content hash, vector present) are skipped."""
+        with self._lock:
+            self.version += 1
+            for i, (doc_id, text) in enumerate(zip(ids, documents)):
+                meta = (metadatas[i] if metadatas else None) or {}
+                doc_hash = meta.get("hash") or content_hash(text)
+                embedding = embeddings[i] if embeddings is not None else None
+                row = self.rows.get(doc_id)
+                if row is not None:
+                    if self.hashes[row] == doc_hash and (embedding is None or self.has_vector[row]):
+                        continue
+                    self._kill(row)
+                source = (meta["source"], meta.get("chunk", 0)) if "source" in meta else None
+                self._append(doc_id, text, embedding, doc_hash, source)
+            self._maybe_compact()
+
+    def delete(self, ids: list[str]):
+        with self._lock:
+            self.version += 1
+            for doc_id in ids:
+                row = self.rows.get(doc_id)
+                if row is not None:
+                    self._kill(row)
+            self._maybe_compact()
+
+    def delete_source_tail(self, source: str, from_chunk: int):
+        """Mirrors ingest's end_source: drops a source's chunks numbered from_chunk and up."""
+        with self._lock:
+            self.version += 1
+            for row in [r for r in self.rows.values() if self.sources[r] and self.sources[r][0] == source
+                        and self.sources[r][1] >= from_chunk]:
+                self._kill(row)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        dead = len(self.ids) - self.live
+        if dead < 64 or dead < len(self.ids) * MAX_DEAD_RATIO:
+            return
+        keep = np.flatnonzero(self.alive[:len(self.ids)])
+        ids, docs, hashes, sources, terms = self.ids, self.docs, self.hashes, self.sources, self.terms
+        lengths, has_vector, matrix, scales, dim = self.lengths, self.has_vector, self.matrix, self.scales, self.dim
+        self._reset()
+        self._grow(len(keep))
+        self.dim = dim
+        if matrix is not None:
+            self.matrix = np.zeros((len(self.alive), dim), dtype=matrix.dtype)
+            self.matrix[:len(keep)] = matrix[keep]
+            if scales is not None:
+                self.scales = np.zeros(len(self.alive), dtype=np.float32)
+                self.scales[:len(keep)] = scales[keep]
+        n = len(keep)
+        self.lengths[:n] = lengths[keep]
+        self.alive[:n] = True
+        self.has_vector[:n] = has_vector[keep]
+        for new, row in enumerate(keep.tolist()):
+            self.ids.append(ids[row])
+            self.docs.append(docs[row])
+            self.hashes.append(hashes[row])
+            self.sources.append(sources[row])
+            self.terms.append(terms[row])
+            self.rows[ids[row]] = new
+            for term, tf in terms[row].items():
+                self.postings.setdefault(term, []).append((new, tf))
+                self.df[term] += 1
+        self.total_length = int(self.lengths[:n].sum())
+        self.live = n
+        self.stats["compactions"] += 1
+
+    def sync(self, collection) -> int:
+        """Brings the index in line with the Chroma collection; returns how many chunks changed."""
+        remote = {}
+        offset = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas"], limit=SYNC_PAGE, offset=offset)
+            for doc_id, text, meta in zip(page["ids"], page["documents"], page["metadatas"] or [None] * len(page["ids"])):
+                meta = meta or {}
+                remote[doc_id] = (text, meta, meta.get("hash") or content_hash(text or ""))
+            if len(page["ids"]) < SYNC_PAGE:
+                break
+            offset += SYNC_PAGE
+        with self._lock:
+            stale = [doc_id for doc_id in self.rows if doc_id not in remote]
+            fresh = [
+                doc_id for doc_id, (_, _, doc_hash) in remote.items()
+                if doc_id not in self.rows or self.hashes[self.rows[doc_id]] != doc_hash
+            ]
+        for start in range(0, len(fresh), SYNC_PAGE):
+            ids = fresh[start:start + SYNC_PAGE]
+            got = collection.get(ids=ids, include=["embeddings"])
+            vectors = dict(zip(got["ids"], got["embeddings"] if got["embeddings"] is not None else [None] * len(got["ids"])))
+            self.upsert(ids, [remote[i][0] or "" for i in ids], [vectors.get(i) for i in ids], [remote[i][1] for i in ids])
+        self.delete(stale)
+        self.loaded = True
+        self._synced_at = time.monotonic()
+        return len(fresh) + len(stale)
+
+    def refresh_if_stale(self, collection_getter, on_change=None):
+        """Kicks off a background sync if the last one is older than RAG_INDEX_REFRESH_SECONDS."""
+        if time.monotonic() - self._synced_at < RAG_INDEX_REFRESH_SECONDS:
+            return
+        with self._lock:
+            if self._syncing:
+                return
+            self._syncing = True
+
+        def refresh():
+            try:
+                if self.sync(collection_getter()) and on_change:
+                    on_change()
+            except Exception as e:
+                print(f"Knowledge index refresh failed: {e}")
+            finally:
+                self._synced_at = time.monotonic()
+                self._syncing = False
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    # Reads
+
+    def _posting(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        compiled = self._compiled.get(term)
+        if compiled is None:
+            posting = self.postings[term]
+            rows = np.fromiter((row for row, _ in posting), dtype=np.int32, count=len(posting))
+            tf = np.fromiter((tf for _, tf in posting), dtype=np.float32, count=len(posting))
+            compiled = self._compiled[term] = (rows, tf)
+        return compiled
+
+    def _bm25(self, query: str) -> tuple[np.ndarray, np.ndarray, float]:
+        """
+        BM25 scores, the share of the query's IDF weight each row contains, and the
+        factor turning that share into one over only the words the index knows.
+        """
+        n = len(self.ids)
+        scores = np.zeros(n, dtype=np.float32)
+        coverage = np.zeros(n, dtype=np.float32)
+        avg_length = self.total_length / self.live
+        possible = known = 0.0
+        for term in set(tokenize(query)):
+            df = self.df.get(term, 0)
+            idf = math.log(1 + (self.live - df + 0.5) / (df + 0.5))
+            possible += idf
+            if df <= 0:
+                # Unknown words count against skipping the embedding, not against fusion
+                continue
+            known += idf
+            rows, tf = self._posting(term)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[rows] / avg_length)
+            scores[rows] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+            coverage[rows] += idf
+        if possible:
+            coverage /= possible
+        # Postings keep tombstoned rows until the next compaction
+        alive = self.alive[:n]
+        scores *= alive
+        coverage *= alive
+        return scores, coverage, possible / known if known else 0.0
+
+    def _similarities(self, embedding) -> np.ndarray:
+        n = len(self.ids)
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        if self.quantized:
+            sims = np.empty(n, dtype=np.float32)
+            # Blocks bound the float32 copy of the int8 rows
+            for start in range(0, n, 8192):
+                block = self.matrix[start:min(n, start + 8192)].astype(np.float32)
+                sims[start:start + len(block)] = (block @ query) * self.scales[start:start + len(block)]
+        else:
+            sims = self.matrix[:n] @ query
+        sims[~self.has_vector[:n]] = -1.0
+        return sims
+
+    @staticmethod
+    def _top(values: np.ndarray, mask: np.ndarray, k: int) -> np.ndarray:
+        candidates = np.flatnonzero(mask)
+        if candidates.size > k:
+            candidates = candidates[np.argpartition(-values[candidates], k - 1)[:k]]
+        return candidates[np.argsort(-values[candidates], kind="stable")]
+
+    def search(self, query: str, n_results: int = 2, embed=None) -> list[tuple[str, dict]]:
+        """
+        Up to n_results (chunk text, scores) pairs. embed(query) -> embedding is only
+        called when BM25 alone isn't confident; without it (or if it fails) results are lexical.
+        """
+        with self._lock:
+            if not self.live:
+                return []
+            version = self.version
+            scores, coverage, known = self._bm25(query)
+            lexical = self._top(scores, (scores > 0) & (coverage * known >= RAG_MIN_COVERAGE), FUSION_DEPTH)
+            if lexical.size:
+                best = lexical[0]
+                # Against every other row, not just the admitted candidates
+                runner_up = float(np.partition(scores, -2)[-2]) if scores.size > 1 else 0.0
+                if coverage[best] >= RAG_LEXICAL_MIN_COVERAGE and scores[best] >= RAG_LEXICAL_MARGIN * runner_up:
+                    self.stats["lexical"] += 1
+                    return [(self.docs[best], {"bm25": round(float(scores[best]), 3), "coverage": round(float(coverage[best]), 3)})]
+
+        embedding = None
+        if embed is not None and self.dim is not None:
+            try:
+                # Outside the lock: a remote call on a cache miss
+                embedding = embed(query)
+            except Exception as e:
+                self.stats["embed_failures"] += 1
+                print(f"Knowledge index: query embedding failed ({e}); lexical results only")
+
+        with self._lock:
+            if not self.live:
+                return []
+            if self.version != version:
+                # Rows may have moved (compaction) while the embedding was fetched
+                scores, coverage, known = self._bm25(query)
+                lexical = self._top(scores, (scores > 0) & (coverage * known >= RAG_MIN_COVERAGE), FUSION_DEPTH)
+            # The lexical ranking counts in proportion to how much of the query it could read
+            weight = 1 / known if known else 0.0
+            fused = {}
+            for rank, row in enumerate(lexical):
+                fused[row] = weight / (RAG_RRF_K + rank + 1)
+            sims = None
+            if embedding is not None:
+                sims = self._similarities(embedding)
+                for rank, row in enumerate(self._top(sims, sims >= RAG_MIN_SIMILARITY, FUSION_DEPTH)):
+                    fused[row] = fused.get(row, 0.0) + 1 / (RAG_RRF_K + rank + 1)
+            if not fused:
+                self.stats["empty"] += 1
+                return []
+            self.stats["hybrid"] += 1
+            ranked = sorted(fused, key=fused.get, reverse=True)[:n_results]
+            return [
+                (self.docs[row], {
+                    "rrf": round(fused[row], 4),
+                    "bm25": round(float(scores[row]), 3),
+                    **({"similarity": round(float(sims[row]), 3)} if sims is not None else {}),
+                })
+                for row in ranked
+            ]
+
+    def summary(self) -> dict:
+        return {
+            **self.stats,
+            "loaded": self.loaded,
+            "chunks": self.live,
+            "rows": len(self.ids),
+            "terms": sum(1 for df in self.df.values() if df > 0),
+            "dtype": "int8" if self.quantized else "float32",
+            "matrix_mb": round(self.matrix.nbytes / 2**20, 2) if self.matrix is not None else 0.0,
+        }
+
+
+knowledge_index = HybridIndex()
@@ -1,62 +1,152 @@
-import chromadb
 import os
-from google import genai
-from google.genai import types
+import threading
 
 from dotenv import load_dotenv
+from rag_cache import LRUCache, DiskEmbeddingCache, normalize_query
+from rag_index import knowledge_index
 
 load_dotenv()
 
-# Initialize ChromaDB (Persistent)
-chroma_client = chromadb.PersistentClient(path="./knowledge_base")
-collection = chroma_client.get_or_create_collection(name="yexis_docs")
-
-# Initialize Gemini Client for Embeddings
+# The Chroma store and the Gemini client are opened on first use (or by the
+# app's startup in the background), so importing this module costs nothing.
+KNOWLEDGE_BASE_PATH = os.getenv("KNOWLEDGE_BASE_PATH", "./knowledge_base")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=GEMINI_API_KEY, http_options={"api_version": "v1alpha"})
+# "hybrid" answers from the in-process index (rag_index.py) once it is loaded;
+# "chroma" always embeds the query and asks the collection
+RAG_INDEX = os.getenv("RAG_INDEX", "hybrid")
+
+_chroma_client = None
+_collection = None
+_client = None
+_collection_lock = threading.Lock()
+_client_lock = threading.Lock()
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+# Query caches: embeddings (memory + disk) and search results (memory only,
+# invalidated whenever the collection changes)
+embedding_cache = LRUCache()
+disk_embedding_cache = DiskEmbeddingCache()
+search_cache = LRUCache()
+_collection_version = 0
+
+DEFAULT_DOCS = {
+    "vrf_warranty": "The Samsung VRF System usually comes with a 1-year comprehensive warranty and 5 years on the compressor. AMC options are available.",
+    "return_policy": "Yexis Electronics allows returns for defective items within 7 days of delivery. Original packaging is required.",
+    "support_hours": "Our support team is available Mon-Sat from 9 AM to 6 PM IST. Emergency support is available for contract customers."
+}
+
+def get_collection():
+    """The `yexis_docs` Chroma collection, opening the persistent store on first use."""
+    global _chroma_client, _collection
+    if _collection is None:
+        with _collection_lock:
+            if _collection is None:
+                import chromadb
+                _chroma_client = chromadb.PersistentClient(path=KNOWLEDGE_BASE_PATH)
+                _collection = _chroma_client.get_or_create_collection(name="yexis_docs")
+    return _collection
+
+def get_client():
+    """Gemini client for embeddings, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google import genai
+                _client = genai.Client(api_key=GEMINI_API_KEY, http_options={"api_version": "v1alpha"})
+    return _client
+
+def open_knowledge_base() -> int:
+    """Opens the store and the embedding client up front (and loads the index); returns the document count."""
+    get_client()
+    if RAG_INDEX == "hybrid":
+        knowledge_index.sync(get_collection())
+    return get_collection().count()
 
 def get_embedding(text: str) -> list[float]:
     """Generates vector embedding for the given text using Gemini."""
-    response = client.models.embed_content(
-        model="models/text-embedding-004",
+    response = get_client().models.embed_content(
+        model=EMBEDDING_MODEL,
         contents=text
     )
     return response.embeddings[0].values
 
+def get_query_embedding(query: str) -> list[float]:
+    """Embedding for a search query, served from the memory or disk cache when possible."""
+    key = normalize_query(query)
+    embedding = embedding_cache.get(key)
+    if embedding is not None:
+        return embedding
+    embedding = disk_embedding_cache.get(EMBEDDING_MODEL, key)
+    if embedding is None:
+        embedding = get_embedding(key)
+        disk_embedding_cache.set(EMBEDDING_MODEL, key, embedding)
+    embedding_cache.set(key, embedding)
+    return embedding
+
+def invalidate_search_cache():
+    """Drops cached search results after the collection changes."""
+    global _collection_version
+    _collection_version += 1
+    search_cache.clear()
+
+def cache_stats() -> dict:
+    return {
+        "embedding_memory": embedding_cache.stats(),
+        "embedding_disk": disk_embedding_cache.stats(),
+        "search": search_cache.stats(),
+        "index": knowledge_index.summary(),
+    }
+
 def add_document(doc_id: str, text: str):
     """Adds a document to the ChromaDB collection."""
     embedding = get_embedding(text)
-    collection.add(
+    get_collection().add(
         documents=[text],
         embeddings=[embedding],
         ids=[doc_id]
     )
+    if knowledge_index.loaded:
+        knowledge_index.upsert([doc_id], [text], [embedding])
+    invalidate_search_cache()
     print(f"Added document: {doc_id}")
 
 def search_knowledge_base(query: str, n_results: int = 2) -> list[str]:
     """Searches the knowledge base for relevant context."""
     print(f"Searching KB for: {query}")
-    query_embedding = get_embedding(query)
-    
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=n_results
-    )
-    
-    if results["documents"]:
-        return results["documents"][0]
-    return []
+    key = (normalize_query(query), n_results, _collection_version)
+    cached = search_cache.get(key)
+    if cached is not None:
+        return list(cached)
 
-# Seed initial knowledge if empty
-if collection.count() == 0:
+    if RAG_INDEX == "hybrid":
+        # Picks up chunks ingested by other processes; drops cached results if any changed
+        knowledge_index.refresh_if_stale(get_collection, invalidate_search_cache)
+    if knowledge_index.loaded:
+        documents = [text for text, _ in knowledge_index.search(query, n_results, get_query_embedding)]
+    else:
+        query_embedding = get_query_embedding(query)
+
+        results = get_collection().query(
+            query_embeddings=[query_embedding],
+            n_results=n_results
+        )
+
+        documents = results["documents"][0] if results["documents"] else []
+    search_cache.set(key, tuple(documents))
+    return documents
+
+def seed_knowledge_base() -> int:
+    """Adds the starter documents to an empty collection; returns how many failed to embed."""
+    if get_collection().count():
+        return 0
     print("Seeding initial knowledge base...")
-    docs = {
-        "vrf_warranty": "The Samsung VRF System usually comes with a 1-year comprehensive warranty and 5 years on the compressor. AMC options are available.",
-        "return_policy": "Yexis Electronics allows returns for defective items within 7 days of delivery. Original packaging is required.",
-        "support_hours": "Our support team is available Mon-Sat from 9 AM to 6 PM IST. Emergency support is available for contract customers."
-    }
-    for doc_id, text in docs.items():
+    failed = 0
+    for doc_id, text in DEFAULT_DOCS.items():
         try:
             add_document(doc_id, text)
         except Exception as e:
+            failed += 1
             print(f"Failed to seed {doc_id}: {e}")
+    return failed
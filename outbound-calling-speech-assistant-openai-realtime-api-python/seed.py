@@ -0,0 +1,34 @@
+"""
+One-shot setup for a fresh install: creates the schema, adds the demo leads and
+product catalog to an empty database, and the starter documents to an empty
+knowledge base. The server never seeds on startup; run this once instead.
+
+Usage:
+    python seed.py [--skip-db] [--skip-kb]
+"""
+import sys
+import argparse
+
+from database import init_db, seed_db
+from rag_service import seed_knowledge_base
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--skip-db", action="store_true", help="leave the CRM database alone")
+    parser.add_argument("--skip-kb", action="store_true", help="leave the knowledge base alone")
+    args = parser.parse_args()
+
+    if not args.skip_db:
+        init_db()
+        seed_db()
+    if not args.skip_kb:
+        failed = seed_knowledge_base()
+        if failed:
+            print(f"{failed} knowledge base documents could not be embedded; re-run once the Gemini API is reachable")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
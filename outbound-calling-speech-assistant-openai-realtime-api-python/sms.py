@@ -0,0 +1,532 @@
+import os
+import time
+import string
+import asyncio
+import contextlib
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import bindparam, func, insert, literal, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from database import async_engine, async_session_maker, Lead, SmsBroadcast, SmsDelivery
+from lead_queries import search_clause
+from campaigns import TokenBucket
+from interaction_log import interaction_log
+from twilio_transport import TwilioError
+
+# Bulk SMS broadcasts and the inbound SMS pipeline.
+# A broadcast snapshots a lead filter into a persistent queue (smsdelivery
+# rows), like a calling campaign. One sender task per worker claims about a
+# second's worth of due rows at a time, renders each lead's text from the
+# template and sends through a token bucket (messages per second) with a cap
+# on sends waiting on Twilio; results are written back every
+# SMS_RESULT_FLUSH_MS as one executemany. Twilio's status callbacks report delivery; transient failures are
+# retried with backoff. Inbound SMS and status callbacks are acknowledged at
+# once and queued; one task processes them in batches: a single indexed
+# Lead.phone lookup per batch, Interaction rows through the write-behind log,
+# and an optional auto-reply.
+
+# Twilio sends 1 message per second from a long code; messaging services and short codes allow more
+SMS_MPS = float(os.getenv("SMS_MPS", 1))
+SMS_BURST = int(os.getenv("SMS_BURST", 1))
+# Sends waiting on Twilio, per worker
+SMS_MAX_IN_FLIGHT = int(os.getenv("SMS_MAX_IN_FLIGHT", 16))
+# Upper bound on rows claimed per query
+SMS_BATCH_SIZE = int(os.getenv("SMS_BATCH_SIZE", 500))
+SMS_POLL_SECONDS = float(os.getenv("SMS_POLL_SECONDS", 1))
+SMS_RESULT_FLUSH_MS = float(os.getenv("SMS_RESULT_FLUSH_MS", 250))
+# Longest wait between attempts to write results while the database is failing
+SMS_RESULT_RETRY_MAX_SECONDS = float(os.getenv("SMS_RESULT_RETRY_MAX_SECONDS", 30))
+# A claimed row still without a message SID after this long goes back in the queue
+SMS_SENDING_TIMEOUT_SECONDS = float(os.getenv("SMS_SENDING_TIMEOUT_SECONDS", 120))
+SMS_RETRY_BASE_SECONDS = float(os.getenv("SMS_RETRY_BASE_SECONDS", 60))
+SMS_RETRY_MAX_SECONDS = float(os.getenv("SMS_RETRY_MAX_SECONDS", 3600))
+SMS_INBOX_BATCH_SIZE = int(os.getenv("SMS_INBOX_BATCH_SIZE", 200))
+SMS_INBOX_FLUSH_MS = float(os.getenv("SMS_INBOX_FLUSH_MS", 200))
+SMS_INBOX_QUEUE_SIZE = int(os.getenv("SMS_INBOX_QUEUE_SIZE", 10000))
+# A status callback can beat the sender's write of the message SID; keep it this long
+SMS_STATUS_GRACE_SECONDS = float(os.getenv("SMS_STATUS_GRACE_SECONDS", 30))
+# Reply template for inbound SMS (same placeholders as broadcasts); empty = no auto-reply
+SMS_AUTO_REPLY = os.getenv("SMS_AUTO_REPLY", "")
+
+TEMPLATE_FIELDS = {"name", "first_name", "phone", "email", "status"}
+# Twilio answers these itself (opt-out / opt-in / help); never auto-reply to them
+OPT_OUT_KEYWORDS = {"STOP", "STOPALL", "UNSUBSCRIBE", "CANCEL", "END", "QUIT", "START", "YES", "UNSTOP", "HELP", "INFO"}
+# Carrier error codes on undelivered / failed messages worth another attempt
+# (30001 queue overflow, 30008 unknown error)
+RETRY_ERROR_CODES = {"30001", "30008"}
+
+
+def parse_template(template: str) -> str:
+    """Validates a message template; ValueError on unknown or malformed placeholders."""
+    if not template or not template.strip():
+        raise ValueError("Template is empty")
+    try:
+        fields = {field for _, field, _, _ in string.Formatter().parse(template) if field is not None}
+    except ValueError as e:
+        raise ValueError(f"Malformed template: {e}")
+    unknown = fields - TEMPLATE_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown placeholders {sorted(unknown)}; use {sorted(TEMPLATE_FIELDS)}")
+    return template
+
+
+def render(template: str, name: str = None, phone: str = None, email: str = None, status: str = None, default_name: str = "") -> str:
+    name = (name or "").strip() or default_name
+    fields = {
+        "name": name,
+        "first_name": name.split(" ", 1)[0],
+        "phone": phone or "",
+        "email": email or "",
+        "status": status or "",
+    }
+    return template.format_map(fields)
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff after the given number of attempts."""
+    return min(SMS_RETRY_MAX_SECONDS, SMS_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+
+
+async def apply_updates(rows: list[dict]):
+    """Writes per-delivery results in one executemany: dicts of id, status, outcome and optional sid/body/next attempt."""
+    if not rows:
+        return
+    now = datetime.utcnow()
+    table = SmsDelivery.__table__
+    params = [{
+        "b_id": r["id"], "b_status": r["status"], "b_outcome": r.get("outcome"),
+        "b_sid": r.get("message_sid"), "b_body": r.get("body"), "b_next": r.get("next_attempt_at", now), "b_now": now,
+    } for r in rows]
+    # sid / body are kept when a result doesn't carry them
+    stmt = update(table).where(table.c.id == bindparam("b_id")).values(
+        status=bindparam("b_status"),
+        outcome=bindparam("b_outcome"),
+        message_sid=func.coalesce(bindparam("b_sid"), table.c.message_sid),
+        body=func.coalesce(bindparam("b_body"), table.c.body),
+        next_attempt_at=bindparam("b_next"),
+        updated_at=bindparam("b_now"),
+    )
+    async with async_engine.begin() as conn:
+        await conn.execute(stmt, params)
+
+
+async def create_broadcast(session: AsyncSession, name: str, template: str, lead_status: str = None,
+                           query: str = None, max_attempts: int = 3) -> dict:
+    """Creates a draft broadcast and queues every lead matching the filter, in one INSERT ... SELECT."""
+    broadcast = SmsBroadcast(name=name, template=parse_template(template), lead_status=lead_status,
+                             query=query, max_attempts=max(1, max_attempts))
+    session.add(broadcast)
+    await session.flush()
+
+    now = datetime.utcnow()
+    leads = select(
+        literal(broadcast.id), Lead.id, Lead.phone, literal("queued"), literal(0), literal(now), literal(now)
+    )
+    if lead_status:
+        leads = leads.where(Lead.status == lead_status)
+    if query and query.strip():
+        clause = search_clause(query.strip())
+        if clause is not None:
+            leads = leads.where(clause)
+    table = SmsDelivery.__table__
+    await session.exec(insert(table).from_select(
+        ["broadcast_id", "lead_id", "phone", "status", "attempts", "next_attempt_at", "updated_at"],
+        leads.order_by(Lead.id),
+    ))
+    await session.commit()
+    await session.refresh(broadcast)
+    return await broadcast_stats(session, broadcast)
+
+
+async def broadcast_stats(session: AsyncSession, broadcast: SmsBroadcast) -> dict:
+    """Queue progress: messages per status, attempts made and last outcomes."""
+    by_status = dict((await session.exec(
+        select(SmsDelivery.status, func.count()).where(SmsDelivery.broadcast_id == broadcast.id).group_by(SmsDelivery.status)
+    )).all())
+    outcomes = dict((await session.exec(
+        select(SmsDelivery.outcome, func.count())
+        .where(SmsDelivery.broadcast_id == broadcast.id, SmsDelivery.outcome.is_not(None))
+        .group_by(SmsDelivery.outcome)
+    )).all())
+    attempts = (await session.exec(
+        select(func.coalesce(func.sum(SmsDelivery.attempts), 0)).where(SmsDelivery.broadcast_id == broadcast.id)
+    )).one()
+    total = sum(by_status.values())
+    done = sum(by_status.get(s, 0) for s in ("sent", "delivered", "failed"))
+    return {
+        "id": broadcast.id,
+        "name": broadcast.name,
+        "status": broadcast.status,
+        "template": broadcast.template,
+        "total": total,
+        "messages": {s: by_status.get(s, 0) for s in ("queued", "sending", "sent", "delivered", "failed")},
+        "outcomes": outcomes,
+        "attempts": attempts,
+        "progress": round(done / total, 3) if total else 1.0,
+    }
+
+
+class BroadcastSender:
+    """Per-worker scheduler that drains the queues of running broadcasts."""
+
+    def __init__(self, mps: float = SMS_MPS, burst: int = SMS_BURST, max_in_flight: int = SMS_MAX_IN_FLIGHT):
+        self.bucket = TokenBucket(mps, burst)
+        self.max_in_flight = max_in_flight
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._sends = set()
+        # Send results waiting for the next write
+        self._results = []
+        # Claimed rows whose result isn't written yet; the orphan sweep leaves them alone
+        self._unwritten = set()
+        self.send = None
+        self._task = None
+        self._flush_task = None
+        self._wakeup = asyncio.Event()
+        self.stats = {"sent": 0, "send_errors": 0, "retried": 0, "failed": 0, "delivered": 0, "undelivered": 0}
+
+    def start(self, send, admit=None):
+        """
+        send(to, body) -> message_sid coroutine, e.g. Twilio messages.create with a status callback;
+        admit() -> False pauses sending (worker overloaded).
+        """
+        self.send = send
+        self.admit = admit or (lambda: True)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        for task in (self._task, self._flush_task):
+            if task:
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+        if self._sends:
+            await asyncio.gather(*self._sends, return_exceptions=True)
+        await self._flush()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def claim_size(self) -> int:
+        # About one second of sending: claimed rows don't wait long in "sending"
+        return max(1, min(SMS_BATCH_SIZE, int(self.bucket.rate)))
+
+    async def _requeue_orphans(self):
+        """
+        Rows left in "sending" without a message by a crashed worker go back in
+        the queue, or fail once they have used up max_attempts.
+        """
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=SMS_SENDING_TIMEOUT_SECONDS)
+        max_attempts = (
+            select(SmsBroadcast.max_attempts).where(SmsBroadcast.id == SmsDelivery.broadcast_id).scalar_subquery()
+        )
+        orphaned = [SmsDelivery.status == "sending", SmsDelivery.message_sid.is_(None), SmsDelivery.updated_at < cutoff]
+        if self._unwritten:
+            orphaned.append(SmsDelivery.id.not_in(list(self._unwritten)))
+        async with async_session_maker() as session:
+            await session.exec(
+                update(SmsDelivery).where(*orphaned, SmsDelivery.attempts < max_attempts)
+                .values(status="queued", updated_at=now)
+            )
+            await session.exec(
+                update(SmsDelivery).where(*orphaned, SmsDelivery.attempts >= max_attempts)
+                .values(status="failed", outcome="error: no result recorded", updated_at=now)
+            )
+            await session.commit()
+
+    async def _claim_due(self, limit: int) -> list[tuple]:
+        """Marks up to `limit` due messages of running broadcasts as sending; returns them with what rendering needs."""
+        now = datetime.utcnow()
+        async with async_session_maker() as session:
+            rows = (await session.exec(
+                select(SmsDelivery.id, SmsDelivery.lead_id, SmsDelivery.phone, SmsBroadcast.template, SmsBroadcast.max_attempts,
+                       Lead.name, Lead.email, Lead.status)
+                .join(SmsBroadcast, SmsBroadcast.id == SmsDelivery.broadcast_id)
+                .outerjoin(Lead, Lead.id == SmsDelivery.lead_id)
+                .where(SmsBroadcast.status == "running", SmsDelivery.status == "queued", SmsDelivery.next_attempt_at <= now,
+                       SmsDelivery.attempts < SmsBroadcast.max_attempts)
+                .order_by(SmsDelivery.next_attempt_at, SmsDelivery.id)
+                .limit(limit)
+            )).all()
+            claimed = {}
+            if rows:
+                # Only rows still queued: another worker may have claimed some meanwhile
+                claimed = dict((await session.exec(
+                    update(SmsDelivery)
+                    .where(SmsDelivery.id.in_([r[0] for r in rows]), SmsDelivery.status == "queued")
+                    .values(status="sending", attempts=SmsDelivery.attempts + 1, message_sid=None, updated_at=now)
+                    .returning(SmsDelivery.id, SmsDelivery.attempts)
+                )).all())
+            await session.commit()
+        return [(*r, claimed[r[0]]) for r in rows if r[0] in claimed]
+
+    async def _complete_finished_broadcasts(self):
+        async with async_session_maker() as session:
+            pending = select(SmsDelivery.id).where(
+                SmsDelivery.broadcast_id == SmsBroadcast.id, SmsDelivery.status.in_(["queued", "sending"])
+            ).exists()
+            await session.exec(
+                update(SmsBroadcast).where(SmsBroadcast.status == "running", ~pending).values(status="completed")
+            )
+            await session.commit()
+
+    async def run(self):
+        next_sweep = 0.0
+        while True:
+            try:
+                if time.monotonic() >= next_sweep:
+                    await self._requeue_orphans()
+                    next_sweep = time.monotonic() + SMS_SENDING_TIMEOUT_SECONDS / 2
+                admitted = self.admit()
+                due = await self._claim_due(self.claim_size()) if admitted else []
+                if not due:
+                    if admitted:
+                        await self._complete_finished_broadcasts()
+                    self._wakeup.clear()
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(self._wakeup.wait(), SMS_POLL_SECONDS)
+                    continue
+                for row in due:
+                    await self.bucket.acquire()
+                    await self._slots.acquire()
+                    self._unwritten.add(row[0])
+                    # Twilio's response time must not eat into the send rate
+                    task = asyncio.create_task(self._send(*row))
+                    self._sends.add(task)
+                    task.add_done_callback(self._sends.discard)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"SMS sender loop error: {e}")
+                await asyncio.sleep(SMS_POLL_SECONDS)
+
+    async def _send(self, delivery_id: int, lead_id: int, phone: str, template: str, max_attempts: int,
+                    name: str, email: str, lead_status: str, attempts: int):
+        """Sends one message and queues its result for the next write."""
+        try:
+            try:
+                body = render(template, name, phone, email, lead_status)
+                sid = await self.send(phone, body)
+            except (TwilioError, httpx.HTTPError, ValueError) as e:
+                self.stats["send_errors"] += 1
+                # 4xx (invalid number, opted out, blocked, ...) won't succeed on retry; network errors and 5xx might
+                transient = isinstance(e, httpx.HTTPError) or (isinstance(e, TwilioError) and e.status >= 500)
+                self._results.append(self._failure(delivery_id, attempts, max_attempts, transient, f"error: {e}"[:200]))
+                return
+            except Exception as e:
+                self.stats["send_errors"] += 1
+                print(f"SMS {delivery_id} to {phone} failed: {e}")
+                # It may have gone out: final, rather than risk texting the lead twice
+                self._results.append(self._failure(delivery_id, attempts, max_attempts, False, f"error: {e}"[:200]))
+                return
+            self.stats["sent"] += 1
+            self._results.append({"id": delivery_id, "status": "sent", "message_sid": sid, "body": body, "outcome": "sent"})
+            await interaction_log.log(lead_id, "sms", body)
+        finally:
+            self._slots.release()
+
+    def _failure(self, delivery_id: int, attempts: int, max_attempts: int, transient: bool, outcome: str) -> dict:
+        if transient and attempts < max_attempts:
+            self.stats["retried"] += 1
+            return {"id": delivery_id, "status": "queued", "outcome": outcome,
+                    "next_attempt_at": datetime.utcnow() + timedelta(seconds=retry_delay(attempts))}
+        self.stats["failed"] += 1
+        return {"id": delivery_id, "status": "failed", "outcome": outcome}
+
+    async def _flush(self) -> bool:
+        """Writes pending results; on failure keeps them for the next attempt and returns False."""
+        results, self._results = self._results, []
+        try:
+            await apply_updates(results)
+        except Exception as e:
+            # Most carry the SID of a message already sent: dropping them would
+            # leave the row without one, and the orphan sweep would send it again
+            self._results[:0] = results
+            print(f"SMS sender: failed to record {len(results)} results, will retry: {e}")
+            return False
+        self._unwritten.difference_update(r["id"] for r in results)
+        if any(r["status"] == "queued" for r in results):
+            self.wake()
+        return True
+
+    async def _flush_loop(self):
+        delay = SMS_RESULT_FLUSH_MS / 1000
+        while True:
+            await asyncio.sleep(delay)
+            if self._results and not await self._flush():
+                delay = min(SMS_RESULT_RETRY_MAX_SECONDS, delay * 2)
+            else:
+                delay = SMS_RESULT_FLUSH_MS / 1000
+
+    async def on_statuses(self, statuses: dict[str, tuple[str, str]]) -> set[str]:
+        """
+        Applies Twilio status callbacks, sid -> (MessageStatus, ErrorCode), in one pass;
+        returns the SIDs with no delivery row (not a broadcast message, or not recorded yet).
+        """
+        async with async_session_maker() as session:
+            rows = (await session.exec(
+                select(SmsDelivery.id, SmsDelivery.message_sid, SmsDelivery.status, SmsDelivery.attempts, SmsBroadcast.max_attempts)
+                .join(SmsBroadcast, SmsBroadcast.id == SmsDelivery.broadcast_id)
+                .where(SmsDelivery.message_sid.in_(list(statuses)))
+            )).all()
+        updates = []
+        for delivery_id, sid, current, attempts, max_attempts in rows:
+            # Already final (or requeued): a repeated or late callback
+            if current not in ("sending", "sent"):
+                continue
+            status, error_code = statuses[sid]
+            if status == "delivered":
+                self.stats["delivered"] += 1
+                updates.append({"id": delivery_id, "status": "delivered", "outcome": "delivered"})
+            elif status in ("undelivered", "failed"):
+                self.stats["undelivered"] += 1
+                outcome = f"{status} ({error_code})" if error_code else status
+                updates.append(self._failure(delivery_id, attempts, max_attempts, str(error_code) in RETRY_ERROR_CODES, outcome))
+        await apply_updates(updates)
+        if any(u["status"] == "queued" for u in updates):
+            self.wake()
+        return set(statuses) - {row[1] for row in rows}
+
+    def summary(self) -> dict:
+        return {
+            **self.stats,
+            "in_flight": len(self._sends),
+            "unwritten": len(self._results),
+            "mps": self.bucket.rate,
+        }
+
+
+class SmsInbox:
+    """Queues inbound SMS and status callbacks from the webhooks and processes them in batches."""
+
+    def __init__(self, sender: BroadcastSender, batch_size: int = SMS_INBOX_BATCH_SIZE,
+                 flush_ms: float = SMS_INBOX_FLUSH_MS, max_queue: int = SMS_INBOX_QUEUE_SIZE,
+                 auto_reply: str = SMS_AUTO_REPLY):
+        self.sender = sender
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.auto_reply = parse_template(auto_reply) if auto_reply else None
+        self.reply = None
+        # sid -> ((status, error_code), deadline) for callbacks that arrived before their SID was recorded
+        self._early = {}
+        self._replies = set()
+        self._task = None
+        self.stats = {"received": 0, "matched": 0, "unmatched": 0, "replies": 0, "statuses": 0, "batches": 0,
+                      "backpressure_waits": 0}
+
+    def start(self, reply=None):
+        """reply(to, body) coroutine sends the auto-reply, e.g. through the Twilio transport."""
+        self.reply = reply
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Processes everything still queued, then stops."""
+        if self._task is None:
+            return
+        await self.queue.join()
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+        if self._replies:
+            await asyncio.gather(*self._replies, return_exceptions=True)
+
+    async def _put(self, item: tuple):
+        if self.queue.full():
+            self.stats["backpressure_waits"] += 1
+        await self.queue.put(item)
+
+    async def message(self, sender: str, body: str, message_sid: str = None):
+        """/incoming-sms: queues an inbound message."""
+        await self._put(("message", sender, body or "", message_sid))
+
+    async def status(self, message_sid: str, status: str, error_code: str = None):
+        """/sms-status: queues a delivery status callback."""
+        await self._put(("status", message_sid, status, error_code))
+
+    async def run(self):
+        while True:
+            try:
+                # Early status callbacks are retried even when nothing new arrives
+                batch = [await asyncio.wait_for(self.queue.get(), SMS_POLL_SECONDS if self._early else None)]
+            except asyncio.TimeoutError:
+                batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._process(batch)
+            except Exception as e:
+                print(f"SMS inbox: failed to process {len(batch)} events: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _process(self, batch: list[tuple]):
+        self.stats["batches"] += 1
+        messages = [item[1:] for item in batch if item[0] == "message"]
+        now = time.monotonic()
+        statuses = {sid: result for sid, (result, deadline) in self._early.items() if deadline >= now}
+        self._early.clear()
+        for _, sid, status, error_code in (item for item in batch if item[0] == "status"):
+            self.stats["statuses"] += 1
+            statuses[sid] = (status, error_code)
+        if messages:
+            await self._messages(messages)
+        if statuses:
+            for sid in await self.sender.on_statuses(statuses):
+                self._early[sid] = (statuses[sid], now + SMS_STATUS_GRACE_SECONDS)
+
+    async def _messages(self, messages: list[tuple]):
+        self.stats["received"] += len(messages)
+        async with async_session_maker() as session:
+            leads = {
+                phone: (lead_id, name, email, status)
+                for lead_id, phone, name, email, status in (await session.exec(
+                    select(Lead.id, Lead.phone, Lead.name, Lead.email, Lead.status)
+                    .where(Lead.phone.in_(list({sender for sender, _, _ in messages})))
+                )).all()
+            }
+        for sender, body, message_sid in messages:
+            lead = leads.get(sender)
+            if lead is None:
+                self.stats["unmatched"] += 1
+                print(f"SMS from unknown number {sender}: {body[:80]}")
+            else:
+                self.stats["matched"] += 1
+                await interaction_log.log(lead[0], "sms_inbound", body)
+            if self.auto_reply and self.reply and body.strip().upper() not in OPT_OUT_KEYWORDS:
+                lead_id, name, email, status = lead or (None, None, None, None)
+                text = render(self.auto_reply, name, sender, email, status, default_name="there")
+                task = asyncio.create_task(self._send_reply(lead_id, sender, text))
+                self._replies.add(task)
+                task.add_done_callback(self._replies.discard)
+
+    async def _send_reply(self, lead_id: int, to: str, body: str):
+        try:
+            await self.reply(to, body)
+        except Exception as e:
+            print(f"SMS auto-reply to {to} failed: {e}")
+            return
+        self.stats["replies"] += 1
+        await interaction_log.log(lead_id, "sms", body)
+
+    def summary(self) -> dict:
+        return {**self.stats, "pending": self.queue.qsize(), "early_statuses": len(self._early)}
+
+
+sms_sender = BroadcastSender()
+sms_inbox = SmsInbox(sms_sender)
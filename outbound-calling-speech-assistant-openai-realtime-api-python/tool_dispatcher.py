@@ -0,0 +1,118 @@
+import os
+import time
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import TOOL_SECONDS
+
+# Async executor for Gemini function calls.
+# Tools are plain Python functions or coroutines: KB lookups do network +
+# Chroma I/O, CRM updates commit to the DB. Running blocking ones inline on the
+# event loop stalls audio for every call on the worker, so they go to a bounded
+# thread pool; coroutine tools are awaited directly. All calls of one tool_call
+# run concurrently.
+
+TOOL_WORKERS = int(os.getenv("TOOL_WORKERS", 8))
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", 8))
+
+_executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool")
+
+
+class ToolSpec:
+    def __init__(self, fn, blocking: bool, timeout: float, fallback: str):
+        self.fn = fn
+        self.blocking = blocking
+        self.timeout = timeout
+        self.fallback = fallback
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+
+class ToolRegistry:
+    """Name -> tool mapping with per-tool timeout, fallback and latency counters."""
+
+    def __init__(self):
+        self.tools: dict[str, ToolSpec] = {}
+
+    def register(self, fn=None, *, blocking: bool = True, timeout: float = TOOL_TIMEOUT_SECONDS, fallback: str = None):
+        """
+        Registers a tool; usable as `@registry.register` or `@registry.register(blocking=False)`.
+        `async def` tools run on the event loop (with the timeout) regardless of `blocking`.
+        """
+        def wrap(f):
+            self.tools[f.__name__] = ToolSpec(
+                f, blocking and not asyncio.iscoroutinefunction(f), timeout,
+                fallback or f"The {f.__name__} tool is taking too long. Apologize and offer to follow up.",
+            )
+            return f
+        return wrap(fn) if fn is not None else wrap
+
+    @property
+    def declarations(self) -> list:
+        """Functions to hand to types.Tool(function_declarations=...)."""
+        return [spec.fn for spec in self.tools.values()]
+
+    async def execute(self, name: str, args: dict) -> str:
+        """Runs one tool with its timeout; never raises."""
+        spec = self.tools.get(name)
+        if spec is None:
+            return json.dumps({"error": f"Unknown tool: {name}"})
+
+        start = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(spec.fn):
+                result = await asyncio.wait_for(spec.fn(**args), spec.timeout)
+            elif spec.blocking:
+                loop = asyncio.get_running_loop()
+                future = loop.run_in_executor(_executor, lambda: spec.fn(**args))
+                result = await asyncio.wait_for(future, spec.timeout)
+            else:
+                result = spec.fn(**args)
+        except asyncio.TimeoutError:
+            spec.timeouts += 1
+            print(f"Tool {name} timed out after {spec.timeout}s")
+            result = spec.fallback
+        except Exception as e:
+            spec.errors += 1
+            print(f"Tool {name} failed: {e}")
+            result = json.dumps({"error": str(e)})
+        finally:
+            elapsed = time.perf_counter() - start
+            TOOL_SECONDS.observe(elapsed, name)
+            elapsed_ms = elapsed * 1000
+            spec.calls += 1
+            spec.total_ms += elapsed_ms
+            spec.max_ms = max(spec.max_ms, elapsed_ms)
+        print(f"Tool {name} finished in {elapsed_ms:.1f}ms")
+        return result
+
+    async def respond(self, session, tool_call) -> list[tuple[str, dict, str]]:
+        """Runs every function call of a tool_call concurrently and replies in one message; returns (name, args, result)."""
+        calls = tool_call.function_calls or []
+        results = await asyncio.gather(*(self.execute(fc.name, fc.args or {}) for fc in calls))
+        # Slow to import, so not at module load; the app's startup has imported it already
+        from google.genai import types
+        tool_response = types.LiveClientToolResponse(
+            function_responses=[
+                types.FunctionResponse(name=fc.name, id=fc.id, response={"result": result})
+                for fc, result in zip(calls, results)
+            ]
+        )
+        await session.send(input=tool_response)
+        return [(fc.name, fc.args or {}, result) for fc, result in zip(calls, results)]
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "calls": spec.calls,
+                "errors": spec.errors,
+                "timeouts": spec.timeouts,
+                "avg_ms": round(spec.total_ms / spec.calls, 2) if spec.calls else 0.0,
+                "max_ms": round(spec.max_ms, 2),
+            }
+            for name, spec in self.tools.items()
+        }
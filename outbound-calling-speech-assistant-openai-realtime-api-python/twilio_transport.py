@@ -0,0 +1,150 @@
+import os
+import time
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+# Async Twilio REST transport.
+# The twilio SDK's Client does a blocking HTTPS round trip per request; called
+# from an `async def` endpoint that stalls every live media stream on the
+# worker. This talks to the same REST API over one pooled keep-alive httpx
+# client, with a cap on requests in flight and per-request timeouts.
+
+TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+PHONE_NUMBER_FROM = os.getenv("PHONE_NUMBER_FROM")
+# Point at a local stand-in (e.g. benchmarks/fake_twilio.py) for testing
+TWILIO_API_BASE = os.getenv("TWILIO_API_BASE", "https://api.twilio.com")
+TWILIO_MAX_IN_FLIGHT = int(os.getenv("TWILIO_MAX_IN_FLIGHT", 16))
+TWILIO_POOL_SIZE = int(os.getenv("TWILIO_POOL_SIZE", 16))
+TWILIO_TIMEOUT_SECONDS = float(os.getenv("TWILIO_TIMEOUT_SECONDS", 10))
+# Twilio answers 429 when the account's concurrency / rate limit is hit;
+# nothing was created, so those are safe to retry
+TWILIO_MAX_RETRIES = int(os.getenv("TWILIO_MAX_RETRIES", 3))
+# Longest Retry-After we honour before trying again anyway
+TWILIO_MAX_RETRY_AFTER_SECONDS = float(os.getenv("TWILIO_MAX_RETRY_AFTER_SECONDS", 30))
+
+
+def retry_after(header: str, attempt: int) -> float:
+    """Seconds to wait before retrying a 429: Retry-After as seconds or an HTTP-date, else exponential."""
+    fallback = 0.5 * 2 ** attempt
+    if not header:
+        return fallback
+    try:
+        delay = float(header)
+    except ValueError:
+        try:
+            when = parsedate_to_datetime(header)
+        except (TypeError, ValueError):
+            return fallback
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        delay = (when - datetime.now(timezone.utc)).total_seconds()
+    return min(max(delay, 0.0), TWILIO_MAX_RETRY_AFTER_SECONDS)
+
+
+class TwilioError(Exception):
+    """Non-2xx answer from the Twilio REST API."""
+
+    def __init__(self, status: int, message: str, code: int = None):
+        super().__init__(f"HTTP {status}: {message}" + (f" (code {code})" if code else ""))
+        self.status = status
+        self.code = code
+
+
+class TwilioTransport:
+    """Pooled async client for the Calls and Messages resources."""
+
+    def __init__(self, account_sid: str = TWILIO_ACCOUNT_SID, auth_token: str = TWILIO_AUTH_TOKEN,
+                 base_url: str = TWILIO_API_BASE, max_in_flight: int = TWILIO_MAX_IN_FLIGHT,
+                 pool_size: int = TWILIO_POOL_SIZE, timeout: float = TWILIO_TIMEOUT_SECONDS):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._http = None
+        self._open_lock = asyncio.Lock()
+        self.stats = {"requests": 0, "errors": 0, "retries": 0, "in_flight": 0, "peak_in_flight": 0, "total_ms": 0.0}
+
+    def _build(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=f"{self.base_url}/2010-04-01/Accounts/{self.account_sid}",
+            auth=(self.account_sid or "", self.auth_token or ""),
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+        )
+
+    async def open(self) -> httpx.AsyncClient:
+        # Loading the CA bundle for the SSL context takes ~100ms: keep it off the loop
+        if self._http is None:
+            async with self._open_lock:
+                if self._http is None:
+                    self._http = await asyncio.to_thread(self._build)
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _post(self, path: str, data: dict) -> dict:
+        data = {k: v for k, v in data.items() if v is not None}
+        http = await self.open()
+        for attempt in range(TWILIO_MAX_RETRIES + 1):
+            async with self._semaphore:
+                self.stats["in_flight"] += 1
+                self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+                self.stats["requests"] += 1
+                start = time.perf_counter()
+                try:
+                    response = await http.post(path, data=data)
+                except httpx.HTTPError:
+                    self.stats["errors"] += 1
+                    raise
+                finally:
+                    self.stats["in_flight"] -= 1
+                    self.stats["total_ms"] += (time.perf_counter() - start) * 1000
+            if response.status_code != 429 or attempt == TWILIO_MAX_RETRIES:
+                break
+            self.stats["retries"] += 1
+            # Backing off doesn't hold an in-flight slot other requests could use
+            await asyncio.sleep(retry_after(response.headers.get("Retry-After"), attempt))
+        if response.is_error:
+            self.stats["errors"] += 1
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            raise TwilioError(response.status_code, body.get("message") or response.reason_phrase, body.get("code"))
+        return response.json()
+
+    async def create_call(self, to: str, url: str, from_: str = PHONE_NUMBER_FROM, status_callback: str = None) -> dict:
+        """POST /Calls.json; returns the call resource (call["sid"])."""
+        return await self._post("/Calls.json", {"To": to, "From": from_, "Url": url, "StatusCallback": status_callback})
+
+    async def send_sms(self, to: str, body: str, from_: str = PHONE_NUMBER_FROM, status_callback: str = None) -> dict:
+        """POST /Messages.json; returns the message resource (message["sid"])."""
+        return await self._post("/Messages.json", {"To": to, "From": from_, "Body": body, "StatusCallback": status_callback})
+
+    async def send_sms_batch(self, messages: list[tuple[str, str]]) -> list[dict]:
+        """Fires many SMS concurrently (bounded by max_in_flight); one {"to", "sid"|"error"} per message."""
+        async def send(to: str, body: str) -> dict:
+            try:
+                return {"to": to, "sid": (await self.send_sms(to, body))["sid"]}
+            except (TwilioError, httpx.HTTPError) as e:
+                return {"to": to, "error": str(e) or type(e).__name__}
+        return await asyncio.gather(*(send(to, body) for to, body in messages))
+
+    def summary(self) -> dict:
+        requests = self.stats["requests"]
+        return {
+            **{k: v for k, v in self.stats.items() if k != "total_ms"},
+            "avg_ms": round(self.stats["total_ms"] / requests, 1) if requests else 0.0,
+        }
+
+
+twilio_rest = TwilioTransport()
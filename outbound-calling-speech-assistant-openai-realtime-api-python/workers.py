@@ -0,0 +1,60 @@
+import os
+import sys
+import signal
+import socket
+import subprocess
+
+# Multi-worker launcher.
+# A live call is bound to the process holding its media stream, so instead of
+# uvicorn's shared-socket workers each worker gets its own port (PORT, PORT+1,
+# ...) and its own public stream URL, and they share one call registry.
+# Put a reverse proxy in front that sends /w/<index>/ to PORT+<index> and
+# everything else to any worker; /incoming-call then pins every stream to a
+# worker with free capacity. WORKERS=1 (default) is the plain single process.
+
+WORKERS = int(os.getenv("WORKERS", 1))
+# {domain}, {index} and {port} are filled in per worker
+WORKER_STREAM_URL_TEMPLATE = os.getenv("WORKER_STREAM_URL_TEMPLATE", "wss://{domain}/w/{index}")
+
+
+def worker_env(index: int, base_port: int, domain: str) -> dict:
+    env = dict(os.environ)
+    port = base_port + index
+    env["WORKER_INDEX"] = str(index)
+    env["PORT"] = str(port)
+    env["WORKER_ID"] = f"{os.getenv('WORKER_ID') or socket.gethostname()}-{index}"
+    env["WORKER_STREAM_URL"] = WORKER_STREAM_URL_TEMPLATE.format(domain=domain, index=index, port=port)
+    # The in-memory registry can't be shared between processes
+    if env.get("CALL_REGISTRY_URL", "memory://").startswith("memory"):
+        env["CALL_REGISTRY_URL"] = "sqlite:///call_registry.db"
+    # Every worker runs a dialer and an SMS sender; together they must stay within the account's rates
+    env["DIALER_CPS"] = str(float(os.getenv("DIALER_CPS", 1)) / WORKERS)
+    env["SMS_MPS"] = str(float(os.getenv("SMS_MPS", 1)) / WORKERS)
+    return env
+
+
+def run_workers(main_path: str) -> int:
+    """Starts WORKERS copies of main.py and waits; returns the first non-zero exit code."""
+    base_port = int(os.getenv("PORT", 6060))
+    domain = (os.getenv("DOMAIN") or "").replace("http://", "").replace("https://", "").replace("/", "")
+    procs = [
+        subprocess.Popen([sys.executable, main_path], env=worker_env(i, base_port, domain))
+        for i in range(WORKERS)
+    ]
+    print(f"Started {WORKERS} workers on ports {base_port}-{base_port + WORKERS - 1}")
+
+    def forward(signum, frame):
+        for proc in procs:
+            if proc.poll() is None:
+                proc.send_signal(signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    code = 0
+    try:
+        for proc in procs:
+            code = code or proc.wait()
+    except KeyboardInterrupt:
+        # Ctrl-C already reached the workers through the process group
+        for proc in procs:
+            code = code or proc.wait()
+    return code